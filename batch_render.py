@@ -0,0 +1,241 @@
+"""
+Пакетный рендер накопившихся постов через тот же конвейер, что и сервис (llm → render → publish).
+
+Запуск из корня проекта:
+    python batch_render.py posts.jsonl
+    python batch_render.py posts_dir/ --render-workers 2 --llm-workers 4 --manifest outputs/batch.jsonl
+
+Вход — JSONL, по посту в строке:
+    {"id": "a1", "text": "...", "media": "img.jpg" | ["a.jpg", "b.mp4"],
+     "short_text": "...", "seo": {...}}          # short_text + seo — готовый пакет LLM, без вызова LLM
+(пути медиа — относительно файла JSONL), или каталог: подкаталог = пост (*.txt — текст,
+фото/видео — медиа, llm.json — готовый пакет), либо файлы верхнего уровня post.txt + post.jpg.
+
+В песочнице (local_only) и с --no-publish ролики остаются в outputs/. Итог по каждому посту
+пишется в манифест (JSONL), в конце — пропускная способность, роликов в минуту.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parent
+os.chdir(ROOT)
+
+from services.config_loader import load_config
+from services.logger_config import setup_logging
+from services.video_factory import create_video_generator
+from services.llm_registry import LLMRegistry
+from services.pipeline import Job
+from main_script import build_pipeline, _is_local_only
+
+logger = logging.getLogger("batch")
+
+IMAGE_EXTS = {'.jpg', '.jpeg', '.png', '.webp', '.bmp'}
+VIDEO_EXTS = {'.mp4', '.webm', '.mov', '.mkv'}
+MEDIA_EXTS = IMAGE_EXTS | VIDEO_EXTS
+
+
+@dataclass
+class BatchPost:
+    source: str
+    text: Optional[str]
+    media: List[str] = field(default_factory=list)
+    llm: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+
+    @property
+    def media_path(self):
+        # Как из Telegram: один файл — строка, альбом — список
+        if not self.media:
+            return None
+        return self.media[0] if len(self.media) == 1 else self.media
+
+
+def _llm_package(record: dict) -> Optional[Dict[str, Any]]:
+    package = record.get('llm') if isinstance(record.get('llm'), dict) else record
+    if package.get('short_text') and isinstance(package.get('seo'), dict):
+        return {'short_text': package['short_text'], 'seo': package['seo']}
+    return None
+
+
+def _resolve_media(items, base: Path) -> tuple[List[str], Optional[str]]:
+    if not items:
+        return [], None
+    if isinstance(items, str):
+        items = [items]
+    paths = []
+    for item in items:
+        path = Path(item)
+        if not path.is_absolute():
+            path = base / path
+        if not path.is_file():
+            return [], f"медиа не найдено: {item}"
+        paths.append(str(path))
+    return paths, None
+
+
+def read_jsonl(path: Path) -> List[BatchPost]:
+    posts = []
+    with open(path, encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            source = f"{path.name}:{line_no}"
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                posts.append(BatchPost(source, None, error=f"неверный JSON: {e}"))
+                continue
+            if record.get('id') is not None:
+                source = f"{source}#{record['id']}"
+            media, error = _resolve_media(
+                record.get('media') or record.get('media_paths') or record.get('media_path'), path.parent
+            )
+            posts.append(BatchPost(source, record.get('text'), media, _llm_package(record), error))
+    return posts
+
+
+def _post_from_files(source: str, texts: List[Path], media: List[Path], llm_file: Optional[Path]) -> BatchPost:
+    text = "\n\n".join(t.read_text(encoding='utf-8').strip() for t in sorted(texts)) or None
+    llm = None
+    if llm_file is not None and llm_file.is_file():
+        try:
+            llm = _llm_package(json.loads(llm_file.read_text(encoding='utf-8')))
+        except (OSError, json.JSONDecodeError) as e:
+            return BatchPost(source, text, error=f"{llm_file.name}: {e}")
+    return BatchPost(source, text, [str(p) for p in sorted(media)], llm)
+
+
+def read_directory(path: Path) -> List[BatchPost]:
+    posts = []
+    loose: Dict[str, Dict[str, List[Path]]] = {}
+    for entry in sorted(path.iterdir()):
+        if entry.is_dir():
+            files = [p for p in entry.iterdir() if p.is_file()]
+            posts.append(_post_from_files(
+                entry.name,
+                [p for p in files if p.suffix.lower() == '.txt'],
+                [p for p in files if p.suffix.lower() in MEDIA_EXTS],
+                entry / 'llm.json',
+            ))
+        elif entry.suffix.lower() == '.txt':
+            loose.setdefault(entry.stem, {'text': [], 'media': []})['text'].append(entry)
+        elif entry.suffix.lower() in MEDIA_EXTS:
+            loose.setdefault(entry.stem, {'text': [], 'media': []})['media'].append(entry)
+    for stem, files in loose.items():
+        posts.append(_post_from_files(stem, files['text'], files['media'], path / f"{stem}.llm.json"))
+    return posts
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Пакетный рендер постов из JSONL или каталога")
+    parser.add_argument('input', type=Path, help="файл JSONL или каталог с постами")
+    parser.add_argument('--render-workers', type=int, help="одновременных рендеров (по умолчанию [PIPELINE] render_workers)")
+    parser.add_argument('--llm-workers', type=int, help="одновременных вызовов LLM (по умолчанию [PIPELINE] llm_workers)")
+    parser.add_argument('--no-publish', action='store_true', help="не публиковать, даже если local_only выключен")
+    parser.add_argument('--manifest', type=Path, help="куда записать итог (по умолчанию outputs/batch_<время>.jsonl)")
+    return parser.parse_args()
+
+
+async def main() -> None:
+    args = _parse_args()
+    setup_logging(log_dir="logs", log_level="INFO")
+    config = load_config(ROOT)
+
+    if args.input.is_dir():
+        posts = read_directory(args.input)
+    else:
+        posts = read_jsonl(args.input)
+    if not posts:
+        logger.warning("⚠️ Во входе %s нет постов", args.input)
+        return
+
+    section = config.setdefault('PIPELINE', {})
+    if args.render_workers:
+        section['render_workers'] = str(args.render_workers)
+    if args.llm_workers:
+        section['llm_workers'] = str(args.llm_workers)
+
+    publish = not args.no_publish and not _is_local_only(config)
+    uploader = None
+    if publish:
+        from services.youtube_uploader import YouTubeUploader
+
+        uploader = YouTubeUploader(config)
+
+    composer = create_video_generator(config)
+    llm_registry = LLMRegistry(config)
+    pipeline = build_pipeline(config, uploader, composer, llm_registry=llm_registry, publish=publish)
+    logger.info(
+        "📦 Пакет: %s постов (%s с готовым пакетом LLM), публикация: %s",
+        len(posts), sum(1 for p in posts if p.llm), "да" if publish else "нет",
+    )
+
+    started = time.monotonic()
+    jobs: List[tuple[BatchPost, Optional[Job]]] = []
+    pipeline.start()
+    try:
+        for post in posts:
+            if post.error:
+                logger.error("❌ %s: %s", post.source, post.error)
+                jobs.append((post, None))
+                continue
+            job = Job(text=post.text, media_path=post.media_path)
+            jobs.append((post, job))
+            if post.llm:
+                job.data.update(post.llm)
+                await pipeline.submit(job, stage='render')
+            else:
+                await pipeline.submit(job)
+        await pipeline.join()
+    finally:
+        await pipeline.stop()
+        await llm_registry.aclose()
+        if uploader is not None:
+            uploader.close()
+    elapsed = time.monotonic() - started
+
+    outputs_dir = Path(config['PATHS'].get('outputs_dir', 'outputs'))
+    manifest = args.manifest or outputs_dir / f"batch_{time.strftime('%Y%m%d_%H%M%S')}.jsonl"
+    manifest.parent.mkdir(parents=True, exist_ok=True)
+    rendered = succeeded = 0
+    with open(manifest, 'w', encoding='utf-8') as f:
+        for post, job in jobs:
+            entry: Dict[str, Any] = {'source': post.source}
+            if job is None:
+                entry.update(status='failed', error=post.error)
+            else:
+                video = job.data.get('video_path')
+                ok = video is not None and job.error is None and (not publish or 'publish' in job.data)
+                rendered += video is not None
+                succeeded += ok
+                entry.update(
+                    status='ok' if ok else 'failed',
+                    job_id=job.id,
+                    video_path=str(video) if video else None,
+                    title=(job.data.get('seo') or {}).get('title'),
+                    publish=job.data.get('publish'),
+                    error=job.error,
+                    timings={name: round(sec, 2) for name, sec in job.timings.items()},
+                )
+            f.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+
+    failed = len(jobs) - succeeded
+    per_minute = rendered / elapsed * 60 if elapsed > 0 else 0.0
+    logger.info(
+        "🏁 Пакет готов за %.1f с: роликов %s, ошибок %s — %.2f shorts/мин. Манифест: %s",
+        elapsed, rendered, failed, per_minute, manifest,
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,19 +1,30 @@
 import asyncio
 import logging
 import os
+import time
 from pathlib import Path
 
 from services.config_loader import load_config
-from services.video_factory import create_video_generator, create_llm_provider
+from services.video_factory import create_video_generator
+from services.llm_registry import LLMRegistry, default_registry
 from services.telegram_monitor import start_telegram_watcher
 from services.youtube_uploader import YouTubeUploader
 from services.twitter_uploader import TwitterUploader
 from services.telegram_publisher import TelegramPublisher
 from services.storage import ensure_directories
+from services.pipeline import Job, Pipeline, Stage
+from services.publish_fanout import PublishError, PublishTarget, fan_out
+from services import job_store
+from services.job_store import JobStore
 from services.logger_config import setup_logging, log_system_info, log_config_info, create_log_viewer_script
 logger = logging.getLogger("main")
 
 
+def _prepare_during_llm(config: dict) -> bool:
+    v = str(config.get("PIPELINE", {}).get("prepare_during_llm", "true")).strip().lower()
+    return v in ("true", "1", "yes", "on")
+
+
 def _is_local_only(config: dict) -> bool:
     """Песочница: только файл в outputs/, без YouTube и без публикации в Telegram."""
     v = str(config.get("GENERAL", {}).get("local_only", "false")).strip().lower()
@@ -22,33 +33,18 @@ def _is_local_only(config: dict) -> bool:
     return os.environ.get("LOCAL_ONLY", "").strip().lower() in ("1", "true", "yes", "on")
 
 
-async def process_message(
-    text: str | None,
-    media_path: str | None,
-    config: dict,
-    uploader: YouTubeUploader | None,
-    composer,
-    twitter: TwitterUploader = None,
-    telegram_publisher: TelegramPublisher = None,
-):
-    if not text:
-        logger.info("Message has no text. Using default text for video.")
-        text = "Новини"  # Fallback текст
-
-    llm = create_llm_provider(config)
-    
-    # Проверяем версию генератора для выбора формата LLM
-    generator_version = config['VIDEO'].get('generator_version', 'v1').lower()
-    
-    # Сбрасываем состояние API ключей для нового сообщения (только для V1)
-    if hasattr(llm, 'reset_for_new_message'):
-        llm.reset_for_new_message()
+async def generate_content(text: str, config: dict, llm_registry: LLMRegistry | None = None) -> tuple:
+    """Стадия LLM: (short_text, seo) одним запросом; при ошибке — запасной текст и SEO."""
+    registry = llm_registry or default_registry(config)
+    llm = registry.get()
+    # Состояние ключей/fallback-модели — на сообщение: параллельные воркеры LLM делят только клиентов
+    session = registry.session(llm)
 
     # Task 2: ЕДИНЫЙ запрос к LLM — получаем весь пакет (контент + SEO)
     try:
         source_url = config['VIDEO'].get('source_text', '')
         source_name = config['TELEGRAM'].get('channel', '')
-        pkg = await llm.generate_video_package(text, source_name=source_name, source_url=source_url)
+        pkg = await session.generate_video_package(text, source_name=source_name, source_url=source_url)
         video_content = pkg.get('video_content', {}) if isinstance(pkg, dict) else {}
         seo_pkg = pkg.get('seo_package', {}) if isinstance(pkg, dict) else {}
 
@@ -72,7 +68,9 @@ async def process_message(
             tags = tags[:15]
         seo = {'title': title, 'description': description, 'tags': tags}
         logger.info("SEO package (1-call) ready: title='%s'", seo['title'][:60])
+        registry.record_success(llm)
     except Exception as e:
+        registry.record_failure(llm, e)
         logger.error("LLM package generation failed: %s. Falling back.", e)
         # Fallback short_text
         short_text = text[:200] + "..." if len(text) > 200 else text
@@ -95,11 +93,36 @@ async def process_message(
             'description': '',
             'tags': ['новини', 'україна', 'політика', 'світ', 'news', 'ukraine', 'politics', 'world', 'shorts', 'відео', 'готелі', 'аляска']
         }
+    return short_text, seo
+
 
-    # Step 3: Video generation
+async def prepare_render(composer, media_path, config: dict) -> None:
+    """Подготовка рендера без текста (медиа, smart_crop, запуск браузера); ошибки не фатальны — рендер повторит её сам."""
+    if not hasattr(composer, 'prepare') or not _prepare_during_llm(config):
+        return
+    started = time.monotonic()
+    try:
+        await composer.prepare(media_path)
+        logger.info("🧰 Подготовка рендера: %.1f с (параллельно с LLM)", time.monotonic() - started)
+    except Exception as e:
+        logger.warning("⚠️ Подготовка рендера не удалась (%s) — всё сделает рендер", e)
+
+
+async def generate_with_prepare(text: str, media_path, config: dict, composer, llm_registry: LLMRegistry | None = None) -> tuple:
+    """LLM и подготовка медиа/браузера одновременно: задержка — max(LLM, подготовка), а не сумма."""
+    prep = asyncio.create_task(prepare_render(composer, media_path, config))
+    try:
+        return await generate_content(text, config, llm_registry)
+    finally:
+        await prep
+
+
+async def render_video(short_text, media_path, config: dict, composer, tag: str = "") -> str:
+    """Стадия рендера: готовый ролик в outputs_dir."""
     output_dir = Path(config['PATHS']['outputs_dir'])
     output_dir.mkdir(parents=True, exist_ok=True)
-    output_path = output_dir / f"short_{int(asyncio.get_event_loop().time()*1000)}.mp4"
+    # tag (номер задачи) разводит имена параллельных рендеров, начатых в одну миллисекунду
+    output_path = output_dir / f"short_{int(asyncio.get_event_loop().time()*1000)}{tag}.mp4"
 
     video_path = await composer.compose(
         short_text=short_text,
@@ -108,63 +131,251 @@ async def process_message(
         source_text=config['VIDEO'].get('source_text', '')
     )
     logger.info("Video composed: %s", video_path)
+    return video_path
 
-    # Step 4: Upload to YouTube or Telegram (пропуск в песочнице local_only)
-    if _is_local_only(config):
-        logger.info("🔶 Песочница (local_only): видео только локально — %s", video_path)
-        logger.info("All uploads complete (skipped)")
-        return
 
-    upload_to_telegram = config.get('GENERAL', {}).get('upload_to_telegram', False)
+def _publish_section_float(section, key: str, default: float) -> float:
+    try:
+        return float(section.get(key, default))
+    except (TypeError, ValueError):
+        return default
 
-    if upload_to_telegram and telegram_publisher and telegram_publisher.is_available():
-        # Публикация в Telegram
-        logger.info("📢 Публикуем в Telegram канал...")
-        telegram_success = await telegram_publisher.upload_video(
-            video_path=str(video_path),
-            title=seo.get('title', 'News Update'),
-            description=seo.get('description', ''),
-            tags=seo.get('tags', [])
+
+def build_publish_targets(
+    video_path: str,
+    seo: dict,
+    config: dict,
+    uploader: YouTubeUploader | None,
+    twitter: TwitterUploader = None,
+    telegram_publisher: TelegramPublisher = None,
+) -> list[PublishTarget]:
+    """Включённые направления: YouTube или Telegram (upload_to_telegram) и X, со своими таймаутами ([PUBLISH])."""
+    section = config.get('PUBLISH', {})
+    retries = int(_publish_section_float(section, 'retries', 1))
+    retry_delay = _publish_section_float(section, 'retry_delay_seconds', 15)
+    title = seo.get('title', 'News Update')
+    description = seo.get('description', '')
+    tags = seo.get('tags', [])
+    targets: list[PublishTarget] = []
+
+    def target(name: str, call, required: bool = True, retry_on_timeout: bool = True) -> PublishTarget:
+        return PublishTarget(
+            name=name,
+            call=call,
+            timeout=_publish_section_float(section, f'{name}_timeout_seconds', 0),
+            retries=retries,
+            retry_delay=retry_delay,
+            required=required,
+            retry_on_timeout=retry_on_timeout,
         )
-        if telegram_success:
-            logger.info("✅ Telegram публикация завершена")
-        else:
-            logger.error("❌ Ошибка публикации в Telegram")
-    else:
-        # Публикация на YouTube
-        if uploader is None:
-            logger.error("❌ YouTube uploader недоступен")
-            return
-        logger.info("📺 Публикуем на YouTube...")
-        uploader.upload_video(
+
+    upload_to_telegram = config.get('GENERAL', {}).get('upload_to_telegram', False)
+    if upload_to_telegram and telegram_publisher and telegram_publisher.is_available():
+        targets.append(target('telegram', lambda: telegram_publisher.upload_video(
+            video_path=str(video_path), title=title, description=description, tags=tags
+        )))
+    elif uploader is not None:
+        step = max(1, int(uploader.progress_step))
+        next_percent = [step]
+
+        def on_progress(sent: int, total: int) -> None:
+            # Вызывается после каждого куска; в лог — раз в upload_progress_step процентов
+            percent = int(sent * 100 / total) if total else 100
+            if percent + step < next_percent[0]:
+                next_percent[0] = step  # повтор попытки — загрузка началась заново
+            if percent >= next_percent[0] or sent >= total:
+                next_percent[0] = (percent // step + 1) * step
+                logger.info("📤 YouTube: %s%% (%.1f / %.1f МБ)", percent, sent / 2**20, total / 2**20)
+
+        # Куски resumable-загрузки идут в потоке загрузчика; таймаут/отмена останавливают загрузку.
+        # Повтор после таймаута безопасен: отмена дожидается потока, и ролик, загруженный последним
+        # куском, возвращается как успех, а не как таймаут
+        targets.append(target('youtube', lambda: uploader.upload_video_async(
             video_file=str(video_path),
-            title=seo.get('title', 'News Update'),
-            description=seo.get('description', ''),
-            tags=seo.get('tags', []),
+            title=title,
+            description=description,
+            tags=tags,
             category_id=config['YOUTUBE'].get('category_id', '25'),
-            privacy_status=config['YOUTUBE'].get('privacy_status', 'public')
-        )
-        logger.info("✅ YouTube загрузка завершена")
-    
-    # Step 5: Upload to Twitter (если включено)
+            privacy_status=config['YOUTUBE'].get('privacy_status', 'public'),
+            on_progress=on_progress,
+        ), retry_on_timeout=True))
+    else:
+        logger.error("❌ YouTube uploader недоступен")
+
     if twitter and twitter.enabled:
-        try:
-            twitter_success = twitter.upload_post(
-                title=seo.get('title', 'News Update'),
-                description=seo.get('description', ''),
-                tags=seo.get('tags', []),
-                video_path=str(video_path)
-            )
-            if twitter_success:
-                logger.info("Twitter upload complete")
-            else:
-                logger.warning("Twitter upload failed")
-        except Exception as e:
-            logger.error(f"Twitter upload error: {e}")
+        # tweepy синхронный: по таймауту ожидание прекращается, сам поток дорабатывает запрос
+        twitter_required = str(section.get('twitter_required', 'false')).strip().lower() in ('1', 'true', 'yes', 'on')
+        targets.append(target('twitter', lambda: asyncio.to_thread(
+            twitter.upload_post, title=title, description=description, tags=tags, video_path=str(video_path)
+        ), required=twitter_required, retry_on_timeout=False))
     else:
         logger.info("Twitter upload skipped (disabled or not configured)")
-        
+    return targets
+
+
+async def publish_video(
+    video_path: str,
+    seo: dict,
+    config: dict,
+    uploader: YouTubeUploader | None,
+    twitter: TwitterUploader = None,
+    telegram_publisher: TelegramPublisher = None,
+    previous: dict | None = None,
+) -> dict:
+    """
+    Стадия публикации: все включённые направления одновременно (пропуск в песочнице local_only).
+    Возвращает итог по направлениям; previous — итог прошлой попытки (опубликованное не повторяется).
+    PublishError — не удалось обязательное направление.
+    """
+    if _is_local_only(config):
+        logger.info("🔶 Песочница (local_only): видео только локально — %s", video_path)
+        logger.info("All uploads complete (skipped)")
+        return {}
+
+    targets = build_publish_targets(video_path, seo, config, uploader, twitter, telegram_publisher)
+    logger.info("📢 Публикуем: %s", ", ".join(t.name for t in targets) or "нет направлений")
+    results = await fan_out(targets, previous)
     logger.info("All uploads complete")
+    return {name: result.to_dict() for name, result in results.items()}
+
+
+async def process_message(
+    text: str | None,
+    media_path: str | None,
+    config: dict,
+    uploader: YouTubeUploader | None,
+    composer,
+    twitter: TwitterUploader = None,
+    telegram_publisher: TelegramPublisher = None,
+    llm_registry: LLMRegistry | None = None,
+):
+    """Один пост целиком, стадии последовательно (локальный прогон; сервис идёт через конвейер)."""
+    if not text:
+        logger.info("Message has no text. Using default text for video.")
+        text = "Новини"  # Fallback текст
+
+    short_text, seo = await generate_with_prepare(text, media_path, config, composer, llm_registry)
+    video_path = await render_video(short_text, media_path, config, composer)
+    await publish_video(video_path, seo, config, uploader, twitter, telegram_publisher)
+
+
+def build_pipeline(
+    config: dict,
+    uploader: YouTubeUploader | None,
+    composer,
+    twitter: TwitterUploader = None,
+    telegram_publisher: TelegramPublisher = None,
+    store: JobStore | None = None,
+    llm_registry: LLMRegistry | None = None,
+    publish: bool = True,
+) -> Pipeline:
+    """
+    Стадии llm → render → publish, у каждой своя очередь и лимит параллельности ([PIPELINE]).
+    С журналом задач (store) результат каждой стадии сохраняется, ошибка стадии повторяется
+    с экспоненциальной паузой до job_max_attempts раз. publish=False — без стадии публикации
+    (пакетный рендер в outputs/).
+    """
+    section = config.get('PIPELINE', {})
+    retry_delay = float(section.get('job_retry_delay_seconds', 30) or 30)
+
+    def checkpoint(job: Job, state: str, **data) -> None:
+        if store is not None:
+            store.advance(job.id, state, **data)
+
+    def lease(job: Job) -> None:
+        if store is not None:
+            store.renew(job.id)
+
+    def on_failure(stage: str, job: Job, exc: Exception):
+        if store is None:
+            return None
+        attempt = store.fail(job.id, f"{stage}: {exc}")
+        if attempt is None:
+            logger.error("❌ Задача #%s: попытки исчерпаны на стадии %s", job.id, stage)
+            return None
+        return retry_delay * 2 ** (attempt - 1)
+
+    def _int(key: str, default: int) -> int:
+        try:
+            return int(section.get(key, default))
+        except (TypeError, ValueError):
+            return default
+
+    async def llm_stage(job: Job) -> Job:
+        lease(job)
+        if not job.text:
+            logger.info("Message has no text. Using default text for video.")
+            job.text = "Новини"  # Fallback текст
+        job.data['short_text'], job.data['seo'] = await generate_with_prepare(
+            job.text, job.media_path, config, composer, llm_registry
+        )
+        checkpoint(job, job_store.LLM_DONE, short_text=job.data['short_text'], seo=job.data['seo'])
+        return job
+
+    async def render_stage(job: Job) -> Job:
+        lease(job)
+        job.data['video_path'] = await render_video(
+            job.data['short_text'], job.media_path, config, composer, tag=f"_{job.id}"
+        )
+        checkpoint(job, job_store.RENDERED, video_path=str(job.data['video_path']))
+        return job
+
+    async def publish_stage(job: Job) -> None:
+        lease(job)
+        try:
+            job.data['publish'] = await publish_video(
+                job.data['video_path'], job.data['seo'], config, uploader, twitter, telegram_publisher,
+                previous=job.data.get('publish'),
+            )
+        except PublishError as e:
+            # Итог по направлениям — в журнал: повтор задачи опубликует только неудавшиеся
+            job.data['publish'] = {name: r.to_dict() for name, r in e.results.items()}
+            if store is not None:
+                store.update_data(job.id, publish=job.data['publish'])
+            raise
+        checkpoint(job, job_store.UPLOADED, publish=job.data['publish'])
+        logger.info(
+            "🏁 Задача #%s готова за %.1f с (%s)",
+            job.id,
+            time.monotonic() - job.created_at,
+            ", ".join(f"{name} {sec:.1f} с" for name, sec in job.timings.items()),
+        )
+
+    # Очереди после первой ограничены: перед медленной стадией копится не больше queue_size задач
+    queue_size = _int('queue_size', 4)
+    render_workers = _int('render_workers', 2)
+    limit = getattr(composer, 'max_parallel_renders', None)
+    if limit is not None and render_workers > limit:
+        logger.info("🎬 %s рендерит по %s за раз — render_workers=%s → %s", type(composer).__name__, limit, render_workers, limit)
+        render_workers = limit
+    stages = [
+        Stage('llm', llm_stage, _int('llm_workers', 4)),
+        Stage('render', render_stage, render_workers, maxsize=queue_size),
+    ]
+    if publish:
+        stages.append(Stage('publish', publish_stage, _int('publish_workers', 2), maxsize=queue_size))
+    return Pipeline(
+        stages,
+        stats_interval=float(section.get('stats_interval_seconds', 60) or 0),
+        on_failure=on_failure,
+    )
+
+
+async def resume_jobs(pipeline: Pipeline, store: JobStore) -> None:
+    """Незавершённые задачи из журнала — в стадию после последней завершённой."""
+    for stored in store.recover():
+        job = Job(text=stored.text, media_path=stored.media_path, id=stored.id, data=stored.data)
+        if stored.state == job_store.INGESTED:
+            stage = 'llm'
+        elif stored.state == job_store.LLM_DONE:
+            stage = 'render'
+        elif Path(str(stored.data.get('video_path', ''))).is_file():
+            stage = 'publish'
+        else:
+            # Ролик удалён или не дописан — рендерим заново по сохранённому тексту
+            stage = 'render'
+        logger.info("♻️ Задача #%s (%s) продолжается со стадии %s", job.id, stored.state, stage)
+        await pipeline.submit(job, stage=stage)
 
 
 async def main():
@@ -218,26 +429,31 @@ async def main():
 
     logger.info("🚀 Starting Telegram watcher...")
 
-    message_queue: asyncio.Queue[tuple[str | None, str | None]] = asyncio.Queue()
-
-    async def queue_worker():
-        while True:
-            text, media_path = await message_queue.get()
-            try:
-                logger.info("🧵 Processing queued message. Queue size=%s", message_queue.qsize())
-                await process_message(text, media_path, config, uploader, composer, twitter, telegram_publisher)
-            except Exception as e:
-                logger.exception("❌ Failed to process queued message: %s", e)
-            finally:
-                message_queue.task_done()
-
-    asyncio.create_task(queue_worker())
+    # Журнал задач в state_dir: посты в очереди переживают падение и перезапуск сервиса
+    store = JobStore.from_config(config)
+    # LLM-провайдер и его соединения — один раз на процесс
+    llm_registry = LLMRegistry(config)
+    pipeline = build_pipeline(config, uploader, composer, twitter, telegram_publisher, store, llm_registry)
+    pipeline.start()
+    if store is not None:
+        store.prune()
+        await resume_jobs(pipeline, store)
 
     async def handler(text: str | None, media_path: str | None):
-        await message_queue.put((text, media_path))
-        logger.info("📥 Message queued. Queue size=%s", message_queue.qsize())
+        job = Job(text=text, media_path=media_path)
+        if store is not None:
+            job.id = store.add(text, media_path)
+        await pipeline.submit(job)
 
-    await start_telegram_watcher(config, handler)
+    try:
+        await start_telegram_watcher(config, handler)
+    finally:
+        await pipeline.stop()
+        await llm_registry.aclose()
+        if uploader is not None:
+            uploader.close()
+        if store is not None:
+            store.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,76 @@
+"""
+Кэш статичных ассетов V1 (state_dir/v1_assets/<kind>_<key><ext>).
+
+Подвал зависит только от даты, подписи источника и шрифта, градиентный фон — только от
+размера, «улучшенная» фотография шапки — от содержимого файла и размера шапки. Такие
+картинки строятся один раз и переиспользуются между задачами; ключ — хэш входов
+(см. render_cache.make_key), размер каталога ограничен, вытесняются давно не
+использованные файлы (LRU по mtime).
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Callable
+
+from services.render_cache import make_key
+
+logger = logging.getLogger("asset_cache")
+
+
+class AssetCache:
+    """get_or_create(kind, parts, suffix, build): build(path) вызывается только при промахе."""
+
+    def __init__(self, config: dict):
+        v = config.get('VIDEO', {})
+        self.enabled = str(v.get('v1_asset_cache', 'true')).strip().lower() in ('1', 'true', 'yes', 'on')
+        self.max_bytes = int(float(v.get('v1_asset_cache_max_mb', 256) or 0) * 1024 * 1024)
+        paths = config['PATHS']
+        # Без кэша ассеты пишутся во временный каталог, как раньше
+        self.root = Path(paths.get('state_dir', 'state')) / 'v1_assets' if self.enabled else Path(paths.get('tmp_dir', 'resources/tmp'))
+        self._lock = threading.Lock()
+
+    def get_or_create(self, kind: str, parts: dict, suffix: str, build: Callable[[Path], None]) -> str:
+        key = make_key(kind=kind, **parts)[:32]
+        path = self.root / f"{kind}_{key}{suffix}"
+        if self.enabled and path.is_file():
+            try:
+                os.utime(path, None)
+                logger.info("♻️ Ассет V1 из кэша: %s", path.name)
+                return str(path)
+            except OSError:
+                pass
+        self.root.mkdir(parents=True, exist_ok=True)
+        # Отдельное имя на сборку: параллельные задачи не пишут в один файл; расширение — для PIL
+        tmp = path.with_name(f"part_{os.getpid()}_{threading.get_ident()}_{path.name}")
+        try:
+            build(tmp)
+            os.replace(tmp, path)
+        finally:
+            tmp.unlink(missing_ok=True)
+        if self.enabled:
+            self.evict()
+        return str(path)
+
+    def evict(self) -> None:
+        if self.max_bytes <= 0 or not self.root.exists():
+            return
+        with self._lock:
+            entries = []
+            for p in self.root.iterdir():
+                if p.is_file() and not p.name.startswith('part_'):
+                    try:
+                        st = p.stat()
+                    except OSError:
+                        continue
+                    entries.append((st.st_mtime, st.st_size, p))
+            entries.sort(reverse=True)
+            total = 0
+            for _, size, p in entries:
+                total += size
+                if total > self.max_bytes:
+                    p.unlink(missing_ok=True)
+                    logger.info("🧹 Вытеснен ассет V1: %s", p.name)
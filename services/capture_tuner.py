@@ -0,0 +1,180 @@
+"""
+Автоподбор формата скриншота CDP для захвата V2 (JPEG q80/90/95, WebP, PNG).
+
+Стоимость кадра = кодирование в Chrome + base64 + декод в Python, и она сильно зависит
+от формата, качества и CPU хоста. Калибровка на загруженной странице меряет
+скриншот+декод для каждого кандидата и SSIM против PNG (без потерь), выбирает самый
+быстрый вариант с SSIM не ниже порога и сохраняет его в state_dir/capture_tuning.json
+по ключу хоста (машина, ядра, версия Chrome, размер кадра).
+"""
+
+from __future__ import annotations
+
+import base64
+import json
+import logging
+import os
+import platform
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger("capture_tuner")
+
+# (format, quality) — quality только для jpeg/webp
+CANDIDATES: List[Tuple[str, Optional[int]]] = [
+    ("jpeg", 80),
+    ("jpeg", 90),
+    ("jpeg", 95),
+    ("webp", 90),
+    ("png", None),
+]
+DEFAULT_SETTINGS = {"format": "jpeg", "quality": 95}
+TUNING_FILE = "capture_tuning.json"
+
+
+def screenshot_params(settings: dict) -> dict:
+    params = {"format": settings.get("format", "jpeg")}
+    if params["format"] in ("jpeg", "webp") and settings.get("quality") is not None:
+        params["quality"] = int(settings["quality"])
+    return params
+
+
+def engine_name(settings: dict) -> str:
+    fmt = settings.get("format", "jpeg")
+    q = settings.get("quality")
+    return f"cdp-{fmt}-q{q}" if q is not None and fmt != "png" else f"cdp-{fmt}"
+
+
+def ssim(a: np.ndarray, b: np.ndarray) -> float:
+    """SSIM по яркости (окно Гаусса 11, σ=1.5) на половинном разрешении — для сравнения форматов хватает."""
+    ga = cv2.cvtColor(a, cv2.COLOR_BGR2GRAY)
+    gb = cv2.cvtColor(b, cv2.COLOR_BGR2GRAY)
+    size = (max(1, ga.shape[1] // 2), max(1, ga.shape[0] // 2))
+    x = cv2.resize(ga, size, interpolation=cv2.INTER_AREA).astype(np.float32)
+    y = cv2.resize(gb, size, interpolation=cv2.INTER_AREA).astype(np.float32)
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+
+    def blur(img: np.ndarray) -> np.ndarray:
+        return cv2.GaussianBlur(img, (11, 11), 1.5)
+
+    mx, my = blur(x), blur(y)
+    sxx = blur(x * x) - mx * mx
+    syy = blur(y * y) - my * my
+    sxy = blur(x * y) - mx * my
+    num = (2 * mx * my + c1) * (2 * sxy + c2)
+    den = (mx * mx + my * my + c1) * (sxx + syy + c2)
+    return float((num / den).mean())
+
+
+def host_key(driver, width: int, height: int) -> str:
+    try:
+        browser = driver.capabilities.get("browserVersion", "?")
+    except Exception:
+        browser = "?"
+    return f"{platform.node()}|{os.cpu_count()}|chrome-{browser}|{width}x{height}"
+
+
+def _grab(driver, settings: dict) -> Tuple[Optional[np.ndarray], float]:
+    """Один скриншот + декод в BGR; возвращает (кадр, секунды)."""
+    started = time.perf_counter()
+    data = driver.execute_cdp_cmd("Page.captureScreenshot", screenshot_params(settings))
+    raw = base64.b64decode(data["data"])
+    frame = cv2.imdecode(np.frombuffer(raw, np.uint8), cv2.IMREAD_COLOR)
+    return frame, time.perf_counter() - started
+
+
+def calibrate(driver, samples: int = 5, min_ssim: float = 0.98) -> dict:
+    """Меряет кандидатов на текущей странице и возвращает лучшие настройки с таблицей замеров."""
+    reference, _ = _grab(driver, {"format": "png"})
+    if reference is None:
+        raise RuntimeError("PNG-скриншот для эталона не декодировался")
+
+    results: List[Dict[str, object]] = []
+    for fmt, quality in CANDIDATES:
+        settings = {"format": fmt, "quality": quality}
+        try:
+            _grab(driver, settings)  # прогрев
+            times, frame = [], None
+            for _ in range(samples):
+                frame, seconds = _grab(driver, settings)
+                times.append(seconds)
+            if frame is None or frame.shape != reference.shape:
+                raise RuntimeError("кадр не декодировался")
+            score = 1.0 if fmt == "png" else ssim(reference, frame)
+            results.append({
+                "format": fmt,
+                "quality": quality,
+                "ms_per_frame": round(float(np.median(times)) * 1000, 2),
+                "ssim": round(score, 5),
+            })
+        except Exception as e:
+            logger.info("   %s: пропущен (%s)", engine_name(settings), e)
+
+    passing = [r for r in results if r["ssim"] >= min_ssim] or [
+        {"format": "png", "quality": None, "ms_per_frame": None, "ssim": 1.0}
+    ]
+    best = min(passing, key=lambda r: r["ms_per_frame"] if r["ms_per_frame"] is not None else float("inf"))
+    for r in results:
+        logger.info(
+            "   %-14s %7.2f мс/кадр  SSIM=%.4f%s",
+            engine_name(r), r["ms_per_frame"], r["ssim"], "  ←" if r is best else "",
+        )
+    return {
+        "format": best["format"],
+        "quality": best["quality"],
+        "min_ssim": min_ssim,
+        "measured_at": int(time.time()),
+        "results": results,
+    }
+
+
+class CaptureTuner:
+    """Хранилище результатов калибровки в state_dir; один результат на ключ хоста."""
+
+    def __init__(self, state_dir: str, min_ssim: float = 0.98, max_age_days: float = 30.0):
+        self.path = Path(state_dir) / TUNING_FILE
+        self.min_ssim = min_ssim
+        self.max_age = max_age_days * 86400
+
+    def _load_all(self) -> dict:
+        try:
+            return json.loads(self.path.read_text("utf-8"))
+        except (OSError, ValueError):
+            return {}
+
+    def load(self, key: str) -> Optional[dict]:
+        entry = self._load_all().get(key)
+        if not entry:
+            return None
+        if entry.get("min_ssim") != self.min_ssim:
+            return None
+        if self.max_age > 0 and time.time() - entry.get("measured_at", 0) > self.max_age:
+            return None
+        return entry
+
+    def save(self, key: str, entry: dict) -> None:
+        data = self._load_all()
+        data[key] = entry
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(".tmp")
+            tmp.write_text(json.dumps(data, ensure_ascii=False, indent=2), "utf-8")
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logger.warning("⚠️ Не удалось сохранить калибровку захвата: %s", e)
+
+    def settings_for(self, driver, width: int, height: int, samples: int = 5) -> dict:
+        """Сохранённые настройки для хоста или новая калибровка на текущей странице."""
+        key = host_key(driver, width, height)
+        entry = self.load(key)
+        if entry:
+            return entry
+        logger.info("🔬 Калибровка формата захвата для %s...", key)
+        entry = calibrate(driver, samples=samples, min_ssim=self.min_ssim)
+        self.save(key, entry)
+        logger.info("🔬 Выбран формат захвата: %s", engine_name(entry))
+        return entry
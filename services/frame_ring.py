@@ -0,0 +1,148 @@
+"""
+Кольцевой буфер кадров в shared memory между процессом захвата и процессом-энкодером.
+
+Захват (основной процесс: Selenium/CDP, декод JPEG) пишет кадры в заранее выделенные
+слоты H×W×3 uint8 одного сегмента multiprocessing.shared_memory. Отдельный процесс
+читает слот прямо из общей памяти и отдаёт его в stdin ffmpeg — без pickle, без копий
+между процессами и без аллокаций на кадр. Синхронизация — два семафора (свободные /
+заполненные слоты), конец потока — общее число кадров, выставляемое при close().
+"""
+
+from __future__ import annotations
+
+import logging
+import multiprocessing as mp
+import subprocess
+from multiprocessing import shared_memory
+from typing import List, Tuple
+
+import numpy as np
+
+logger = logging.getLogger("frame_ring")
+
+_ERROR_BYTES = 4096
+_WAIT_SECONDS = 1.0
+
+
+def _encoder_main(shm_name, shape, slots, free, filled, total, error, command) -> None:
+    """Тело процесса-энкодера: слоты по порядку → stdin ffmpeg."""
+    # resource_tracker у spawn-потомка общий с родителем: удаляет сегмент только владелец (unlink в close)
+    shm = shared_memory.SharedMemory(name=shm_name)
+    frames = np.ndarray((slots, *shape), dtype=np.uint8, buffer=shm.buf)
+    proc = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+    seq = 0
+    try:
+        while True:
+            if not filled.acquire(timeout=_WAIT_SECONDS):
+                if proc.poll() is not None:
+                    break
+                continue
+            # close() выставляет total и делает ещё один release — он и означает конец
+            if 0 <= total.value <= seq:
+                break
+            proc.stdin.write(frames[seq % slots])
+            seq += 1
+            free.release()
+        proc.stdin.close()
+        stderr = proc.stderr.read()
+        rc = proc.wait()
+        if rc != 0:
+            error.value = stderr[-(_ERROR_BYTES - 1):] or f"ffmpeg exit {rc}".encode()
+    except BaseException as e:
+        if proc.poll() is None:
+            proc.kill()
+        error.value = f"{type(e).__name__}: {e}".encode()[: _ERROR_BYTES - 1]
+    finally:
+        del frames
+        shm.close()
+
+
+class FrameRingEncoder:
+    """
+    ffmpeg в отдельном процессе, кормится из кольца слотов в shared memory.
+
+    write(frame) копирует кадр в свободный слот (np.copyto, без аллокаций) или через
+    slot()/commit() можно писать в слот напрямую (cv2 ... dst=slot).
+    """
+
+    def __init__(self, command: List[str], shape: Tuple[int, int, int], slots: int = 8):
+        ctx = mp.get_context('spawn')
+        self.shape = tuple(shape)
+        self.slots = max(2, int(slots))
+        size = int(np.prod(self.shape)) * self.slots
+        self._shm = shared_memory.SharedMemory(create=True, size=size)
+        self.frames = np.ndarray((self.slots, *self.shape), dtype=np.uint8, buffer=self._shm.buf)
+        self._free = ctx.Semaphore(self.slots)
+        self._filled = ctx.Semaphore(0)
+        self._total = ctx.Value('q', -1)
+        self._error = ctx.Array('c', _ERROR_BYTES)
+        self._seq = 0
+        self._closed = False
+        self.process = ctx.Process(
+            target=_encoder_main,
+            args=(self._shm.name, self.shape, self.slots, self._free, self._filled,
+                  self._total, self._error, command),
+            name="v2-frame-encoder",
+            daemon=True,
+        )
+        self.process.start()
+        logger.info(
+            "🧵 Кольцо кадров: %s слотов %s (%.0f МБ shared memory), энкодер pid=%s",
+            self.slots, 'x'.join(map(str, self.shape)), size / 1024 / 1024, self.process.pid,
+        )
+
+    def slot(self) -> np.ndarray:
+        """Ждёт свободный слот и возвращает его (view в shared memory)."""
+        while not self._free.acquire(timeout=_WAIT_SECONDS):
+            if not self.process.is_alive():
+                raise RuntimeError(f"Энкодер кадров завершился: {self._error_text()}")
+        return self.frames[self._seq % self.slots]
+
+    def commit(self) -> None:
+        self._seq += 1
+        self._filled.release()
+
+    def write(self, frame: np.ndarray) -> None:
+        np.copyto(self.slot(), frame)
+        self.commit()
+
+    def _error_text(self) -> str:
+        return self._error.value.decode('utf-8', errors='replace').strip() or f"exit {self.process.exitcode}"
+
+    def close(self, timeout: float = 120.0) -> None:
+        """Конец потока: ждём, пока энкодер дочитает кольцо и ffmpeg завершится."""
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._total.value = self._seq
+            self._filled.release()
+            self.process.join(timeout)
+            if self.process.is_alive():
+                self.process.kill()
+                raise RuntimeError("Энкодер кадров не завершился вовремя")
+            if self.process.exitcode != 0 or self._error.value:
+                raise RuntimeError(f"Энкодер кадров: {self._error_text()}")
+        finally:
+            self._release()
+
+    def abort(self) -> None:
+        if not self._closed:
+            self._closed = True
+            if self.process.is_alive():
+                self.process.kill()
+            self.process.join(5)
+            self._release()
+
+    def _release(self) -> None:
+        del self.frames
+        self._shm.close()
+        try:
+            self._shm.unlink()
+        except FileNotFoundError:
+            pass
+
+    @property
+    def frames_written(self) -> int:
+        return self._seq
+
@@ -0,0 +1,126 @@
+"""
+Журнал принятых постов Telegram (state_dir/ingest.sqlite3, режим WAL).
+
+Пост приходит в start_telegram_watcher тремя путями: events.NewMessage, events.Album и
+poll_loop, который раз в poll_interval_seconds перечитывает последнее сообщение; плюс
+startup_backfill при каждом запуске. Пути ничего не знали друг о друге, и один пост
+мог быть скачан, отправлен в LLM и отрендерен дважды. Здесь пост «занимается» по ключу
+(чат, m:<id сообщения> или g:<grouped_id> альбома) до скачивания медиа — синхронно, до
+первого await, поэтому из конкурирующих путей пост берёт ровно один. Запись переживает
+перезапуск: backfill не повторяет уже принятые посты.
+
+Состояния: claimed (путь скачивает медиа) → done (передан в конвейер). Ошибка до
+передачи снимает запись — пост сможет взять следующий опрос. claimed от прошлого
+процесса (упал между занятием и передачей) можно занять заново.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger("ingest_ledger")
+
+CLAIMED = 'claimed'
+DONE = 'done'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ingested (
+    chat_id    INTEGER NOT NULL,
+    key        TEXT NOT NULL,
+    state      TEXT NOT NULL,
+    owner      TEXT NOT NULL,
+    source     TEXT,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (chat_id, key)
+);
+CREATE INDEX IF NOT EXISTS ingested_updated ON ingested(updated_at);
+"""
+
+
+def message_key(msg) -> str:
+    """Ключ поста: альбом — по grouped_id (все его сообщения — один пост), иначе — по id."""
+    grouped_id = getattr(msg, 'grouped_id', None)
+    return f"g:{grouped_id}" if grouped_id else f"m:{msg.id}"
+
+
+class IngestLedger:
+    """Какие посты уже приняты; одно соединение под threading.Lock, как у JobStore."""
+
+    def __init__(self, path: Path, retention_days: float = 30):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.retention_days = float(retention_days)
+        # Только один наблюдатель на канал: чужой claimed — незавершённый приём упавшего процесса
+        self.owner = f"{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("PRAGMA busy_timeout=5000")
+        self._db.executescript(_SCHEMA)
+
+    @classmethod
+    def from_config(cls, config: dict) -> Optional["IngestLedger"]:
+        section = config.get('TELEGRAM', {})
+        if str(section.get('ingest_ledger', 'true')).strip().lower() not in ('1', 'true', 'yes', 'on'):
+            return None
+        state_dir = Path(config['PATHS'].get('state_dir', 'state'))
+        return cls(
+            state_dir / 'ingest.sqlite3',
+            retention_days=float(section.get('ingest_retention_days', 30) or 0),
+        )
+
+    def claim(self, chat_id: int, key: str, source: str = '') -> bool:
+        """True — пост взят этим вызовом (качать и передавать); False — уже принят или в работе."""
+        now = time.time()
+        with self._lock:
+            cur = self._db.execute(
+                "INSERT OR IGNORE INTO ingested (chat_id, key, state, owner, source, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (chat_id, key, CLAIMED, self.owner, source, now),
+            )
+            if cur.rowcount:
+                return True
+            # Приём, брошенный прошлым процессом на середине, — забираем
+            cur = self._db.execute(
+                "UPDATE ingested SET owner = ?, source = ?, updated_at = ?"
+                " WHERE chat_id = ? AND key = ? AND state = ? AND owner != ?",
+                (self.owner, source, now, chat_id, key, CLAIMED, self.owner),
+            )
+            return bool(cur.rowcount)
+
+    def done(self, chat_id: int, key: str) -> None:
+        with self._lock:
+            self._db.execute(
+                "UPDATE ingested SET state = ?, updated_at = ? WHERE chat_id = ? AND key = ?",
+                (DONE, time.time(), chat_id, key),
+            )
+
+    def release(self, chat_id: int, key: str) -> None:
+        """Приём не удался до передачи в конвейер — пост снова доступен."""
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM ingested WHERE chat_id = ? AND key = ? AND state = ?",
+                (chat_id, key, CLAIMED),
+            )
+
+    def prune(self) -> None:
+        """Удаляет записи старше retention_days (такие посты уже не попадут в backfill/опрос)."""
+        if self.retention_days <= 0:
+            return
+        cutoff = time.time() - self.retention_days * 86400
+        with self._lock:
+            cur = self._db.execute("DELETE FROM ingested WHERE updated_at < ? AND state = ?", (cutoff, DONE))
+        if cur.rowcount:
+            logger.info("🧹 Удалено старых записей журнала приёма: %s", cur.rowcount)
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
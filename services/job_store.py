@@ -0,0 +1,237 @@
+"""
+Журнал задач конвейера в SQLite (state_dir/jobs.sqlite3, режим WAL).
+
+Очередь в памяти теряла посты при каждом падении или деплое (systemd Restart=always).
+Здесь каждая задача записывается при поступлении и после каждой стадии:
+
+    ingested → llm_done → rendered → uploaded        (failed — попытки исчерпаны)
+
+Вместе с состоянием хранятся результаты стадий (текст, SEO, путь к ролику), так что
+после перезапуска задача продолжает с последней завершённой стадии. Задача в работе
+«арендована» процессом (lease_owner = host:pid, lease_until); аренда умершего процесса
+снимается при старте, чужая живая — уважается (два экземпляра не возьмут одно и то же).
+Записи в WAL с synchronous=NORMAL занимают доли миллисекунды — вызовы синхронные.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger("job_store")
+
+INGESTED = 'ingested'
+LLM_DONE = 'llm_done'
+RENDERED = 'rendered'
+UPLOADED = 'uploaded'
+FAILED = 'failed'
+TERMINAL = (UPLOADED, FAILED)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    state       TEXT NOT NULL,
+    text        TEXT,
+    media_json  TEXT,
+    data_json   TEXT NOT NULL DEFAULT '{}',
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    last_error  TEXT,
+    lease_owner TEXT,
+    lease_until REAL,
+    created_at  REAL NOT NULL,
+    updated_at  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs(state);
+"""
+
+
+@dataclass
+class StoredJob:
+    id: int
+    state: str
+    text: Optional[str]
+    media_path: Any
+    data: Dict[str, Any]
+    attempts: int
+
+
+def _owner() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobStore:
+    """Состояния, аренда и счётчик попыток задач; одно соединение под threading.Lock."""
+
+    def __init__(self, path: Path, lease_seconds: float = 1800, max_attempts: int = 3, retention_days: float = 14):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lease_seconds = float(lease_seconds)
+        self.max_attempts = max(1, int(max_attempts))
+        self.retention_days = float(retention_days)
+        self.owner = _owner()
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("PRAGMA busy_timeout=5000")
+        self._db.executescript(_SCHEMA)
+
+    @classmethod
+    def from_config(cls, config: dict) -> Optional["JobStore"]:
+        section = config.get('PIPELINE', {})
+        if str(section.get('job_store', 'true')).strip().lower() not in ('1', 'true', 'yes', 'on'):
+            return None
+        state_dir = Path(config['PATHS'].get('state_dir', 'state'))
+        return cls(
+            state_dir / 'jobs.sqlite3',
+            lease_seconds=float(section.get('job_lease_seconds', 1800) or 1800),
+            max_attempts=int(section.get('job_max_attempts', 3) or 3),
+            retention_days=float(section.get('job_retention_days', 14) or 0),
+        )
+
+    def _execute(self, sql: str, params: tuple = ()) -> sqlite3.Cursor:
+        with self._lock:
+            return self._db.execute(sql, params)
+
+    def _query(self, sql: str, params: tuple = ()) -> list:
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    # ---------- жизненный цикл задачи ----------
+
+    def add(self, text: Optional[str], media_path: Any) -> int:
+        now = time.time()
+        cur = self._execute(
+            "INSERT INTO jobs (state, text, media_json, lease_owner, lease_until, created_at, updated_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (INGESTED, text, json.dumps(media_path, ensure_ascii=False), self.owner, now + self.lease_seconds, now, now),
+        )
+        return int(cur.lastrowid)
+
+    def advance(self, job_id: int, state: str, **data: Any) -> None:
+        """Стадия завершена: новое состояние, результаты стадии в data, аренда продлевается."""
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT data_json FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            merged = json.loads(row[0]) if row else {}
+            merged.update(data)
+            lease_until = None if state in TERMINAL else now + self.lease_seconds
+            owner = None if state in TERMINAL else self.owner
+            self._db.execute(
+                "UPDATE jobs SET state = ?, data_json = ?, attempts = 0, last_error = NULL,"
+                " lease_owner = ?, lease_until = ?, updated_at = ? WHERE id = ?",
+                (state, json.dumps(merged, ensure_ascii=False, default=str), owner, lease_until, now, job_id),
+            )
+
+    def update_data(self, job_id: int, **data: Any) -> None:
+        """Дописывает результаты в data без смены состояния и счётчика попыток (частичный итог стадии)."""
+        with self._lock:
+            row = self._db.execute("SELECT data_json FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return
+            merged = json.loads(row[0])
+            merged.update(data)
+            self._db.execute(
+                "UPDATE jobs SET data_json = ?, updated_at = ? WHERE id = ?",
+                (json.dumps(merged, ensure_ascii=False, default=str), time.time(), job_id),
+            )
+
+    def renew(self, job_id: int) -> None:
+        """Продление аренды: задача взята стадией (в очереди она могла простоять дольше аренды)."""
+        self._execute(
+            "UPDATE jobs SET lease_owner = ?, lease_until = ? WHERE id = ?",
+            (self.owner, time.time() + self.lease_seconds, job_id),
+        )
+
+    def fail(self, job_id: int, error: str) -> Optional[int]:
+        """Ошибка стадии: +1 попытка. Номер попытки, если можно повторить; None — задача помечена failed."""
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            attempts = (row[0] if row else 0) + 1
+            retry = attempts < self.max_attempts
+            self._db.execute(
+                "UPDATE jobs SET attempts = ?, last_error = ?, state = CASE WHEN ? THEN state ELSE ? END,"
+                " lease_owner = CASE WHEN ? THEN lease_owner END, lease_until = CASE WHEN ? THEN lease_until END,"
+                " updated_at = ? WHERE id = ?",
+                (attempts, str(error)[:2000], retry, FAILED, retry, retry, now, job_id),
+            )
+        return attempts if retry else None
+
+    # ---------- восстановление после перезапуска ----------
+
+    def _release_dead_leases(self) -> None:
+        host = socket.gethostname()
+        rows = self._query(
+            "SELECT id, lease_owner FROM jobs WHERE lease_owner IS NOT NULL AND state NOT IN (?, ?)", TERMINAL
+        )
+        for job_id, owner in rows:
+            owner_host, _, pid = str(owner).rpartition(':')
+            if owner_host == host and pid.isdigit() and (int(pid) == os.getpid() or not _pid_alive(int(pid))):
+                self._execute("UPDATE jobs SET lease_owner = NULL, lease_until = NULL WHERE id = ?", (job_id,))
+
+    def recover(self) -> List[StoredJob]:
+        """Незавершённые задачи без живой аренды — забираются этим процессом (старые первыми)."""
+        self._release_dead_leases()
+        now = time.time()
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, state, text, media_json, data_json, attempts FROM jobs"
+                " WHERE state NOT IN (?, ?) AND (lease_until IS NULL OR lease_until < ?) ORDER BY id",
+                (*TERMINAL, now),
+            ).fetchall()
+            for row in rows:
+                self._db.execute(
+                    "UPDATE jobs SET lease_owner = ?, lease_until = ? WHERE id = ?",
+                    (self.owner, now + self.lease_seconds, row[0]),
+                )
+        jobs = [
+            StoredJob(
+                id=row[0],
+                state=row[1],
+                text=row[2],
+                media_path=json.loads(row[3]) if row[3] else None,
+                data=json.loads(row[4] or '{}'),
+                attempts=row[5],
+            )
+            for row in rows
+        ]
+        if jobs:
+            logger.info("♻️ Восстановлено незавершённых задач: %s", len(jobs))
+        return jobs
+
+    def counts(self) -> Dict[str, int]:
+        return dict(self._query("SELECT state, COUNT(*) FROM jobs GROUP BY state"))
+
+    def prune(self) -> None:
+        """Удаляет завершённые задачи старше retention_days."""
+        if self.retention_days <= 0:
+            return
+        cutoff = time.time() - self.retention_days * 86400
+        cur = self._execute(
+            "DELETE FROM jobs WHERE state IN (?, ?) AND updated_at < ?", (*TERMINAL, cutoff)
+        )
+        if cur.rowcount:
+            logger.info("🧹 Удалено старых задач из журнала: %s", cur.rowcount)
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
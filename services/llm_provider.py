@@ -1,10 +1,12 @@
 from __future__ import annotations
 
 import asyncio
+import copy
 import json
 import logging
 import os
 import re
+import threading
 import time
 from dataclasses import dataclass
 from datetime import datetime, timezone, timedelta
@@ -28,6 +30,9 @@ except ImportError as e:
 
 logger = logging.getLogger("llm")
 
+# Retry вешается на класс Models один раз на процесс, а не при каждом создании провайдера
+_RETRY_INSTALLED = False
+
 # Убираем настройки безопасности пока не разберемся с правильным синтаксисом
 # SAFETY_SETTINGS = None
 
@@ -96,11 +101,19 @@ class GeminiProvider:
         self.used_keys = []  # Инициализируем список использованных ключей
         self.exhausted_keys_timestamp = {}  # Инициализируем timestamps исчерпанных ключей
         self.last_quota_reset_check = time.time()
+        # Клиенты (и их HTTP-соединения) по ключу API — переиспользуются между запросами и сессиями
+        self._clients: dict = {}
+        self._clients_lock = threading.Lock()
+        self._session_lock = threading.Lock()
         # Настройка retry для Gemini API
         self._setup_retry()
     
     def _setup_retry(self):
         """Настройка автоматических повторов для Gemini API"""
+        global _RETRY_INSTALLED
+        if _RETRY_INSTALLED:
+            return
+
         def is_retriable(exception):
             if hasattr(exception, 'code'):
                 return exception.code in {429, 503}  # Quota exceeded, Service unavailable
@@ -117,13 +130,43 @@ class GeminiProvider:
                 deadline=60.0   # общий timeout 1 минута
             )(original_method)
             genai.models.Models.generate_content = retried_method
+            _RETRY_INSTALLED = True
             logger.info("✅ Retry настроен для Gemini API (timeout: 60s)")
 
     def _get_client(self) -> genai.Client:
         if not self.current_api_key:
             raise RuntimeError("GEMINI_API_KEY is not set in the environment")
         
-        return genai.Client(api_key=self.current_api_key)
+        with self._clients_lock:
+            client = self._clients.get(self.current_api_key)
+            if client is None:
+                client = genai.Client(api_key=self.current_api_key)
+                self._clients[self.current_api_key] = client
+            return client
+
+    def session(self) -> "GeminiProvider":
+        """
+        Провайдер на одно сообщение: свой текущий ключ и список использованных ключей, так что
+        переключение ключа в одном посте не сбивает параллельные. Общие с реестровым экземпляром —
+        клиенты (_clients) и отметки исчерпанных ключей (exhausted_keys_timestamp).
+        """
+        with self._session_lock:
+            self._check_and_reset_quota()
+            session = copy.copy(self)
+            session.used_keys = list(self.exhausted_keys_timestamp)
+        session.reset_for_new_message()
+        return session
+
+    def close(self):
+        """Закрывает HTTP-клиентов всех использованных ключей."""
+        for client in self._clients.values():
+            closer = getattr(client, 'close', None)
+            if closer is not None:
+                try:
+                    closer()
+                except Exception as e:
+                    logger.debug("Закрытие клиента Gemini: %s", e)
+        self._clients.clear()
     
     def _switch_to_next_key(self) -> bool:
         """Переключение на следующий доступный API ключ"""
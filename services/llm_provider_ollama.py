@@ -8,10 +8,13 @@ import os
 from typing import Dict, Optional
 import httpx
 import re
+import time
 from pathlib import Path
 
 logger = logging.getLogger(__name__)
 
+AVAILABILITY_TTL = 60.0
+
 
 def _log_ollama_unable_to_load(err_body: str, model: str) -> None:
     if "unable to load model" in (err_body or "").lower():
@@ -29,15 +32,24 @@ class OllamaProvider:
     def __init__(self, model: str = "gpt-oss-20b-MXFP4", base_url: str = "http://localhost:11434"):
         self.base_url = base_url.rstrip('/')
         self.model = model
-        # Увеличиваем таймаут для больших моделей (до 10 минут)
-        self.client = httpx.AsyncClient(timeout=600.0)
+        # Увеличиваем таймаут для больших моделей (до 10 минут); соединения держатся открытыми
+        # между запросами (экземпляр живёт весь процесс — см. llm_registry)
+        self.client = httpx.AsyncClient(
+            timeout=600.0,
+            limits=httpx.Limits(max_connections=8, max_keepalive_connections=4, keepalive_expiry=120.0),
+        )
+        # Успешная проверка /api/tags действует AVAILABILITY_TTL секунд — не на каждый запрос
+        self._available_until = 0.0
         logger.info(f"🤖 OllamaProvider инициализирован: {model} @ {base_url}")
     
     async def _check_ollama_available(self) -> bool:
         """Проверяет доступность Ollama сервера"""
+        if time.monotonic() < self._available_until:
+            return True
         try:
             response = await self.client.get(f"{self.base_url}/api/tags", timeout=5)
             if response.status_code == 200:
+                self._available_until = time.monotonic() + AVAILABILITY_TTL
                 models = response.json().get('models', [])
                 model_names = [m.get('name', '') for m in models]
                 logger.info(f"✅ Ollama доступен. Доступные модели: {', '.join(model_names[:5])}")
@@ -125,6 +137,8 @@ class OllamaProvider:
                 else:
                     raise
             except Exception as e:
+                # Сервер мог упасть — следующая попытка снова проверит /api/tags
+                self._available_until = 0.0
                 logger.error(f"Неожиданная ошибка (попытка {attempt + 1}/{max_retries}): {e}")
                 if attempt < max_retries - 1:
                     await asyncio.sleep(5)
@@ -313,11 +327,7 @@ class OllamaProvider:
             'tags': ['новости']
         }
 		
-    def close(self):
-        """Закрывает http-клиент."""
-        # httpx.AsyncClient закрывается через async with, явное закрытие не нужно
-        pass
-
-    def __del__(self):
-        self.close()
+    async def aclose(self):
+        """Закрывает http-клиент и его пул соединений."""
+        await self.client.aclose()
 
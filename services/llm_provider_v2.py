@@ -4,6 +4,7 @@ LLM Provider V2 - промпты для нового дизайна (HTML+Seleni
 """
 
 import asyncio
+import copy
 import logging
 import os
 import re
@@ -72,6 +73,30 @@ class GeminiProviderV2:
         
         logger.info(f"🤖 GeminiProviderV2 инициализирован: {self.model}")
 
+    def session(self) -> "GeminiProviderV2":
+        """
+        Провайдер на одно сообщение: своя текущая модель и список fallback, так что переход на
+        fallback из-за квоты в одном посте не сбрасывается и не повторяется параллельным постом.
+        genai-конфигурация и модель по умолчанию — общие с реестровым экземпляром.
+        """
+        session = copy.copy(self)
+        session.model = self.original_model
+        session.fallback_models = [m for m in FALLBACK_MODELS if m != self.original_model]
+        if self.model != self.original_model:
+            session._model_instance = session._build_model()
+        return session
+
+    def reset_for_new_message(self):
+        """
+        Экземпляр живёт весь процесс (см. llm_registry): fallback-модель, выбранная из-за
+        квоты или таймаута на прошлом посте, не должна оставаться навсегда.
+        """
+        if self.model != self.original_model:
+            logger.info("🔄 Возвращаемся к основной модели %s", self.original_model)
+            self.model = self.original_model
+            self._model_instance = self._build_model()
+        self.fallback_models = [m for m in FALLBACK_MODELS if m != self.original_model]
+
     def _build_model(self):
         return genai.GenerativeModel(
             self.model,
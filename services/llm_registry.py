@@ -0,0 +1,141 @@
+"""
+Реестр LLM-провайдеров: один экземпляр на процесс вместо нового на каждое сообщение.
+
+Раньше process_message вызывал create_llm_provider на каждый пост: Gemini V2 заново делал
+genai.configure и собирал GenerativeModel, V1 ещё раз оборачивал Models.generate_content
+в retry, Ollama открывал новый httpx.AsyncClient, который никто не закрывал. Реестр
+создаёт провайдер при первом запросе и дальше отдаёт тот же (с его пулом соединений),
+ведёт состояние здоровья по результатам вызовов и закрывает клиентов при остановке.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import inspect
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+from services.video_factory import create_llm_provider
+
+logger = logging.getLogger("llm_registry")
+
+# Столько ошибок подряд — провайдер считается недоступным (down), меньше — degraded
+DOWN_AFTER_FAILURES = 3
+
+
+@dataclass
+class ProviderHealth:
+    consecutive_failures: int = 0
+    total_calls: int = 0
+    total_failures: int = 0
+    last_success: Optional[float] = None
+    last_error: Optional[str] = None
+
+    @property
+    def status(self) -> str:
+        if self.consecutive_failures == 0:
+            return 'ok'
+        return 'down' if self.consecutive_failures >= DOWN_AFTER_FAILURES else 'degraded'
+
+
+class LLMRegistry:
+    """Провайдеры по ключу (версия промптов, Ollama); создаются лениво, живут до aclose()."""
+
+    def __init__(self, config: dict):
+        self.config = config
+        self._providers: Dict[Tuple, Any] = {}
+        self._health: Dict[Tuple, ProviderHealth] = {}
+        self._lock = threading.Lock()
+
+    def get(self, force_version: str = None, use_ollama: bool = False):
+        key = (force_version, use_ollama)
+        with self._lock:
+            provider = self._providers.get(key)
+            if provider is None:
+                # Ошибка создания (нет ключа API) не кэшируется — следующий пост попробует снова
+                provider = create_llm_provider(self.config, force_version=force_version, use_ollama=use_ollama)
+                self._providers[key] = provider
+                self._health[key] = ProviderHealth()
+                logger.info("🔌 LLM провайдер создан и закреплён: %s", type(provider).__name__)
+            return provider
+
+    @staticmethod
+    def session(provider):
+        """
+        Провайдер на одно сообщение (provider.session()): модель, fallback и текущий ключ —
+        свои, HTTP-клиенты — общие. Провайдеры без состояния на сообщение отдаются как есть.
+        Здоровье учитывается по реестровому экземпляру (record_success/record_failure(provider)).
+        """
+        factory = getattr(provider, 'session', None)
+        return factory() if factory is not None else provider
+
+    def _key_of(self, provider) -> Optional[Tuple]:
+        for key, candidate in self._providers.items():
+            if candidate is provider:
+                return key
+        return None
+
+    def record_success(self, provider) -> None:
+        health = self._health.get(self._key_of(provider))
+        if health is None:
+            return
+        if health.status != 'ok':
+            logger.info("✅ LLM %s снова отвечает", type(provider).__name__)
+        health.total_calls += 1
+        health.consecutive_failures = 0
+        health.last_success = time.time()
+
+    def record_failure(self, provider, error: Exception) -> None:
+        health = self._health.get(self._key_of(provider))
+        if health is None:
+            return
+        before = health.status
+        health.total_calls += 1
+        health.total_failures += 1
+        health.consecutive_failures += 1
+        health.last_error = str(error)[:300]
+        if health.status != before:
+            logger.warning("⚠️ LLM %s: состояние %s (%s ошибок подряд)", type(provider).__name__, health.status, health.consecutive_failures)
+
+    def health(self) -> Dict[str, dict]:
+        result = {}
+        for (version, ollama), h in self._health.items():
+            name = f"{type(self._providers[(version, ollama)]).__name__}:{version or 'auto'}{':ollama' if ollama else ''}"
+            result[name] = {
+                'status': h.status,
+                'calls': h.total_calls,
+                'failures': h.total_failures,
+                'last_error': h.last_error,
+            }
+        return result
+
+    async def aclose(self) -> None:
+        """Закрывает HTTP-клиентов провайдеров (вызывается при остановке сервиса)."""
+        with self._lock:
+            providers = list(self._providers.values())
+            self._providers.clear()
+            self._health.clear()
+        for provider in providers:
+            closer = getattr(provider, 'aclose', None) or getattr(provider, 'close', None)
+            if closer is None:
+                continue
+            try:
+                result = closer()
+                if inspect.isawaitable(result):
+                    await asyncio.wait_for(result, timeout=5)
+            except Exception as e:
+                logger.debug("Закрытие LLM провайдера %s: %s", type(provider).__name__, e)
+
+
+_default: Optional[LLMRegistry] = None
+
+
+def default_registry(config: dict) -> LLMRegistry:
+    """Общий реестр процесса — для точек входа, которые не создают свой (локальный прогон)."""
+    global _default
+    if _default is None or _default.config is not config:
+        _default = LLMRegistry(config)
+    return _default
@@ -0,0 +1,196 @@
+"""
+Конвейер обработки постов: стадии с собственными очередями и лимитами параллельности.
+
+Раньше один queue_worker проводил сообщение целиком (LLM → рендер → загрузки), и медленная
+загрузка на YouTube задерживала рендер следующего поста. Здесь каждая стадия — asyncio.Queue
+и N воркеров; готовая задача передаётся в очередь следующей стадии. Стадии работают
+одновременно над разными постами, пропускная способность — как у самой медленной стадии,
+а не сумма всех. Очереди после первой ограничены: если рендер не успевает, воркеры LLM
+ждут места (backpressure), а не копят готовые тексты в памяти.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import itertools
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger("pipeline")
+
+_job_ids = itertools.count(1)
+
+
+@dataclass
+class Job:
+    """Пост в конвейере: вход из Telegram и результаты стадий в data."""
+
+    text: Optional[str]
+    media_path: Any
+    id: int = field(default_factory=lambda: next(_job_ids))
+    created_at: float = field(default_factory=time.monotonic)
+    data: Dict[str, Any] = field(default_factory=dict)
+    timings: Dict[str, float] = field(default_factory=dict)
+    # Последняя ошибка стадии («render: …»); сбрасывается, когда стадия проходит
+    error: Optional[str] = None
+
+
+# Обработчик стадии: возвращает задачу для следующей стадии или None — задача завершена
+StageHandler = Callable[[Job], Awaitable[Optional[Job]]]
+# Ошибка стадии: через сколько секунд повторить задачу на той же стадии (None — не повторять)
+FailureHandler = Callable[[str, Job, Exception], Optional[float]]
+
+
+class Stage:
+    """Очередь стадии и её воркеры; счётчики — для мониторинга глубины очередей."""
+
+    def __init__(self, name: str, handler: StageHandler, concurrency: int = 1, maxsize: int = 0):
+        self.name = name
+        self.handler = handler
+        self.concurrency = max(1, int(concurrency))
+        self.queue: asyncio.Queue[Job] = asyncio.Queue(maxsize=max(0, int(maxsize)))
+        self.next: Optional[Stage] = None
+        self.on_failure: Optional[FailureHandler] = None
+        self.in_flight = 0
+        self.retrying = 0
+        self.done = 0
+        self.failed = 0
+        self._workers: List[asyncio.Task] = []
+        self._retries: set = set()
+
+    def start(self) -> None:
+        for i in range(self.concurrency):
+            self._workers.append(asyncio.create_task(self._worker(), name=f"{self.name}-{i}"))
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self.queue.get()
+            self.in_flight += 1
+            started = time.monotonic()
+            try:
+                try:
+                    result = await self.handler(job)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self.failed += 1
+                    job.error = f"{self.name}: {e}"
+                    logger.exception("❌ Стадия %s: задача #%s не выполнена: %s", self.name, job.id, e)
+                    result = None
+                    delay = self.on_failure(self.name, job, e) if self.on_failure is not None else None
+                    if delay is not None:
+                        self._retry_later(job, delay)
+                else:
+                    self.done += 1
+                    job.error = None
+                job.timings[self.name] = time.monotonic() - started
+                if result is not None and self.next is not None:
+                    # Ожидание места в очереди следующей стадии — это и есть backpressure;
+                    # задача считается «в работе», пока не передана дальше (join() её не потеряет)
+                    await self.next.queue.put(result)
+            finally:
+                self.in_flight -= 1
+                self.queue.task_done()
+
+    def _retry_later(self, job: Job, delay: float) -> None:
+        logger.info("🔁 Стадия %s: повтор задачи #%s через %.0f с", self.name, job.id, delay)
+        self.retrying += 1
+
+        async def _requeue() -> None:
+            try:
+                await asyncio.sleep(delay)
+                await self.queue.put(job)
+            finally:
+                self.retrying -= 1
+
+        task = asyncio.create_task(_requeue(), name=f"{self.name}-retry-{job.id}")
+        self._retries.add(task)
+        task.add_done_callback(self._retries.discard)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'queued': self.queue.qsize(),
+            'in_flight': self.in_flight,
+            'retrying': self.retrying,
+            'done': self.done,
+            'failed': self.failed,
+        }
+
+    async def stop(self) -> None:
+        tasks = [*self._workers, *self._retries]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers.clear()
+
+
+class Pipeline:
+    """Цепочка стадий: submit() кладёт задачу в первую стадию."""
+
+    def __init__(self, stages: List[Stage], stats_interval: float = 0.0, on_failure: Optional[FailureHandler] = None):
+        if not stages:
+            raise ValueError("Конвейеру нужна хотя бы одна стадия")
+        self.stages = stages
+        for current, following in zip(stages, stages[1:]):
+            current.next = following
+        for stage in stages:
+            stage.on_failure = on_failure
+        self.stats_interval = float(stats_interval or 0)
+        self._stats_task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        for stage in self.stages:
+            stage.start()
+        if self.stats_interval > 0:
+            self._stats_task = asyncio.create_task(self._log_stats_loop(), name="pipeline-stats")
+        logger.info(
+            "🏗️ Конвейер запущен: %s",
+            " → ".join(f"{s.name}×{s.concurrency}" for s in self.stages),
+        )
+
+    def stage(self, name: str) -> Stage:
+        for stage in self.stages:
+            if stage.name == name:
+                return stage
+        raise KeyError(name)
+
+    async def submit(self, job: Job, stage: Optional[str] = None) -> None:
+        """В первую стадию или (восстановление после перезапуска) в стадию stage."""
+        target = self.stage(stage) if stage else self.stages[0]
+        await target.queue.put(job)
+        logger.info("📥 Задача #%s в очереди %s. %s", job.id, target.name, self.describe())
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {stage.name: stage.stats() for stage in self.stages}
+
+    def describe(self) -> str:
+        """Короткая строка для логов: «llm 1+2 | render 0+1 | …» (в очереди + в работе)."""
+        return " | ".join(f"{s.name} {s.queue.qsize()}+{s.in_flight}" for s in self.stages)
+
+    def idle(self) -> bool:
+        return all(s.queue.empty() and s.in_flight == 0 and s.retrying == 0 for s in self.stages)
+
+    async def join(self) -> None:
+        """Ждёт, пока все поставленные задачи пройдут все стадии."""
+        while True:
+            for stage in self.stages:
+                await stage.queue.join()
+            if self.idle():
+                return
+            # Задача ждёт повтора вне очередей — проверяем снова чуть позже
+            await asyncio.sleep(0.5)
+
+    async def _log_stats_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.stats_interval)
+            if not self.idle():
+                logger.info("📊 Конвейер: %s", self.describe())
+
+    async def stop(self) -> None:
+        if self._stats_task is not None:
+            self._stats_task.cancel()
+            self._stats_task = None
+        for stage in self.stages:
+            await stage.stop()
@@ -0,0 +1,140 @@
+"""
+Публикация готового ролика во все включённые направления одновременно.
+
+Раньше стадия публикации шла по очереди: YouTube (или Telegram), и только потом X —
+время публикации было суммой задержек всех направлений. Здесь каждое направление —
+отдельная корутина со своим таймаутом попытки и своими повторами; стадия длится
+столько, сколько самое медленное направление. Результат по каждому направлению
+(ok / failed / timeout, попытки, время, ошибка) возвращается для журнала задачи;
+при повторе задачи уже опубликованные направления пропускаются. Неотменяемое направление,
+прошлая попытка которого кончилась таймаутом, получает unknown: итог проверяют вручную.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger("publish")
+
+OK = 'ok'
+FAILED = 'failed'
+TIMEOUT = 'timeout'
+# Таймаут неотменяемой попытки: могла дойти до площадки, повтор опасен — проверить вручную
+UNKNOWN = 'unknown'
+
+
+class PublishError(Exception):
+    """Обязательное направление не опубликовано после всех попыток."""
+
+    def __init__(self, results: Dict[str, "PublishResult"]):
+        self.results = results
+        failed = ", ".join(f"{name}: {r.status}" for name, r in results.items() if r.status != OK)
+        super().__init__(f"Публикация не завершена ({failed})")
+
+
+@dataclass
+class PublishTarget:
+    """Направление публикации. call() возвращает ответ площадки; False — неудача."""
+
+    name: str
+    call: Callable[[], Awaitable[Any]]
+    timeout: float = 0.0
+    retries: int = 0
+    retry_delay: float = 10.0
+    # Неудача обязательного направления — ошибка стадии (повтор задачи конвейером)
+    required: bool = True
+    # False — call() нельзя отменить (синхронный клиент в потоке): после таймаута первая попытка
+    # ещё идёт, и повтор опубликовал бы пост дважды
+    retry_on_timeout: bool = True
+
+
+@dataclass
+class PublishResult:
+    status: str
+    attempts: int = 0
+    seconds: float = 0.0
+    error: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+async def _publish_one(target: PublishTarget) -> PublishResult:
+    started = time.monotonic()
+    attempts = max(1, int(target.retries) + 1)
+    status, error, made = FAILED, None, 0
+    for attempt in range(1, attempts + 1):
+        made = attempt
+        try:
+            if target.timeout > 0:
+                response = await asyncio.wait_for(target.call(), timeout=target.timeout)
+            else:
+                response = await target.call()
+            if response is not False:
+                logger.info("✅ %s: опубликовано за %.1f с", target.name, time.monotonic() - started)
+                return PublishResult(OK, attempt, round(time.monotonic() - started, 2))
+            status, error = FAILED, "площадка вернула отказ"
+        except asyncio.TimeoutError:
+            status, error = TIMEOUT, f"нет ответа за {target.timeout:g} с"
+            if not target.retry_on_timeout:
+                logger.warning("⚠️ %s: таймаут, попытка не отменяема — без повтора", target.name)
+                break
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            status, error = FAILED, str(e)[:500]
+        logger.warning("⚠️ %s: попытка %s/%s не удалась — %s", target.name, attempt, attempts, error)
+        if attempt < attempts:
+            await asyncio.sleep(target.retry_delay * 2 ** (attempt - 1))
+    logger.error("❌ %s: публикация не удалась (%s)", target.name, error)
+    return PublishResult(status, made, round(time.monotonic() - started, 2), error)
+
+
+async def fan_out(
+    targets: List[PublishTarget],
+    previous: Optional[Dict[str, Dict[str, Any]]] = None,
+) -> Dict[str, PublishResult]:
+    """
+    Публикует во все направления параллельно. previous — результаты прошлой попытки задачи
+    (из журнала): направления со статусом ok не повторяются. PublishError — если не удалось
+    хотя бы одно обязательное направление (unknown ошибкой не считается); results ошибки
+    содержат итог по всем.
+    """
+    previous = previous or {}
+    results: Dict[str, PublishResult] = {}
+    pending = []
+    for target in targets:
+        before = previous.get(target.name) or {}
+        if before.get('status') == OK:
+            logger.info("⏭️ %s: уже опубликовано в прошлой попытке", target.name)
+            results[target.name] = PublishResult(**before)
+        elif before.get('status') in (TIMEOUT, UNKNOWN) and not target.retry_on_timeout:
+            # Неотменяемая попытка прошлого раза могла дойти до площадки — не публикуем второй раз
+            logger.warning(
+                "⏭️ %s: прошлая попытка завершилась таймаутом, итог неизвестен — проверьте вручную", target.name
+            )
+            results[target.name] = PublishResult(
+                UNKNOWN, before.get('attempts', 0), before.get('seconds', 0.0),
+                "таймаут неотменяемой попытки — итог неизвестен, проверьте вручную",
+            )
+        else:
+            pending.append(target)
+
+    started = time.monotonic()
+    outcomes = await asyncio.gather(*(_publish_one(t) for t in pending))
+    results.update({t.name: r for t, r in zip(pending, outcomes)})
+    if pending:
+        logger.info(
+            "📬 Публикация за %.1f с: %s",
+            time.monotonic() - started,
+            ", ".join(f"{name} {r.status}" for name, r in results.items()),
+        )
+
+    # unknown повтором не исправить: иначе задача падала бы до job_max_attempts при готовом остальном
+    if any(results[t.name].status not in (OK, UNKNOWN) for t in targets if t.required):
+        raise PublishError(results)
+    return results
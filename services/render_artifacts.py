@@ -0,0 +1,184 @@
+"""
+Кэш промежуточных артефактов рендера по задаче (state_dir/render_jobs/<key>/).
+
+Задача определяется медиа (отпечаток содержимого файлов) и параметрами рендера,
+но не текстом. Поэтому правка опечатки в посте или новый ответ LLM попадают в ту же
+задачу: перекодированные медиа, результат smart_crop и (у генераторов с послойным
+рендером) готовый слой медиа берутся из кэша — заново собирается только текстовый
+оверлей. Выбор оформления (шаблон, тема, музыка) в задаче не хранится: он зависит от
+содержимого поста, а не только от медиа.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import uuid
+from dataclasses import asdict
+from pathlib import Path
+from typing import Iterable, Optional
+
+logger = logging.getLogger("render_artifacts")
+
+_FINGERPRINT_CHUNK = 1 << 20  # 1 МБ с начала и с конца файла
+
+# Одну задачу могут открыть одновременно несколько рендеров (render_workers, prepare рядом с compose):
+# запись meta.json — под замком каталога и со слиянием с тем, что уже на диске
+_meta_locks: dict = {}
+_meta_locks_guard = threading.Lock()
+
+
+def _meta_lock(directory: Path) -> threading.Lock:
+    with _meta_locks_guard:
+        return _meta_locks.setdefault(str(directory), threading.Lock())
+
+
+def media_fingerprint(path: str) -> str:
+    """Отпечаток содержимого: размер + sha1 первого и последнего мегабайта (без чтения всего видео)."""
+    p = Path(path)
+    h = hashlib.sha1()
+    try:
+        size = p.stat().st_size
+        h.update(str(size).encode())
+        with open(p, 'rb') as f:
+            h.update(f.read(_FINGERPRINT_CHUNK))
+            if size > 2 * _FINGERPRINT_CHUNK:
+                f.seek(-_FINGERPRINT_CHUNK, os.SEEK_END)
+                h.update(f.read(_FINGERPRINT_CHUNK))
+    except OSError:
+        h.update(str(p).encode())
+    h.update(p.suffix.lower().encode())
+    return h.hexdigest()
+
+
+class RenderJob:
+    """Каталог артефактов одной задачи; meta.json — мелкие значения (layout, тема, музыка)."""
+
+    def __init__(self, directory: Path, key: str):
+        self.dir = directory
+        self.key = key
+        self._meta_path = directory / 'meta.json'
+        self._meta = self._read_meta()
+
+    def _read_meta(self) -> dict:
+        try:
+            return json.loads(self._meta_path.read_text('utf-8'))
+        except (OSError, ValueError):
+            return {}
+
+    # ---------- мелкие значения ----------
+
+    def get(self, name: str, default=None):
+        return self._meta.get(name, default)
+
+    def put(self, name: str, value) -> None:
+        with _meta_lock(self.dir):
+            # Значения, записанные другим рендером этой задачи, не теряются
+            meta = self._read_meta()
+            meta[name] = value
+            self._meta = meta
+            tmp = self.dir / f"meta_{os.getpid()}_{uuid.uuid4().hex[:8]}.tmp"
+            try:
+                tmp.write_text(json.dumps(meta, ensure_ascii=False, indent=2), 'utf-8')
+                os.replace(tmp, self._meta_path)
+            finally:
+                tmp.unlink(missing_ok=True)
+
+    def media_layout(self, media_path: str):
+        """compute_media_layout с кэшем: детекция лиц на видео — самая дорогая часть подготовки."""
+        from services.smart_crop import MediaLayout, compute_media_layout
+
+        name = f"layout:{media_fingerprint(media_path)}"
+        cached = self.get(name)
+        if cached:
+            try:
+                return MediaLayout(**cached)
+            except TypeError:
+                pass
+        layout = compute_media_layout(media_path)
+        self.put(name, asdict(layout))
+        return layout
+
+    # ---------- файлы ----------
+
+    def file(self, name: str) -> Optional[Path]:
+        """Готовый артефакт или None."""
+        p = self.dir / name
+        return p if p.is_file() and p.stat().st_size > 0 else None
+
+    def path(self, name: str) -> Path:
+        """
+        Уникальный временный файл для нового артефакта (публиковать через commit(name, tmp));
+        у каждого писателя свой — параллельные рендеры одной задачи не пишут в один файл.
+        Расширение сохраняется для ffmpeg.
+        """
+        return self.dir / f"part_{os.getpid()}_{uuid.uuid4().hex[:8]}_{name}"
+
+    def commit(self, name: str, tmp: Path) -> Path:
+        final = self.dir / name
+        os.replace(tmp, final)
+        return final
+
+    def discard(self, tmp: Path) -> None:
+        Path(tmp).unlink(missing_ok=True)
+
+
+class RenderArtifacts:
+    """Хранилище задач в state_dir/render_jobs с ограничением по числу задач (вытесняются самые старые)."""
+
+    def __init__(self, config: dict):
+        v = config.get('VIDEO', {})
+        self.enabled = str(v.get('render_artifacts', 'true')).strip().lower() in ('1', 'true', 'yes', 'on')
+        self.max_jobs = int(v.get('render_artifacts_max_jobs', 30) or 0)
+        self.root = Path(config['PATHS'].get('state_dir', 'state')) / 'render_jobs'
+
+    def job_key(self, media_paths: Iterable[str], params: dict) -> str:
+        h = hashlib.sha1()
+        for p in media_paths:
+            h.update(media_fingerprint(p).encode())
+        h.update(json.dumps(params, sort_keys=True, default=str).encode())
+        return h.hexdigest()[:20]
+
+    def open_job(self, media_paths: Iterable[str], params: dict) -> Optional[RenderJob]:
+        """Задача по медиа; у поста без медиа переиспользовать нечего — None (иначе все такие посты делили бы одну задачу)."""
+        media_paths = list(media_paths)
+        if not self.enabled or not media_paths:
+            return None
+        key = self.job_key(media_paths, params)
+        directory = self.root / key
+        fresh = not directory.exists()
+        directory.mkdir(parents=True, exist_ok=True)
+        # mtime каталога — время последнего использования для вытеснения
+        os.utime(directory, None)
+        if fresh:
+            self.prune()
+        else:
+            logger.info("♻️ Артефакты рендера найдены: %s", key)
+        return RenderJob(directory, key)
+
+    def prune(self) -> None:
+        if self.max_jobs <= 0 or not self.root.exists():
+            return
+        jobs = sorted(
+            (d for d in self.root.iterdir() if d.is_dir()),
+            key=lambda d: d.stat().st_mtime,
+            reverse=True,
+        )
+        for stale in jobs[self.max_jobs:]:
+            shutil.rmtree(stale, ignore_errors=True)
+            logger.info("🧹 Удалены старые артефакты рендера: %s", stale.name)
+
+
+def media_list(media_path) -> list:
+    """Нормализует media_path (None / путь / список) в список существующих файлов."""
+    if isinstance(media_path, (list, tuple)):
+        paths = [str(p) for p in media_path if p]
+    elif media_path:
+        paths = [str(media_path)]
+    else:
+        paths = []
+    return [p for p in paths if Path(p).is_file()]
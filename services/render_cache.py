@@ -0,0 +1,122 @@
+"""
+Контент-адресуемый кэш готовых роликов (state_dir/render_cache/<key>.mp4).
+
+Ключ — хэш всего, от чего зависит картинка и звук: шаблон (с содержимым файла), тема,
+тексты, отпечатки медиа, длительность, fps, размер кадра, музыкальный трек.
+Повторы одного и того же поста (startup_backfill, дубли poll-цикла, ручной перезапуск)
+отдают готовый MP4 сразу, без захвата. Файлы-спутники ролика (обложка, спрайт) хранятся
+рядом как <key>.<suffix> и восстанавливаются вместе с ним. Размер кэша ограничен,
+вытесняются давно не использованные файлы (LRU по mtime).
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+from pathlib import Path
+from typing import Dict, Optional, Sequence
+
+from services.render_artifacts import media_fingerprint
+
+logger = logging.getLogger("render_cache")
+
+
+def file_digest(path: Optional[str]) -> str:
+    """Отпечаток файла для ключа (шаблон, музыка); пустая строка, если файла нет."""
+    if not path or not Path(path).is_file():
+        return ''
+    return media_fingerprint(path)
+
+
+def stable_choice(seed: str, options: Sequence):
+    """Детерминированный «случайный» выбор: один и тот же пост всегда получает один и тот же вариант."""
+    if not options:
+        return None
+    n = int(hashlib.sha1(seed.encode('utf-8')).hexdigest()[:12], 16)
+    return options[n % len(options)]
+
+
+def make_key(**parts) -> str:
+    """sha256 по частям ключа; media_paths заменяются отпечатками содержимого."""
+    media = parts.pop('media_paths', None) or []
+    parts['media'] = [media_fingerprint(p) for p in media]
+    blob = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(blob.encode('utf-8')).hexdigest()
+
+
+class RenderCache:
+    """Готовые MP4 по ключу с LRU-вытеснением по суммарному размеру."""
+
+    def __init__(self, config: dict):
+        v = config.get('VIDEO', {})
+        self.enabled = str(v.get('render_cache', 'true')).strip().lower() in ('1', 'true', 'yes', 'on')
+        self.max_bytes = int(float(v.get('render_cache_max_mb', 2048) or 0) * 1024 * 1024)
+        self.root = Path(config['PATHS'].get('state_dir', 'state')) / 'render_cache'
+
+    def _entry(self, key: str) -> Path:
+        return self.root / f"{key}.mp4"
+
+    def _side_entries(self, key: str) -> list:
+        return [p for p in self.root.glob(f"{key}.*") if p.suffix not in ('.mp4', '.part')]
+
+    @staticmethod
+    def _copy(src: Path, dst: Path) -> None:
+        # Копия, не жёсткая ссылка: перезапись файла в outputs/ (ffmpeg -y) не должна портить кэш
+        dst.unlink(missing_ok=True)
+        shutil.copy2(src, dst)
+
+    def lookup(self, key: str, output_path: str) -> Optional[str]:
+        """Попадание — ролик появляется по output_path (копия записи кэша) и путь возвращается."""
+        if not self.enabled:
+            return None
+        entry = self._entry(key)
+        if not entry.is_file():
+            return None
+        try:
+            out = Path(output_path)
+            out.parent.mkdir(parents=True, exist_ok=True)
+            if out.resolve() != entry.resolve():
+                self._copy(entry, out)
+            # Спутники: <key>.thumb.jpg → <stem>_thumb.jpg
+            for side in self._side_entries(key):
+                self._copy(side, out.with_name(f"{out.stem}_{side.name[len(key) + 1:]}"))
+            os.utime(entry, None)
+            logger.info("⚡ Рендер из кэша: %s → %s", key[:12], out)
+            return str(out)
+        except OSError as e:
+            logger.warning("⚠️ Кэш рендера недоступен (%s): %s", key[:12], e)
+            return None
+
+    def store(self, key: str, video_path: str, side_files: Optional[Dict[str, str]] = None) -> None:
+        """side_files — {суффикс: путь} файлов-спутников (обложка, спрайт), кладутся рядом с роликом."""
+        if not self.enabled or not video_path or not Path(video_path).is_file():
+            return
+        try:
+            self.root.mkdir(parents=True, exist_ok=True)
+            for suffix, path in (side_files or {}).items():
+                if Path(path).is_file():
+                    shutil.copy2(path, self.root / f"{key}.{suffix}")
+            entry = self._entry(key)
+            tmp = entry.with_suffix('.part')
+            shutil.copy2(video_path, tmp)
+            os.replace(tmp, entry)
+            logger.info("💾 Ролик сохранён в кэш рендера: %s", key[:12])
+            self.evict()
+        except OSError as e:
+            logger.warning("⚠️ Не удалось сохранить ролик в кэш рендера: %s", e)
+
+    def evict(self) -> None:
+        if self.max_bytes <= 0 or not self.root.exists():
+            return
+        entries = sorted(self.root.glob('*.mp4'), key=lambda p: p.stat().st_mtime, reverse=True)
+        total = 0
+        for p in entries:
+            total += p.stat().st_size
+            if total > self.max_bytes:
+                for side in self._side_entries(p.stem):
+                    side.unlink(missing_ok=True)
+                p.unlink(missing_ok=True)
+                logger.info("🧹 Вытеснен из кэша рендера: %s", p.stem[:12])
@@ -0,0 +1,131 @@
+"""
+Пул процессов для рендеров V1 (MoviePy).
+
+Покадровая сборка CompositeVideoClip — чистый Python под GIL: в одном интерпретаторе
+с Telethon и запросами к LLM она отнимает у них ядро. В режиме пула каждая задача V1
+(конфиг + входы) уходит в отдельный spawn-процесс со своим состоянием MoviePy; композер
+создаётся в процессе один раз и переиспользуется. Логи воркеров идут через очередь и
+выводятся основным процессом теми же обработчиками, результат — путь к ролику.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import atexit
+import logging
+import logging.handlers
+import multiprocessing as mp
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+logger = logging.getLogger("render_pool")
+
+# Внутри воркера: композер рендерит сам, а не отправляет задачу в пул ещё раз
+IN_WORKER = False
+
+_composers: dict = {}
+# Один event loop на воркер: долгоживущие ресурсы композера (общий Playwright) привязаны к циклу
+_worker_loop: Optional[asyncio.AbstractEventLoop] = None
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_workers = 0
+_listener: Optional[logging.handlers.QueueListener] = None
+_lock = threading.Lock()
+
+
+class _ForwardHandler(logging.Handler):
+    """Запись из воркера → одноимённый логгер основного процесса (уровни и обработчики — как обычно)."""
+
+    def handle(self, record: logging.LogRecord) -> bool:
+        target = logging.getLogger(record.name)
+        if target.isEnabledFor(record.levelno):
+            target.handle(record)
+        return True
+
+    def emit(self, record: logging.LogRecord) -> None:  # pragma: no cover - handle() переопределён
+        pass
+
+
+def _config_payload(config) -> tuple:
+    return {name: dict(section) for name, section in config.items()}, getattr(config, '_parsed', None)
+
+
+def _worker_init(log_queue, level: int) -> None:
+    global IN_WORKER
+    IN_WORKER = True
+    root = logging.getLogger()
+    root.handlers.clear()
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(level)
+
+
+def _worker_render(composer_cls, payload: tuple, args: tuple) -> str:
+    """Тело задачи в воркере: композер на (класс, конфиг) создаётся один раз на процесс."""
+    global _worker_loop
+    from services.config_loader import ConfigDict
+
+    sections, parsed = payload
+    key = (composer_cls.__module__, composer_cls.__qualname__, repr(sorted(sections.get('VIDEO', {}).items())))
+    composer = _composers.get(key)
+    if composer is None:
+        config = ConfigDict(sections)
+        config._parsed = parsed
+        composer = composer_cls(config)
+        _composers[key] = composer
+    if _worker_loop is None:
+        _worker_loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(_worker_loop)
+    return _worker_loop.run_until_complete(composer.compose(*args))
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    global _pool, _pool_workers, _listener
+    with _lock:
+        if _pool is not None and _pool_workers == workers:
+            return _pool
+        _shutdown_locked()
+        ctx = mp.get_context('spawn')
+        log_queue = ctx.Queue()
+        _listener = logging.handlers.QueueListener(log_queue, _ForwardHandler(), respect_handler_level=False)
+        _listener.start()
+        _pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=ctx,
+            initializer=_worker_init,
+            initargs=(log_queue, logging.getLogger().getEffectiveLevel()),
+        )
+        _pool_workers = workers
+        logger.info("🏭 Пул рендера V1: %s процессов", workers)
+        return _pool
+
+
+def _shutdown_locked() -> None:
+    global _pool, _listener
+    if _pool is not None:
+        _pool.shutdown(wait=True, cancel_futures=True)
+        _pool = None
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def shutdown() -> None:
+    with _lock:
+        _shutdown_locked()
+
+
+atexit.register(shutdown)
+
+
+async def render_in_pool(composer_cls, config, workers: int, *args) -> str:
+    """compose(*args) композера composer_cls в процессе пула; ошибка воркера пробрасывается как есть."""
+    pool = _get_pool(workers)
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(pool, _worker_render, composer_cls, _config_payload(config), args)
+    except BrokenProcessPool:
+        # Процесс воркера упал (OOM, сигнал) — следующий рендер получит новый пул
+        logger.error("❌ Пул рендера V1 сломан — будет пересоздан")
+        shutdown()
+        raise
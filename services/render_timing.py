@@ -0,0 +1,167 @@
+"""
+Покадровые тайминги захвата V2.
+
+Каждая фаза кадра (seek, пауза, скриншот CDP, base64, imdecode, конвертация, resize, encode)
+пишется в компактный float32-массив [кадры × фазы]. По окончании задачи — сводка
+p50/p95/max по фазам, число таймаутов seek и потерянных кадров. Массив можно
+сохранить в .npz и сравнивать движки захвата между собой.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+
+logger = logging.getLogger("render_timing")
+
+PHASES = ("seek", "settle", "screenshot", "b64decode", "imdecode", "convert", "resize", "encode", "thumbs")
+_PHASE_INDEX = {name: i for i, name in enumerate(PHASES)}
+
+
+class CaptureTimings:
+    """Тайминги одного прохода захвата (ролик целиком или один сегмент)."""
+
+    def __init__(self, n_frames: int, engine: str = "cdp"):
+        self.engine = engine
+        self.samples = np.zeros((max(0, n_frames), len(PHASES)), dtype=np.float32)
+        self.count = 0
+        self.seek_timeouts = 0
+        self.dropped_frames = 0
+        self.started_at = time.perf_counter()
+        self.wall_seconds = 0.0
+        self._row = -1
+        self._last = 0.0
+
+    def start_frame(self) -> None:
+        if self.count >= len(self.samples):
+            # Запас на случай, если кадров оказалось больше расчётного
+            extra = np.zeros((64, len(PHASES)), dtype=np.float32)
+            self.samples = np.concatenate([self.samples, extra])
+        self._row = self.count
+        self.count += 1
+        self._last = time.perf_counter()
+
+    def mark(self, phase: str) -> None:
+        """Записывает время с предыдущей отметки в фазу phase текущего кадра."""
+        now = time.perf_counter()
+        if self._row >= 0:
+            self.samples[self._row, _PHASE_INDEX[phase]] += now - self._last
+        self._last = now
+
+    def finish(self) -> "CaptureTimings":
+        self.wall_seconds = time.perf_counter() - self.started_at
+        return self
+
+    @classmethod
+    def merge(cls, parts: Iterable["CaptureTimings"]) -> "CaptureTimings":
+        """Сводит тайминги сегментов в один объект (wall — максимум: сегменты идут параллельно)."""
+        parts = list(parts)
+        merged = cls(0, engine=parts[0].engine if parts else "cdp")
+        if not parts:
+            return merged
+        merged.samples = np.concatenate([p.samples[: p.count] for p in parts])
+        merged.count = len(merged.samples)
+        merged.seek_timeouts = sum(p.seek_timeouts for p in parts)
+        merged.dropped_frames = sum(p.dropped_frames for p in parts)
+        merged.wall_seconds = max(p.wall_seconds for p in parts)
+        return merged
+
+    def summary(self) -> Dict[str, object]:
+        data = self.samples[: self.count] * 1000.0
+        phases: Dict[str, Dict[str, float]] = {}
+        for name, i in _PHASE_INDEX.items():
+            col = data[:, i] if self.count else np.zeros(1, np.float32)
+            phases[name] = {
+                "p50_ms": round(float(np.percentile(col, 50)), 2),
+                "p95_ms": round(float(np.percentile(col, 95)), 2),
+                "max_ms": round(float(col.max()), 2),
+            }
+        frame_total = data.sum(axis=1) if self.count else np.zeros(1, np.float32)
+        return {
+            "engine": self.engine,
+            "frames": self.count,
+            "seek_timeouts": self.seek_timeouts,
+            "dropped_frames": self.dropped_frames,
+            "wall_seconds": round(self.wall_seconds, 3),
+            "frame_p50_ms": round(float(np.percentile(frame_total, 50)), 2),
+            "frame_p95_ms": round(float(np.percentile(frame_total, 95)), 2),
+            "phases": phases,
+        }
+
+    def log_summary(self, label: str) -> None:
+        s = self.summary()
+        logger.info(
+            "⏱️ Захват %s [%s]: %s кадров за %.2f с, кадр p50=%.1f мс p95=%.1f мс, "
+            "таймаутов seek=%s, потеряно кадров=%s",
+            label, s["engine"], s["frames"], s["wall_seconds"],
+            s["frame_p50_ms"], s["frame_p95_ms"], s["seek_timeouts"], s["dropped_frames"],
+        )
+        for name, v in s["phases"].items():
+            logger.info(
+                "   %-10s p50=%7.2f  p95=%7.2f  max=%7.2f мс",
+                name, v["p50_ms"], v["p95_ms"], v["max_ms"],
+            )
+
+    def save(self, out_dir: str, name: str) -> Optional[Path]:
+        """Сохраняет сырой массив + сводку (.npz и .json) для бенчмарков движков захвата."""
+        try:
+            d = Path(out_dir)
+            d.mkdir(parents=True, exist_ok=True)
+            npz_path = d / f"{name}.npz"
+            np.savez_compressed(
+                npz_path,
+                samples=self.samples[: self.count],
+                phases=np.array(PHASES),
+                engine=np.array(self.engine),
+                seek_timeouts=np.array(self.seek_timeouts),
+                dropped_frames=np.array(self.dropped_frames),
+                wall_seconds=np.array(self.wall_seconds),
+            )
+            (d / f"{name}.json").write_text(
+                json.dumps(self.summary(), ensure_ascii=False, indent=2), encoding="utf-8"
+            )
+            return npz_path
+        except Exception as e:
+            logger.warning("⚠️ Не удалось сохранить тайминги %s: %s", name, e)
+            return None
+
+
+class LoopLagProbe:
+    """
+    Замер задержки event loop на время рендера: фоновая задача спит interval и
+    фиксирует, насколько позже она проснулась. Большой lag — значит что-то блокирует loop
+    (и Telethon/очередь в это время стоят).
+    """
+
+    def __init__(self, label: str, interval: float = 0.05):
+        self.label = label
+        self.interval = interval
+        self.max_lag = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            self.max_lag = max(self.max_lag, loop.time() - started - self.interval)
+
+    async def __aenter__(self) -> "LoopLagProbe":
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        level = logging.WARNING if self.max_lag > 0.1 else logging.INFO
+        logger.log(level, "⏱️ Макс. задержка event loop (%s): %.1f мс", self.label, self.max_lag * 1000)
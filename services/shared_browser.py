@@ -0,0 +1,106 @@
+"""
+Долгоживущий Chromium (Playwright) для анимированного текста V1.
+
+Браузер запускается один раз на процесс (и на event loop — объекты Playwright привязаны
+к циклу, в котором созданы), страница переиспользуется между задачами. Анимация
+шагается детерминированно: все Web Animations (CSS animations/transitions) ставятся на
+паузу и получают currentTime кадра, скриншот декодируется сразу в numpy — без
+wait_for_timeout по реальному времени и без промежуточных файлов.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger("shared_browser")
+
+_SEEK_JS = """
+(t) => {
+  for (const a of document.getAnimations()) { a.pause(); a.currentTime = t; }
+  return new Promise(r => requestAnimationFrame(() => r(true)));
+}
+"""
+
+
+class SharedBrowser:
+    """Один браузер и одна страница; доступ к странице — под asyncio.Lock."""
+
+    def __init__(self):
+        self._playwright = None
+        self._browser = None
+        self._page = None
+        self._viewport: Optional[Tuple[int, int]] = None
+        self._loop = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    def _bind_loop(self) -> asyncio.Lock:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Новый цикл (asyncio.run на задачу) — прежние объекты Playwright в нём не работают
+            self._playwright = self._browser = self._page = None
+            self._viewport = None
+            self._loop = loop
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    async def _ensure(self, size: Tuple[int, int]):
+        if self._browser is None or not self._browser.is_connected():
+            from playwright.async_api import async_playwright
+
+            if self._playwright is None:
+                self._playwright = await async_playwright().start()
+            self._browser = await self._playwright.chromium.launch(headless=True)
+            self._page = None
+            logger.info("🌐 Playwright Chromium запущен (общий для анимированного текста)")
+        if self._page is None or self._page.is_closed():
+            self._page = await self._browser.new_page(viewport={'width': size[0], 'height': size[1]})
+            self._viewport = size
+        elif self._viewport != size:
+            await self._page.set_viewport_size({'width': size[0], 'height': size[1]})
+            self._viewport = size
+        return self._page
+
+    async def warm_up(self, size: Tuple[int, int]) -> None:
+        """Запуск браузера и страницы заранее (пока идёт запрос к LLM)."""
+        async with self._bind_loop():
+            await self._ensure(size)
+
+    async def render_frames(self, html: str, size: Tuple[int, int], fps: int, duration: float) -> List[np.ndarray]:
+        """Кадры RGB анимации длительностью duration при заданном fps."""
+        async with self._bind_loop():
+            page = await self._ensure(size)
+            await page.set_content(html, wait_until='load')
+            await page.evaluate("document.fonts.ready.then(() => true)")
+            frames: List[np.ndarray] = []
+            for i in range(max(1, int(round(duration * fps)))):
+                await page.evaluate(_SEEK_JS, i * 1000.0 / fps)
+                png = await page.screenshot(type='png')
+                bgr = cv2.imdecode(np.frombuffer(png, np.uint8), cv2.IMREAD_COLOR)
+                frames.append(cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB))
+            return frames
+
+    async def close(self) -> None:
+        try:
+            if self._browser is not None:
+                await self._browser.close()
+            if self._playwright is not None:
+                await self._playwright.stop()
+        except Exception as e:
+            logger.debug("Закрытие Playwright: %s", e)
+        finally:
+            self._playwright = self._browser = self._page = None
+
+
+_shared: Optional[SharedBrowser] = None
+
+
+def shared_browser() -> SharedBrowser:
+    global _shared
+    if _shared is None:
+        _shared = SharedBrowser()
+    return _shared
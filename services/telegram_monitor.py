@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import asyncio
 import logging
+from collections import OrderedDict
 from pathlib import Path
 import os
 from typing import Awaitable, Callable, List, Optional, Union
@@ -9,13 +10,19 @@ from typing import Awaitable, Callable, List, Optional, Union
 from telethon import TelegramClient, events
 from telethon.tl.functions.messages import ImportChatInviteRequest
 
+from services.ingest_ledger import IngestLedger, message_key
+
 logger = logging.getLogger("telegram")
 
 MediaPath = Union[str, List[str], None]
 OnMessage = Callable[[Optional[str], MediaPath], Awaitable[None]]
+# Скачивание поста после того, как он занят в журнале: (текст, медиа)
+FetchPost = Callable[[], Awaitable[tuple]]
 
 IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".webp", ".bmp"}
 MAX_ALBUM_ITEMS = 8
+# Без журнала приёма (ingest_ledger = false): столько последних ключей помнится в памяти процесса
+SEEN_KEYS_LIMIT = 500
 
 
 def _twitter_media_enabled(config: dict) -> bool:
@@ -215,6 +222,62 @@ async def start_telegram_watcher(config: dict, on_message: OnMessage):
         if text or _has_media(media_path):
             await on_message(text, media_path)
 
+    ledger = IngestLedger.from_config(config)
+    if ledger is not None:
+        ledger.prune()
+    chat_id = int(getattr(entity, 'id', 0) or 0)
+    # Запасной вариант без журнала: альбом (g:<grouped_id>) и сообщение берутся один раз за процесс
+    seen_keys: OrderedDict = OrderedDict()
+
+    def _claim(key: str, source: str) -> bool:
+        if ledger is not None:
+            return ledger.claim(chat_id, key, source)
+        if key in seen_keys:
+            return False
+        seen_keys[key] = source
+        while len(seen_keys) > SEEN_KEYS_LIMIT:
+            seen_keys.popitem(last=False)
+        return True
+
+    def _release(key: str) -> None:
+        if ledger is not None:
+            ledger.release(chat_id, key)
+        else:
+            seen_keys.pop(key, None)
+
+    async def _ingest(key: str, source: str, fetch: FetchPost) -> bool:
+        """
+        Приём поста любым путём (backfill, NewMessage, Album, poll): ключ занимается в журнале
+        до первого await, поэтому пост скачивается и уходит в конвейер ровно один раз.
+        """
+        if not _claim(key, source):
+            logger.info("⏭️ Пост %s уже принят — пропуск (%s)", key, source)
+            return False
+        try:
+            text, media_path = await fetch()
+            await _emit(text, media_path)
+        except BaseException:
+            _release(key)
+            raise
+        if ledger is not None:
+            ledger.done(chat_id, key)
+        return True
+
+    async def _fetch_message(msg, saved_log: str) -> tuple:
+        """Текст и медиа поста по одному его сообщению (альбом собирается по grouped_id)."""
+        text = msg.message or None
+        media_path: MediaPath = None
+        download_path = _tmp_dir(config)
+        if getattr(msg, 'grouped_id', None):
+            album = await _collect_album_by_grouped_id(client, entity, msg.grouped_id, msg)
+            text = next((m.message for m in album if m.message), text)
+            media_path = await _download_album(client, album, download_path)
+        elif msg.photo or msg.video or msg.document:
+            media_path = await _download_one(client, msg, download_path)
+            if media_path:
+                logger.info(saved_log, media_path)
+        return text, media_path
+
     # Startup backfill
     try:
         me = await client.get_me()
@@ -228,20 +291,10 @@ async def start_telegram_watcher(config: dict, on_message: OnMessage):
         backfill = int(config.get('TELEGRAM', {}).get('startup_backfill', 1)) if isinstance(config, dict) else 1
         fetched_any = False
         async for msg in client.iter_messages(entity, limit=max(1, backfill)):
-            text = msg.message or None
-            media_path: MediaPath = None
-            download_path = _tmp_dir(config)
-            if msg and getattr(msg, 'grouped_id', None):
-                album = await _collect_album_by_grouped_id(client, entity, msg.grouped_id, msg)
-                text = next((m.message for m in album if m.message), text)
-                media_path = await _download_album(client, album, download_path)
-            elif msg and (msg.photo or msg.video or msg.document):
-                media_path = await _download_one(client, msg, download_path)
-                if media_path:
-                    logger.info("Startup media saved: %s", media_path)
-            if text or _has_media(media_path):
-                await _emit(text, media_path)
-                fetched_any = True
+            if not msg:
+                continue
+            fetched_any = True
+            await _ingest(message_key(msg), 'backfill', lambda msg=msg: _fetch_message(msg, "Startup media saved: %s"))
         if not fetched_any:
             logger.info("No messages found in the channel yet. Waiting for new posts...")
     except Exception as e:
@@ -255,9 +308,11 @@ async def start_telegram_watcher(config: dict, on_message: OnMessage):
             getattr(event, 'grouped_id', None),
             len(event.messages),
         )
-        text = event.text or None
-        media_path = await _download_album(client, event.messages, _tmp_dir(config))
-        await _emit(text, media_path)
+
+        async def fetch():
+            return event.text or None, await _download_album(client, event.messages, _tmp_dir(config))
+
+        await _ingest(message_key(event.messages[0]), 'album', fetch)
 
     @client.on(events.NewMessage(chats=entity))
     async def handler(event):
@@ -265,17 +320,19 @@ async def start_telegram_watcher(config: dict, on_message: OnMessage):
         if event.message and getattr(event.message, 'grouped_id', None):
             return
         logger.info("New message event received: id=%s", getattr(event.message, 'id', None))
-        text = event.raw_text or None
-        media_path = None
-        if event.message and (event.message.photo or event.message.video or event.message.document):
-            media_path = await _download_one(client, event.message, _tmp_dir(config))
-            if media_path:
-                logger.info("Media saved: %s", media_path)
-        await _emit(text, media_path)
+
+        async def fetch():
+            media_path = None
+            if event.message and (event.message.photo or event.message.video or event.message.document):
+                media_path = await _download_one(client, event.message, _tmp_dir(config))
+                if media_path:
+                    logger.info("Media saved: %s", media_path)
+            return event.raw_text or None, media_path
+
+        await _ingest(message_key(event.message), 'new_message', fetch)
 
     async def poll_loop():
         last_id = None
-        seen_groups: set = set()
         interval = int(config['TELEGRAM'].get('poll_interval_seconds', 10))
         while True:
             try:
@@ -284,24 +341,8 @@ async def start_telegram_watcher(config: dict, on_message: OnMessage):
                         last_id = msg.id
                     elif msg.id != last_id:
                         last_id = msg.id
-                        text = msg.message or None
-                        media_path: MediaPath = None
-                        download_path = _tmp_dir(config)
-                        gid = getattr(msg, 'grouped_id', None)
-                        if gid:
-                            if gid in seen_groups:
-                                break
-                            seen_groups.add(gid)
-                            if len(seen_groups) > 50:
-                                seen_groups.clear()
-                            album = await _collect_album_by_grouped_id(client, entity, gid, msg)
-                            text = next((m.message for m in album if m.message), text)
-                            media_path = await _download_album(client, album, download_path)
-                        elif msg.photo or msg.video or msg.document:
-                            media_path = await _download_one(client, msg, download_path)
-                            if media_path:
-                                logger.info("Polled media saved: %s", media_path)
-                        await _emit(text, media_path)
+                        # Пост, уже принятый NewMessage/Album (или другим сообщением альбома), журнал отсеет
+                        await _ingest(message_key(msg), 'poll', lambda: _fetch_message(msg, "Polled media saved: %s"))
                     break
             except Exception as e:
                 logger.debug("Poll loop error: %s", e)
@@ -310,4 +351,8 @@ async def start_telegram_watcher(config: dict, on_message: OnMessage):
     client.loop.create_task(poll_loop())
 
     logger.info("Watcher is running. Press Ctrl+C to stop.")
-    await client.run_until_disconnected()
+    try:
+        await client.run_until_disconnected()
+    finally:
+        if ledger is not None:
+            ledger.close()
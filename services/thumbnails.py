@@ -0,0 +1,163 @@
+"""
+Обложка и спрайт-превью из кадров, которые захват V2 уже держит в памяти.
+
+Коллектор смотрит на каждый кадр прямо в цикле захвата (RGB, полный размер), но считает
+только выборку: уменьшенная копия для оценки (резкость — дисперсия Лапласиана, контраст —
+СКО яркости, для медиа с лицами — резкость в окрестности фокуса smart_crop) и тайл спрайта
+раз в interval секунд. Полноразмерная копия делается только для нового лидера. На выходе
+<stem>_thumb.jpg, <stem>_sprite.jpg и <stem>_sprite.json рядом с роликом — без повторного
+декодирования MP4.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger("thumbnails")
+
+THUMB_SUFFIX = "thumb.jpg"
+SPRITE_SUFFIX = "sprite.jpg"
+SPRITE_META_SUFFIX = "sprite.json"
+SIDE_SUFFIXES = (THUMB_SUFFIX, SPRITE_SUFFIX, SPRITE_META_SUFFIX)
+
+_SCORE_WIDTH = 270  # ширина уменьшенного кадра для оценки
+
+
+def side_path(video_path: str, suffix: str) -> Path:
+    """Файл-спутник ролика: out.mp4 → out_thumb.jpg и т.п."""
+    p = Path(video_path)
+    return p.with_name(f"{p.stem}_{suffix}")
+
+
+class ThumbnailCollector:
+    """
+    Выбор обложки и сбор тайлов спрайта за один проход захвата.
+
+    observe() потокобезопасен: сегменты V2 захватываются параллельно и передают
+    глобальный номер кадра.
+    """
+
+    def __init__(
+        self,
+        width: int,
+        height: int,
+        fps: int,
+        duration: float,
+        focus: Optional[tuple] = None,
+        face_ratio: float = 0.0,
+        sprite_interval: float = 0.5,
+        sprite_columns: int = 10,
+        tile_width: int = 180,
+        skip_edges: float = 0.15,
+    ):
+        self.width, self.height = width, height
+        self.fps = fps
+        total = max(1, int(duration * fps))
+        # Интро и финальный fade редко дают хорошую обложку
+        self.first_candidate = int(total * skip_edges)
+        self.last_candidate = max(self.first_candidate, int(total * (1 - skip_edges)))
+        self.score_stride = max(1, fps // 4)
+        self.sprite_stride = max(1, int(round(sprite_interval * fps)))
+        self.sprite_columns = max(1, sprite_columns)
+        self.tile_size = (tile_width, max(1, round(tile_width * height / width)))
+        self.score_size = (_SCORE_WIDTH, max(1, round(_SCORE_WIDTH * height / width)))
+        self.face_ratio = face_ratio
+        self.focus = focus
+
+        self.tiles: Dict[int, np.ndarray] = {}
+        self.best_score = -1.0
+        self.best_index = -1
+        self.best_frame: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+
+    def wants(self, index: int) -> bool:
+        """Нужен ли кадр вообще — чтобы цикл захвата не звал observe зря."""
+        return index % self.sprite_stride == 0 or (
+            self.first_candidate <= index <= self.last_candidate and index % self.score_stride == 0
+        )
+
+    def observe(self, index: int, frame_rgb: np.ndarray) -> None:
+        if not self.wants(index) or frame_rgb.shape[:2] != (self.height, self.width):
+            return
+        if index % self.sprite_stride == 0:
+            tile = cv2.resize(frame_rgb, self.tile_size, interpolation=cv2.INTER_AREA)
+            with self._lock:
+                self.tiles[index] = tile
+        if self.first_candidate <= index <= self.last_candidate and index % self.score_stride == 0:
+            score = self._score(frame_rgb)
+            with self._lock:
+                if score <= self.best_score:
+                    return
+                self.best_score, self.best_index = score, index
+                if self.best_frame is None:
+                    self.best_frame = frame_rgb.copy()
+                else:
+                    np.copyto(self.best_frame, frame_rgb)
+
+    def _score(self, frame_rgb: np.ndarray) -> float:
+        small = cv2.resize(frame_rgb, self.score_size, interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_RGB2GRAY)
+        sharpness = float(cv2.Laplacian(gray, cv2.CV_32F).var())
+        contrast = float(gray.std())
+        score = np.log1p(sharpness) + contrast / 32.0
+        if self.face_ratio > 0 and self.focus is not None:
+            # Лицо в кадре должно быть резким: отдельный вес резкости окна вокруг фокуса
+            h, w = gray.shape
+            cx, cy = int(self.focus[0] * w), int(self.focus[1] * h)
+            r = max(8, w // 6)
+            roi = gray[max(0, cy - r):cy + r, max(0, cx - r):cx + r]
+            if roi.size:
+                score += (1.0 + 4.0 * min(self.face_ratio, 0.5)) * np.log1p(float(cv2.Laplacian(roi, cv2.CV_32F).var()))
+        return float(score)
+
+    def export(self, video_path: str, quality: int = 90) -> Dict[str, str]:
+        """Пишет обложку и спрайт рядом с роликом; возвращает {суффикс: путь}."""
+        written: Dict[str, str] = {}
+        if self.best_frame is None and self.tiles:
+            # Ролик короче окна кандидатов — берём средний тайл-кадр
+            middle = sorted(self.tiles)[len(self.tiles) // 2]
+            self.best_index = middle
+            self.best_frame = cv2.resize(self.tiles[middle], (self.width, self.height), interpolation=cv2.INTER_LINEAR)
+        if self.best_frame is not None:
+            path = side_path(video_path, THUMB_SUFFIX)
+            cv2.imwrite(str(path), cv2.cvtColor(self.best_frame, cv2.COLOR_RGB2BGR), [cv2.IMWRITE_JPEG_QUALITY, quality])
+            written[THUMB_SUFFIX] = str(path)
+
+        if self.tiles:
+            order = sorted(self.tiles)
+            cols = min(self.sprite_columns, len(order))
+            rows = -(-len(order) // cols)
+            tw, th = self.tile_size
+            sheet = np.zeros((rows * th, cols * tw, 3), dtype=np.uint8)
+            for n, index in enumerate(order):
+                r, c = divmod(n, cols)
+                sheet[r * th:(r + 1) * th, c * tw:(c + 1) * tw] = self.tiles[index]
+            path = side_path(video_path, SPRITE_SUFFIX)
+            cv2.imwrite(str(path), cv2.cvtColor(sheet, cv2.COLOR_RGB2BGR), [cv2.IMWRITE_JPEG_QUALITY, 80])
+            written[SPRITE_SUFFIX] = str(path)
+            meta = {
+                "tile_width": tw,
+                "tile_height": th,
+                "columns": cols,
+                "rows": rows,
+                "count": len(order),
+                "interval": self.sprite_stride / self.fps,
+                "times": [round(i / self.fps, 3) for i in order],
+            }
+            meta_path = side_path(video_path, SPRITE_META_SUFFIX)
+            meta_path.write_text(json.dumps(meta, ensure_ascii=False, indent=2), "utf-8")
+            written[SPRITE_META_SUFFIX] = str(meta_path)
+
+        if written:
+            logger.info(
+                "🖼️ Обложка: кадр %s (%.2f с, оценка %.2f), спрайт %s тайлов",
+                self.best_index, self.best_index / self.fps, self.best_score, len(self.tiles),
+            )
+        return written
@@ -9,7 +9,7 @@ from typing import Union
 logger = logging.getLogger("video_factory")
 
 
-def create_video_generator(config: dict) -> Union['VideoComposer', 'VideoComposerV2']:
+def create_video_generator(config: dict) -> Union['VideoComposer', 'VideoComposerV2', 'VideoComposerNative']:
     """
     Создает генератор видео в зависимости от настройки generator_version
     
@@ -17,7 +17,7 @@ def create_video_generator(config: dict) -> Union['VideoComposer', 'VideoCompose
         config: Конфигурация из config.ini
         
     Returns:
-        VideoComposer (v1) или VideoComposerV2 (v2)
+        VideoComposer (v1), VideoComposerV2 (v2) или VideoComposerNative (native)
     """
     version = config['VIDEO'].get('generator_version', 'v1').lower()
     
@@ -32,8 +32,23 @@ def create_video_generator(config: dict) -> Union['VideoComposer', 'VideoCompose
             logger.error("💡 Убедитесь, что установлены все зависимости для V2:")
             logger.error("   pip install selenium opencv-python")
             raise RuntimeError("Остановлено: отсутствуют зависимости для VideoComposerV2")
+
+    if version == 'native':
+        # Тот же макет v4, но без Chrome: NumPy/Pillow/OpenCV + ffmpeg
+        try:
+            from services.video_generator_native import VideoComposerNative
+            logger.info("🎬 Используется генератор Native (NumPy/Pillow, без браузера)")
+            return VideoComposerNative(config)
+        except ImportError as e:
+            logger.error(f"❌ Не удалось загрузить Native генератор: {e}", exc_info=True)
+            logger.error("💡 pip install numpy pillow opencv-python")
+            raise RuntimeError("Остановлено: отсутствуют зависимости для VideoComposerNative")
     
     # По умолчанию или если указан v1
+    if str(config['VIDEO'].get('v1_backend', 'moviepy')).strip().lower() == 'ffmpeg':
+        from services.video_generator_ffmpeg import VideoComposerFFmpeg
+        logger.info("📹 Используется генератор V1 (ffmpeg filter_complex)")
+        return VideoComposerFFmpeg(config)
     from services.video_generator import VideoComposer
     logger.info("📹 Используется генератор V1 (MoviePy)")
     return VideoComposer(config)
@@ -77,7 +92,7 @@ def create_llm_provider(config: dict, force_version: str = None, use_ollama: boo
     # Если Ollama не выбран или не загрузился, используем Gemini
     version = force_version or config['VIDEO'].get('generator_version', 'v1').lower()
     
-    if version == 'v2':
+    if version in ('v2', 'native'):
         try:
             from services.llm_provider_v2 import create_llm_provider_v2
             logger.info("🤖 Используются промпты LLM V2 (Gemini)")
@@ -3,7 +3,10 @@ from __future__ import annotations
 import logging
 import os
 import asyncio
+import base64
+import html as html_lib
 from datetime import datetime
+from functools import lru_cache
 from pathlib import Path
 from typing import Tuple
 
@@ -16,13 +19,24 @@ from moviepy import (
     VideoFileClip,
     AudioFileClip,
     concatenate_audioclips,
+    concatenate_videoclips,
 )
 from moviepy.video.fx import Resize
 
+from . import render_pool
+from .asset_cache import AssetCache
+from .render_artifacts import media_list
+from .render_cache import RenderCache, file_digest, make_key, stable_choice
+from .shared_browser import shared_browser
 from .storage import random_file
 
 logger = logging.getLogger("video")
 
+# Шаг точек ломаной «сердцебиения» по x
+_HEARTBEAT_STEP = 3
+# Длительность въезда текста в средней зоне
+TEXT_ANIMATION_SECONDS = 0.6
+
 
 class VideoComposer:
     def __init__(self, config: dict):
@@ -51,21 +65,63 @@ class VideoComposer:
         self.heartbeat_opacity_glow = int(v.get('heartbeat_opacity_glow', 80))
         self.heartbeat_opacity_glow2 = int(v.get('heartbeat_opacity_glow2', 40))
         self.font_path = v.get('font_path', 'resources/fonts/Inter_28pt-Bold.ttf')
+        # Готовые ролики по контент-ключу: повтор того же поста отдаётся без MoviePy
+        self.render_cache = RenderCache(config)
+        # Подвал, градиент и обработанные фото шапки — между задачами (state_dir/v1_assets)
+        self.assets = AssetCache(config)
+        # Въезд текста через общий Chromium (Playwright); без Playwright/шаблона — статичный PNG
+        self.animated_text = (
+            str(v.get('v1_animated_text', 'true')).strip().lower() in ('1', 'true', 'yes', 'on')
+            and self._animated_text_available()
+        )
+        # >0 — рендер в пуле процессов (MoviePy под GIL не мешает Telethon и LLM в основном процессе)
+        self.render_workers = int(v.get('v1_render_workers', 0) or 0)
+
+    def _cache_key(self, short_text: str, media_path: str | None, source_text: str, date_str: str, music: str | None) -> str:
+        return make_key(
+            renderer='v1',
+            text=short_text,
+            source=source_text,
+            date=date_str,
+            media_paths=media_list(media_path),
+            size=[self.width, self.height],
+            duration=self.duration,
+            fps=30,
+            ratios=[self.header_ratio, self.middle_ratio, self.footer_ratio],
+            colors=[self.middle_bg, self.footer_bg, self.middle_red],
+            zoom=[self.header_zoom_start, self.header_zoom_end],
+            heartbeat=[
+                self.heartbeat_enabled, self.heartbeat_cycle_seconds, self.heartbeat_height_ratio,
+                self.heartbeat_opacity_main, self.heartbeat_opacity_glow, self.heartbeat_opacity_glow2,
+            ],
+            font=file_digest(self.font_path),
+            music=file_digest(music),
+            animated_text=self.animated_text,
+        )
+
+    def _text_template_path(self) -> Path:
+        return Path(self.config['PATHS'].get('resources_dir', 'resources')) / 'text_animation_template.html'
+
+    def _animated_text_available(self) -> bool:
+        import importlib.util
+        if not self._text_template_path().exists():
+            logger.info("ℹ️ Шаблон анимации текста не найден — текст V1 статичен")
+            return False
+        if importlib.util.find_spec('playwright') is None:
+            logger.info("ℹ️ Playwright не установлен — текст V1 статичен")
+            return False
+        return True
+
+    def _pick_music(self, seed: str) -> str | None:
+        """Трек выбирается от содержимого поста — входит в ключ кэша, повтор звучит так же."""
+        d = Path(self.config['PATHS']['music_dir'])
+        if not d.exists():
+            return None
+        files = sorted(str(p) for p in d.iterdir() if p.is_file() and p.suffix.lower() in ('.mp3', '.wav', '.m4a', '.aac'))
+        return stable_choice(f"{seed}:music", files)
 
     def _load_font(self, size: int) -> ImageFont.FreeTypeFont | ImageFont.ImageFont:
-        font_path = Path(self.font_path)
-        if font_path.exists():
-            try:
-                font = ImageFont.truetype(str(font_path), size=size)
-                logger.info(f"✅ Шрифт '{font_path}' успешно загружен (размер {size})")
-                return font
-            except Exception as e:
-                logger.error(f"❌ Ошибка загрузки шрифта '{font_path}': {e}", exc_info=True)
-        else:
-            logger.warning(f"⚠️ Шрифт '{font_path}' не найден.")
-        
-        logger.warning("Используется стандартный шрифт.")
-        return ImageFont.load_default()
+        return _load_font_cached(self.font_path, size)
 
     def _make_header_clip(self, media_path: str | None, header_size: Tuple[int, int]):
         w, h = header_size
@@ -117,49 +173,7 @@ class VideoComposer:
                 else:
                     logger.info("🖼️ Обрабатываем изображение...")
                     
-                    # Улучшенная обработка изображений
-                    from PIL import Image as PILImage, ImageEnhance, ImageFilter
-                    
-                    # Загружаем изображение через PIL для предобработки
-                    pil_img = PILImage.open(media_path)
-                    logger.info(f"📏 Оригинальный размер: {pil_img.size}")
-                    
-                    # Конвертируем в RGB если нужно
-                    if pil_img.mode != 'RGB':
-                        pil_img = pil_img.convert('RGB')
-                    
-                    # Увеличиваем четкость для мелких деталей
-                    enhancer = ImageEnhance.Sharpness(pil_img)
-                    pil_img = enhancer.enhance(1.4)  # Усиление резкости на 40%
-                    
-                    # Улучшаем контраст
-                    enhancer = ImageEnhance.Contrast(pil_img)
-                    pil_img = enhancer.enhance(1.2)  # Усиление контраста на 20%
-                    
-                    # Умное масштабирование - заполняем всю область с crop'ом
-                    scale_factor_w = w / pil_img.width
-                    scale_factor_h = h / pil_img.height
-                    scale_factor = max(scale_factor_w, scale_factor_h)  # заполняем всю область
-                    
-                    new_w = int(pil_img.width * scale_factor)
-                    new_h = int(pil_img.height * scale_factor)
-                    
-                    # Используем высококачественное масштабирование
-                    pil_img = pil_img.resize((new_w, new_h), PILImage.LANCZOS)
-                    logger.info(f"🔄 Масштабировали до: {new_w}x{new_h}")
-                    
-                    # Обрезаем по центру если нужно
-                    if new_w > w or new_h > h:
-                        left = max(0, (new_w - w) // 2)
-                        top = max(0, (new_h - h) // 2)
-                        right = left + w
-                        bottom = top + h
-                        pil_img = pil_img.crop((left, top, right, bottom))
-                        logger.info(f"✂️ Обрезали до: {w}x{h}")
-                    
-                    # Сохраняем улучшенное изображение
-                    temp_path = Path(self.config['PATHS']['tmp_dir']) / f"enhanced_{abs(hash(media_path))}.jpg"
-                    pil_img.save(temp_path, quality=95, optimize=True)
+                    temp_path = self._enhance_header_image(media_path, (w, h))
                     
                     # Создаем клип из улучшенного изображения
                     clip = ImageClip(str(temp_path))
@@ -184,20 +198,7 @@ class VideoComposer:
         # Создаём градиентный fallback вместо чёрного прямоугольника
         logger.warning("🎨 Создаём градиентный фон...")
         try:
-            from PIL import Image as PILImage
-            # Создаём вертикальный градиент от тёмно-синего к тёмно-серому
-            gradient_img = PILImage.new('RGB', (w, h))
-            for y in range(h):
-                # Интерполируем цвет от тёмно-синего (25, 25, 50) к тёмно-серому (50, 50, 50)
-                ratio = y / h
-                r = int(25 + (50 - 25) * ratio)
-                g = int(25 + (50 - 25) * ratio) 
-                b = int(50 + (50 - 50) * ratio)
-                for x in range(w):
-                    gradient_img.putpixel((x, y), (r, g, b))
-            
-            gradient_path = Path(self.config['PATHS']['tmp_dir']) / f"gradient_{w}x{h}.png"
-            gradient_img.save(gradient_path)
+            gradient_path = self._gradient_background((w, h))
             clip = ImageClip(str(gradient_path))
             logger.info("✅ Градиентный фон создан")
             return self._add_header_effects(clip.with_duration(self.duration))
@@ -209,6 +210,74 @@ class VideoComposer:
 
 
 
+    def _enhance_header_image(self, media_path: str, size: Tuple[int, int]) -> str:
+        """Резкость/контраст + заполнение шапки с обрезкой по центру; путь к готовому JPEG (из кэша ассетов)."""
+        return self.assets.get_or_create(
+            'header',
+            {'media_paths': [media_path], 'size': list(size)},
+            '.jpg',
+            lambda out: self._build_enhanced_header(media_path, size, out),
+        )
+
+    def _build_enhanced_header(self, media_path: str, size: Tuple[int, int], out_path: Path) -> None:
+        w, h = size
+        from PIL import Image as PILImage, ImageEnhance
+
+        # Загружаем изображение через PIL для предобработки
+        pil_img = PILImage.open(media_path)
+        logger.info(f"📏 Оригинальный размер: {pil_img.size}")
+
+        # Конвертируем в RGB если нужно
+        if pil_img.mode != 'RGB':
+            pil_img = pil_img.convert('RGB')
+
+        # Увеличиваем четкость для мелких деталей
+        enhancer = ImageEnhance.Sharpness(pil_img)
+        pil_img = enhancer.enhance(1.4)  # Усиление резкости на 40%
+
+        # Улучшаем контраст
+        enhancer = ImageEnhance.Contrast(pil_img)
+        pil_img = enhancer.enhance(1.2)  # Усиление контраста на 20%
+
+        # Умное масштабирование - заполняем всю область с crop'ом
+        scale_factor_w = w / pil_img.width
+        scale_factor_h = h / pil_img.height
+        scale_factor = max(scale_factor_w, scale_factor_h)  # заполняем всю область
+
+        new_w = int(pil_img.width * scale_factor)
+        new_h = int(pil_img.height * scale_factor)
+
+        # Используем высококачественное масштабирование
+        pil_img = pil_img.resize((new_w, new_h), PILImage.LANCZOS)
+        logger.info(f"🔄 Масштабировали до: {new_w}x{new_h}")
+
+        # Обрезаем по центру если нужно
+        if new_w > w or new_h > h:
+            left = max(0, (new_w - w) // 2)
+            top = max(0, (new_h - h) // 2)
+            right = left + w
+            bottom = top + h
+            pil_img = pil_img.crop((left, top, right, bottom))
+            logger.info(f"✂️ Обрезали до: {w}x{h}")
+
+        # Сохраняем улучшенное изображение
+        pil_img.save(out_path, format='JPEG', quality=95, optimize=True)
+
+    def _gradient_background(self, size: Tuple[int, int]) -> str:
+        """Вертикальный градиент от тёмно-синего (25, 25, 50) к тёмно-серому (50, 50, 50); путь к PNG."""
+        w, h = size
+
+        def build(out: Path) -> None:
+            # Построчная интерполяция r/g 25→50 (b = 50), как раньше, но одним массивом
+            ramp = (25 + (50 - 25) * (np.arange(h) / h)).astype(np.uint8)
+            gradient = np.empty((h, w, 3), dtype=np.uint8)
+            gradient[..., 0] = ramp[:, None]
+            gradient[..., 1] = ramp[:, None]
+            gradient[..., 2] = 50
+            Image.fromarray(gradient).save(out, format='PNG', compress_level=1)
+
+        return self.assets.get_or_create('gradient', {'size': [w, h]}, '.png', build)
+
     def _render_text_image(self, text: str, size: Tuple[int, int], bg_rgb: tuple[int, int, int]) -> str:
         w, h = size
         # Закрашиваем всю среднюю зону насыщенным красным (как раньше)
@@ -216,46 +285,18 @@ class VideoComposer:
         img = Image.new('RGB', (w, h), color=red_bg)
         draw = ImageDraw.Draw(img)
 
-        # Adaptive text layout with readability-first strategy
-        font_size = 80
+        # Adaptive text layout with readability-first strategy (подбор кэшируется по тексту/размеру/шрифту)
+        font_size, line_spacing, padding, lines = _fit_text_layout(text, w, h, self.font_path)
         font = self._load_font(font_size)
-        max_width = int(w * 0.86)
-        max_height = int(h * 0.78)
-        line_spacing = 12
-        padding = 40
-
-        def measure(ls: list[str], fnt: ImageFont.ImageFont, spacing: int) -> tuple[int, list[int]]:
-            heights = [draw.textbbox((0, 0), L, font=fnt)[3] for L in ls]
-            total = sum(heights) + (len(ls) - 1) * spacing
-            return total, heights
-
-        # Try to fit by decreasing font size, then spacing, then padding
-        while True:
-            lines = _wrap_text(draw, text, font, max_width)
-            total_height, line_heights = measure(lines, font, line_spacing)
-            if total_height <= max_height:
-                break
-            if font_size > 22:
-                font_size -= 2
-                font = self._load_font(font_size)
-                continue
-            if line_spacing > 8:
-                line_spacing -= 1
-                continue
-            if padding > 24:
-                padding -= 2
-                max_height = int(h - padding * 2)
-                continue
-            # Если всё ещё не помещается, оставляем исходный текст (без обрезки) и продолжаем с текущими параметрами
-            break
 
         # Рассчитываем размеры текстового блока
         line_heights = []
-        max_line_width = 0
+        line_widths = []
         for line in lines:
             bbox = draw.textbbox((0, 0), line, font=font)
             line_heights.append(bbox[3])
-            max_line_width = max(max_line_width, bbox[2])
+            line_widths.append(bbox[2])
+        max_line_width = max(line_widths, default=0)
         
         total_text_height = sum(line_heights) + (len(lines)-1)*line_spacing
         
@@ -270,9 +311,7 @@ class VideoComposer:
         # Рисуем текст с двойной тенью для лучшей читаемости и иллюзии большей жирности
         y = overlay_y + padding
         for i, line in enumerate(lines):
-            bbox = draw.textbbox((0, 0), line, font=font)
-            line_w = bbox[2]
-            x = (w - line_w) // 2
+            x = (w - line_widths[i]) // 2
             
             # Двойная тень (2px и 1px) усиливает контраст и визуальную «жирность»
             draw.text((x+2, y+2), line, font=font, fill=(0, 0, 0))
@@ -282,89 +321,81 @@ class VideoComposer:
             y += line_heights[i] + line_spacing
 
         out_path = Path(self.config['PATHS']['tmp_dir']) / f"middle_{os.getpid()}_{abs(hash(text))}.png"
-        img.save(out_path)
+        # Временный файл без потерь: сильное сжатие zlib здесь дороже всего остального
+        img.save(out_path, compress_level=1)
         return str(out_path)
 
-    async def _render_animated_text_html(self, text: str, size: Tuple[int, int], bg_rgb: tuple[int, int, int]) -> str:
-        """Рендерит анимированный текст через HTML/CSS/JS в видео клип (async Playwright)."""
+    async def _render_animated_text_frames(self, text: str, size: Tuple[int, int]) -> list[np.ndarray] | None:
+        """
+        Кадры въезда текста (RGB, 30 fps, TEXT_ANIMATION_SECONDS) в общем Chromium (Playwright).
+        Кегль и переносы — те же, что у статичного PNG. None — анимация недоступна.
+        """
         w, h = size
-        
-        try:
-            from playwright.async_api import async_playwright
-            import numpy as np
-            
-            # Читаем HTML шаблон
-            template_path = Path(self.config['PATHS']['resources_dir']) / 'text_animation_template.html'
-            if not template_path.exists():
-                logger.warning("HTML шаблон не найден, используем обычный рендеринг")
-                return self._render_text_image(text, size, bg_rgb)
-            
-            html_content = template_path.read_text(encoding='utf-8')
-            html_content = html_content.replace('{{TEXT_CONTENT}}', text)
-            
-            # Временный HTML файл
-            temp_html = Path(self.config['PATHS']['tmp_dir']) / f"text_anim_{abs(hash(text))}.html"
-            temp_html.write_text(html_content, encoding='utf-8')
-            
-            # Рендерим кадры анимации
-            frames = []
-            fps = 30
-            animation_duration = 0.6  # длительность анимации в секундах
-            total_frames = int(fps * animation_duration)
-            
-            async with async_playwright() as p:
-                browser = await p.chromium.launch(headless=True)
-                page = await browser.new_page(viewport={'width': w, 'height': h})
-                await page.goto(f"file://{temp_html.absolute()}")
-
-                logger.info(f"🎬 Рендерим {total_frames} кадров анимации...")
-
-                for frame_num in range(total_frames):
-                    # Время в миллисекундах для текущего кадра
-                    time_ms = int((frame_num / fps) * 1000)
-
-                    # Ждем до нужного момента анимации
-                    await page.wait_for_timeout(time_ms if frame_num == 0 else int(1000 / fps))
-
-                    # Делаем скриншот
-                    screenshot_bytes = await page.screenshot(type='png')
-
-                    # Конвертируем в numpy array
-                    from PIL import Image as PILImage
-                    import io
-                    img = PILImage.open(io.BytesIO(screenshot_bytes))
-                    frame = np.array(img)
-                    frames.append(frame)
+        template_path = self._text_template_path()
+        if not template_path.exists():
+            logger.warning("HTML шаблон не найден, используем обычный рендеринг")
+            self.animated_text = False
+            return None
+
+        font_size, line_spacing, _, lines = _fit_text_layout(text, w, h, self.font_path)
+        # Лесенка въезда строк укладывается в общую длительность анимации
+        stagger = min(0.05, 0.15 / max(1, len(lines)))
+        rows = "\n".join(
+            f'<div class="line" style="--delay:{i * stagger:.3f}s">{html_lib.escape(line)}</div>'
+            for i, line in enumerate(lines)
+        )
+        replacements = {
+            '{{FONT_URL}}': _font_data_url(self.font_path),
+            '{{BG_COLOR}}': 'rgb({}, {}, {})'.format(*self.middle_red),
+            '{{FONT_SIZE}}': str(font_size),
+            '{{LINE_GAP}}': str(line_spacing),
+            '{{LINES}}': rows,
+        }
+        html = template_path.read_text(encoding='utf-8')
+        for placeholder, value in replacements.items():
+            html = html.replace(placeholder, value)
 
-                await browser.close()
-            
-            # Удаляем временный HTML
-            temp_html.unlink(missing_ok=True)
-            
-            # Создаем видео клип из кадров
-            from moviepy import ImageSequenceClip
-            clip = ImageSequenceClip(frames, fps=fps)
-
-            # Сохраняем как видео (в отдельном потоке, чтобы не блокировать event loop)
-            out_path = Path(self.config['PATHS']['tmp_dir']) / f"text_anim_{abs(hash(text))}.mp4"
-            await asyncio.to_thread(
-                clip.write_videofile,
-                str(out_path),
-                codec='libx264',
-                audio=False,
-            )
-            
-            logger.info("✅ HTML анимация отрендерена в видео")
-            return str(out_path)
-            
+        try:
+            frames = await shared_browser().render_frames(html, (w, h), 30, TEXT_ANIMATION_SECONDS)
+            logger.info(f"🎬 Анимация текста: {len(frames)} кадров")
+            return frames
         except ImportError:
             logger.warning("Playwright не установлен, используем обычный рендеринг")
-            return self._render_text_image(text, size, bg_rgb)
+            self.animated_text = False
+            return None
         except Exception as e:
             logger.error("❌ Ошибка HTML рендеринга: %s", e)
-            return self._render_text_image(text, size, bg_rgb)
+            return None
+
+    async def _make_middle_clip(self, text: str, size: Tuple[int, int]):
+        """Средняя зона: въезд текста (если включён) и дальше последний кадр; иначе статичный PNG."""
+        if self.animated_text:
+            frames = await self._render_animated_text_frames(text, size)
+            if frames:
+                from moviepy import ImageSequenceClip
+                intro = ImageSequenceClip(frames, fps=30)
+                rest = ImageClip(frames[-1]).with_duration(max(0.0, self.duration - intro.duration))
+                return concatenate_videoclips([intro, rest])
+
+        # Рендерим статическое изображение текста для максимальной читабельности
+        middle_path = await asyncio.to_thread(self._render_text_image, text, size, self.middle_bg)
+        logger.info("🧩 Текст статичен (max readability)")
+        return ImageClip(middle_path).with_duration(self.duration)
 
     def _render_footer_image(self, left_text: str, right_text: str, size: Tuple[int, int], bg_rgb: tuple[int, int, int]) -> str:
+        """Подвал (дата слева, источник справа) — зависит только от входов, берётся из кэша ассетов."""
+        parts = {
+            'left': left_text,
+            'right': right_text,
+            'size': list(size),
+            'bg': list(bg_rgb),
+            'font': file_digest(self.font_path),
+        }
+        return self.assets.get_or_create(
+            'footer', parts, '.png', lambda out: self._draw_footer(left_text, right_text, size, bg_rgb, out)
+        )
+
+    def _draw_footer(self, left_text: str, right_text: str, size: Tuple[int, int], bg_rgb: tuple[int, int, int], out_path: Path) -> None:
         w, h = size
         img = Image.new('RGB', (w, h), color=bg_rgb)
         draw = ImageDraw.Draw(img)
@@ -377,9 +408,7 @@ class VideoComposer:
         rx = w - right_bbox[2] - int(w*0.03)
         draw.text((rx, int(h*0.2)), right_text, font=font, fill=(255,255,255))
 
-        out_path = Path(self.config['PATHS']['tmp_dir']) / f"footer_{os.getpid()}_{abs(hash(left_text+right_text))}.png"
-        img.save(out_path)
-        return str(out_path)
+        img.save(out_path, format='PNG')
 
     def _add_header_effects(self, clip):
         """Добавляет эффект зума (Ken Burns light) к шапке.
@@ -411,96 +440,117 @@ class VideoComposer:
         return clip.with_position(animate_text_position)
 
     def _make_heartbeat_overlay(self, width: int, height: int):
-        """Генерирует клип с имитацией диаграммы биения сердца поверх средней зоны.
+        """Генерирует клип с имитацией диаграммы биения сердца поверх средней зоны."""
+        from moviepy import ImageSequenceClip
+        return ImageSequenceClip(list(self._heartbeat_frames(width, height)), fps=30)
+
+    def _heartbeat_frames(self, width: int, height: int):
+        """Кадры RGBA слоя «сердцебиения» (30 fps на всю длительность).
 
-        Рисуем весь слой кадр-за-кадром, чтобы легко управлять прозрачностью и формой
-        без анимации opacity-функциями MoviePy.
+        Волна периодична: маски линий рисуются один раз на полосе шириной width + период
+        (см. _heartbeat_strip, кэш между задачами), кадр — срез полосы со сдвигом плюс
+        альфа по таблице для огибающей этого кадра. Python-цикла по точкам и PIL на кадр нет.
         """
-        baseline_y = height // 2
-        amplitude = int(height * 0.35)
         period_px = max(20, int(width * 0.22))
         speed_px_per_s = width / max(0.2, self.heartbeat_cycle_seconds)
+        strips = _heartbeat_strip(width, height, period_px)
+        # Порядок как при отрисовке: базовая линия, затем glow2 → glow → основная
+        opacities = (50, self.heartbeat_opacity_glow2, self.heartbeat_opacity_glow, self.heartbeat_opacity_main)
 
-        def shape(u: float) -> float:
-            # Форма удара: высокий пик + небольшой последующий импульс
-            if u < 0.06:
-                return u / 0.06
-            if u < 0.12:
-                return 1.0 - (u - 0.06) / 0.06
-            if u < 0.20:
-                return 0.4 * (1.0 - (u - 0.12) / 0.08)
-            return 0.0
-
-        # Готовим кадры на всю длительность
         fps = 30
         total_frames = max(1, int(self.duration * fps))
-        frames: list[np.ndarray] = []
-
+        labels = np.arange(1 << len(opacities))
         for i in range(total_frames):
             t = i / fps
-            img = Image.new("RGBA", (width, height), (0, 0, 0, 0))
-            draw = ImageDraw.Draw(img, 'RGBA')
-
             env = np.sin(np.pi * (t / max(self.duration, 0.001))) ** 2
-            alpha_main = int(self.heartbeat_opacity_main * env)
-            alpha_glow = int(self.heartbeat_opacity_glow * env)
-            alpha_glow2 = int(self.heartbeat_opacity_glow2 * env)
-
-            draw.line([(0, baseline_y), (width, baseline_y)], fill=(255, 255, 255, int(50 * env)), width=1)
-
+            # Альфа по комбинации линий под пикселем: как у PIL, верхняя линия замещает нижние
+            lut = np.zeros(len(labels), dtype=np.uint8)
+            for bit, opacity in enumerate(opacities):
+                lut[(labels >> bit) & 1 == 1] = int(opacity * env)
             offset = int((t * speed_px_per_s) % period_px)
-            pts = []
-            step = 3
-            for x in range(0, width, step):
-                u = ((x + offset) % period_px) / period_px
-                y = baseline_y - int(amplitude * shape(u))
-                pts.append((x, y))
-
-            if len(pts) >= 2:
-                draw.line(pts, fill=(255, 255, 255, alpha_glow2), width=11)
-                draw.line(pts, fill=(255, 255, 255, alpha_glow), width=7)
-                draw.line(pts, fill=(255, 255, 255, alpha_main), width=3)
-
-            frames.append(np.array(img))
+            strip = strips[offset % _HEARTBEAT_STEP]
+            frame = np.full((height, width, 4), 255, dtype=np.uint8)
+            frame[..., 3] = lut[strip[:, offset:offset + width]]
+            yield frame
 
-        from moviepy import ImageSequenceClip
-        return ImageSequenceClip(frames, fps=fps)
+    def _layout(self) -> dict:
+        """Геометрия макета V1: зоны, направляющая (rail) и полоса сердцебиения."""
+        header_h = int(self.height * self.header_ratio)
+        middle_h = int(self.height * self.middle_ratio)
+        margin_x = int(self.width * 0.10)
+        rail_y = header_h + int(middle_h * 0.08)
+        hb_height = max(20, int(middle_h * self.heartbeat_height_ratio))
+        return {
+            'header_h': header_h,
+            'middle_h': middle_h,
+            'footer_h': self.height - header_h - middle_h,
+            'margin_x': margin_x,
+            'rail_width': self.width - 2 * margin_x,
+            'rail_y': rail_y,
+            'hb_height': hb_height,
+            'hb_y': rail_y - hb_height // 2 + 1,
+        }
+
+    async def prepare(self, media_path) -> None:
+        """
+        Подготовка, не зависящая от текста (вызывается параллельно с запросом к LLM):
+        обработанное фото шапки кладётся в кэш ассетов, Chromium для въезда текста запускается заранее.
+        """
+        if isinstance(media_path, (list, tuple)):
+            media_path = media_path[0] if media_path else None
+        geo = self._layout()
+        if (
+            self.assets.enabled
+            and media_path
+            and Path(media_path).exists()
+            and Path(media_path).suffix.lower() not in {'.mp4', '.mov', '.mkv', '.avi', '.webm'}
+        ):
+            await asyncio.to_thread(self._enhance_header_image, media_path, (self.width, geo['header_h']))
+        # В режиме пула браузер живёт в процессах-воркерах
+        if self.animated_text and not (self.render_workers > 0 and not render_pool.IN_WORKER):
+            try:
+                await shared_browser().warm_up((self.width, geo['middle_h']))
+            except ImportError:
+                self.animated_text = False
 
     async def compose(self, short_text: str, media_path: str | None, output_path: str, source_text: str) -> str:
+        if self.render_workers > 0 and not render_pool.IN_WORKER:
+            return await render_pool.render_in_pool(
+                type(self), self.config, self.render_workers, short_text, media_path, output_path, source_text
+            )
         # Альбом: V1 берёт только первый файл
         if isinstance(media_path, (list, tuple)):
             media_path = media_path[0] if media_path else None
 
-        header_h = int(self.height * self.header_ratio)
-        middle_h = int(self.height * self.middle_ratio)
-        footer_h = self.height - header_h - middle_h
+        date_str = datetime.now().strftime('%d.%m.%Y')
+        music = self._pick_music(make_key(text=short_text, media_paths=media_list(media_path)))
+        cache_key = self._cache_key(short_text, media_path, source_text, date_str, music)
+        cached = self.render_cache.lookup(cache_key, output_path)
+        if cached:
+            return cached
+
+        geo = self._layout()
+        header_h, middle_h, footer_h = geo['header_h'], geo['middle_h'], geo['footer_h']
 
         # Правильная логика: медиа (включая видео) идет в header, текст в middle
         header_clip = self._make_header_clip(media_path, (self.width, header_h))
 
-        # Рендерим статическое изображение текста для максимальной читабельности
-        middle_path = self._render_text_image(short_text, (self.width, middle_h), self.middle_bg)
-        logger.info("🧩 Текст статичен (max readability)")
-        middle_clip = ImageClip(middle_path).with_duration(self.duration)
+        middle_clip = await self._make_middle_clip(short_text, (self.width, middle_h))
 
-        date_str = datetime.now().strftime('%d.%m.%Y')
         footer_img = self._render_footer_image(date_str, source_text, (self.width, footer_h), self.footer_bg)
         footer_clip = ImageClip(footer_img).with_duration(self.duration)
 
         base = ColorClip(size=(self.width, self.height), color=(0, 0, 0)).with_duration(self.duration)
         # Имитация диаграммы «сердечного удара» в верхней части красной зоны
-        margin_x = int(self.width * 0.10)
-        rail_width = self.width - 2 * margin_x
-        rail_y = header_h + int(middle_h * 0.08)
+        margin_x, rail_width, rail_y = geo['margin_x'], geo['rail_width'], geo['rail_y']
         rail_clip = ColorClip(size=(rail_width, 2), color=(255, 255, 255)).with_duration(self.duration).with_opacity(0.22)
         rail_clip = rail_clip.with_position((margin_x, rail_y))
 
         # Кадровая анимация сердца (включается по конфигу)
-        hb_height = max(20, int(middle_h * self.heartbeat_height_ratio))
         heartbeat_clip = None
         if self.heartbeat_enabled:
-            heartbeat_clip = self._make_heartbeat_overlay(rail_width, hb_height)
-            heartbeat_clip = heartbeat_clip.with_position((margin_x, rail_y - hb_height // 2 + 1))
+            heartbeat_clip = self._make_heartbeat_overlay(rail_width, geo['hb_height'])
+            heartbeat_clip = heartbeat_clip.with_position((margin_x, geo['hb_y']))
 
         composed = CompositeVideoClip([
             base,
@@ -512,7 +562,6 @@ class VideoComposer:
         ], size=(self.width, self.height))
 
         # Audio
-        music = random_file(self.config['PATHS']['music_dir'], ('.mp3', '.wav', '.m4a', '.aac'))
         if music:
             try:
                 audio_clip = AudioFileClip(music)
@@ -546,22 +595,172 @@ class VideoComposer:
             preset='medium',
             threads=os.cpu_count() or 2,
         )
+        self.render_cache.store(cache_key, str(out))
         return str(out)
 
 
-def _wrap_text(draw: ImageDraw.ImageDraw, text: str, font: ImageFont.ImageFont, max_width: int) -> list[str]:
-    words = text.strip().split()
+@lru_cache(maxsize=8)
+def _font_data_url(path: str) -> str:
+    """Шрифт как data: URL — страница из set_content не может грузить file://."""
+    p = Path(path)
+    if not p.is_file():
+        return ''
+    mime = 'font/otf' if p.suffix.lower() == '.otf' else 'font/ttf'
+    return f"data:{mime};base64,{base64.b64encode(p.read_bytes()).decode('ascii')}"
+
+
+@lru_cache(maxsize=64)
+def _load_font_cached(path: str, size: int) -> ImageFont.FreeTypeFont | ImageFont.ImageFont:
+    """TTF открывается один раз на (путь, размер)."""
+    font_path = Path(path)
+    if font_path.exists():
+        try:
+            font = ImageFont.truetype(str(font_path), size=size)
+            logger.info(f"✅ Шрифт '{font_path}' успешно загружен (размер {size})")
+            return font
+        except Exception as e:
+            logger.error(f"❌ Ошибка загрузки шрифта '{font_path}': {e}", exc_info=True)
+    else:
+        logger.warning(f"⚠️ Шрифт '{font_path}' не найден.")
+
+    logger.warning("Используется стандартный шрифт.")
+    return ImageFont.load_default()
+
+
+class _FontMetrics:
+    """Размеры слов одного шрифта: (advance, правый край, низ глифов) — кэш на всё время работы."""
+
+    def __init__(self, font: ImageFont.ImageFont):
+        self.font = font
+        self.space = font.getlength(" ")
+        self._words: dict[str, tuple[float, int, int]] = {}
+
+    def word(self, word: str) -> tuple[float, int, int]:
+        m = self._words.get(word)
+        if m is None:
+            _, _, right, bottom = self.font.getbbox(word)
+            m = (self.font.getlength(word), right, bottom)
+            self._words[word] = m
+        return m
+
+
+@lru_cache(maxsize=64)
+def _font_metrics(path: str, size: int) -> _FontMetrics:
+    return _FontMetrics(_load_font_cached(path, size))
+
+
+def _wrap_text(text: str, metrics: _FontMetrics, max_width: int) -> tuple[list[str], list[int]]:
+    """
+    Жадный перенос по словам за один проход: ширина строки-кандидата — advance уже
+    набранных слов + пробел + правый край нового слова (без textbbox на каждую пробу).
+    Возвращает строки и их высоты (низ самого низкого глифа, как textbbox()[3]).
+    """
     lines: list[str] = []
+    heights: list[int] = []
     current: list[str] = []
-    for word in words:
-        trial = (" ".join(current + [word])).strip()
-        w = draw.textbbox((0,0), trial, font=font)[2]
-        if w <= max_width or not current:
+    advance = 0.0
+    bottom = 0
+    for word in text.strip().split():
+        w_adv, w_right, w_bottom = metrics.word(word)
+        if not current:
+            current, advance, bottom = [word], w_adv, w_bottom
+            continue
+        if advance + metrics.space + w_right <= max_width:
             current.append(word)
+            advance += metrics.space + w_adv
+            bottom = max(bottom, w_bottom)
         else:
             lines.append(" ".join(current))
-            current = [word]
+            heights.append(bottom)
+            current, advance, bottom = [word], w_adv, w_bottom
     if current:
         lines.append(" ".join(current))
-    return lines
-
+        heights.append(bottom)
+    return lines, heights
+
+
+_FONT_SIZES = tuple(range(80, 21, -2))  # 80, 78, ..., 22
+
+
+@lru_cache(maxsize=256)
+def _fit_text_layout(text: str, w: int, h: int, font_path: str) -> tuple[int, int, int, tuple[str, ...]]:
+    """
+    Крупнейший кегль из 80..22, при котором текст влезает в 86% ширины и 78% высоты
+    зоны (бинарный поиск: высота блока монотонно растёт с кеглем); если не влезает и
+    на 22 — уменьшаются межстрочный интервал, затем поля. Результат: (кегль, интервал,
+    поля, строки), мемоизирован по (текст, размер зоны, шрифт).
+    """
+    max_width = int(w * 0.86)
+    max_height = int(h * 0.78)
+    line_spacing = 12
+    padding = 40
+
+    def block_height(size: int, spacing: int) -> tuple[int, list[str]]:
+        lines, heights = _wrap_text(text, _font_metrics(font_path, size), max_width)
+        return sum(heights) + (len(lines) - 1) * spacing, lines
+
+    lo, hi = 0, len(_FONT_SIZES) - 1
+    fit = None
+    while lo <= hi:
+        mid = (lo + hi) // 2
+        total, lines = block_height(_FONT_SIZES[mid], line_spacing)
+        if total <= max_height:
+            fit, hi = (mid, lines), mid - 1
+        else:
+            lo = mid + 1
+    if fit is not None:
+        return _FONT_SIZES[fit[0]], line_spacing, padding, tuple(fit[1])
+
+    font_size = _FONT_SIZES[-1]
+    # Строки от интервала и полей не зависят — переносим один раз
+    lines, heights = _wrap_text(text, _font_metrics(font_path, font_size), max_width)
+    text_height = sum(heights)
+    while text_height + (len(lines) - 1) * line_spacing > max_height:
+        if line_spacing > 8:
+            line_spacing -= 1
+            continue
+        if padding > 24:
+            padding -= 2
+            max_height = int(h - padding * 2)
+            continue
+        # Если всё ещё не помещается, оставляем исходный текст (без обрезки) и продолжаем с текущими параметрами
+        break
+    return font_size, line_spacing, padding, tuple(lines)
+
+
+@lru_cache(maxsize=8)
+def _heartbeat_strip(width: int, height: int, period_px: int) -> tuple:
+    """
+    Маски слоёв «сердцебиения» на полосе шириной width + period_px, по одной на фазу
+    сетки точек (сдвиг кадра mod шаг). Пиксель — битовая маска: 1 — базовая линия,
+    2 — glow2 (11 px), 4 — glow (7 px), 8 — основная (3 px). Не зависит от текста и
+    огибающей, поэтому кэшируется между задачами.
+    """
+    baseline_y = height // 2
+    amplitude = int(height * 0.35)
+    strip_w = width + period_px + _HEARTBEAT_STEP
+    strips = []
+    for phase in range(_HEARTBEAT_STEP):
+        xs = np.arange(phase, strip_w, _HEARTBEAT_STEP)
+        u = (xs % period_px) / period_px
+        # Форма удара: высокий пик + небольшой последующий импульс
+        shape = np.select(
+            [u < 0.06, u < 0.12, u < 0.20],
+            [u / 0.06, 1.0 - (u - 0.06) / 0.06, 0.4 * (1.0 - (u - 0.12) / 0.08)],
+            0.0,
+        )
+        ys = baseline_y - (amplitude * shape).astype(int)
+        pts = list(zip(xs.tolist(), ys.tolist()))
+
+        labels = np.zeros((height, strip_w), dtype=np.uint8)
+        for bit, line_width in enumerate((None, 11, 7, 3)):
+            mask = Image.new('L', (strip_w, height), 0)
+            draw = ImageDraw.Draw(mask)
+            if line_width is None:
+                draw.line([(0, baseline_y), (strip_w, baseline_y)], fill=255, width=1)
+            else:
+                draw.line(pts, fill=255, width=line_width)
+            labels |= (np.asarray(mask) > 0).astype(np.uint8) << bit
+        labels.setflags(write=False)
+        strips.append(labels)
+    return tuple(strips)
@@ -0,0 +1,216 @@
+"""
+V1 (макет: медиа-шапка / красная текстовая зона / подвал) одним процессом ffmpeg.
+
+MoviePy собирает каждый кадр CompositeVideoClip в Python. Здесь тот же макет описан
+одним filter_complex:
+- шапка: scale+crop (cover) и zoompan с тем же линейным зумом header_zoom_start → end;
+- статичный холст (текст, подвал, направляющая) собирается в PIL один раз и
+  повторяется фильтром loop;
+- полоса «сердцебиения» идёт в stdin как rawvideo RGBA и накладывается overlay;
+- музыка зацикливается на входе (-stream_loop) и обрезается atrim.
+
+Тексты, подвал, выбор музыки и кэш — общие с VideoComposer.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import subprocess
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from PIL import Image
+
+from .render_artifacts import media_list
+from .render_cache import make_key
+from .storage import random_file
+from .video_generator import VideoComposer
+
+logger = logging.getLogger("video_ffmpeg")
+
+FPS = 30
+VIDEO_EXTS = {'.mp4', '.mov', '.mkv', '.avi', '.webm'}
+
+
+class VideoComposerFFmpeg(VideoComposer):
+    """Бэкенд V1 на filter_complex; при ошибке ffmpeg — откат на MoviePy."""
+
+    def __init__(self, config: dict):
+        super().__init__(config)
+        v = config['VIDEO']
+        self.preset = v.get('v1_ffmpeg_preset', 'medium')
+        self.crf = int(v.get('v1_ffmpeg_crf', 23))
+        # Текст запекается в статичный холст — въезд текста этим бэкендом не рисуется
+        self.animated_text = False
+
+    def _cache_key(self, short_text: str, media_path: str | None, source_text: str, date_str: str, music: str | None) -> str:
+        base = super()._cache_key(short_text, media_path, source_text, date_str, music)
+        return make_key(base=base, backend='ffmpeg', preset=self.preset, crf=self.crf)
+
+    # ---------- входы ----------
+
+    def _loop_image(self, path: str) -> List[str]:
+        return ['-loop', '1', '-framerate', str(FPS), '-t', str(self.duration), '-i', path]
+
+    def _header_input(self, media_path: str | None, size: Tuple[int, int]) -> Tuple[List[str], str]:
+        """Аргументы входа шапки и цепочка фильтров до кадра w×h (без зума)."""
+        w, h = size
+        cover = f"scale={w}:{h}:force_original_aspect_ratio=increase,crop={w}:{h},setsar=1"
+        if media_path and Path(media_path).exists():
+            suffix = Path(media_path).suffix.lower()
+            if suffix in VIDEO_EXTS:
+                logger.info("🎥 Шапка: видео %s", media_path)
+                # Короткое видео держит последний кадр до конца ролика (как with_duration в MoviePy)
+                chain = f"fps={FPS},{cover},tpad=stop_mode=clone:stop_duration={self.duration}"
+                return ['-t', str(self.duration), '-i', media_path], chain
+            try:
+                logger.info("🖼️ Шапка: изображение %s", media_path)
+                return self._loop_image(self._enhance_header_image(media_path, size)), "setsar=1"
+            except Exception as e:
+                logger.error("❌ Ошибка обработки медиа (%s): %s", media_path, e, exc_info=True)
+
+        logger.warning("🔄 Используем запасной фон...")
+        bg = random_file(self.config['PATHS']['backgrounds_dir'], ('.jpg', '.jpeg', '.png'))
+        if bg:
+            logger.info(f"🖼️ Используем случайный фон: {bg}")
+            return self._loop_image(bg), cover
+        logger.warning("🎨 Создаём градиентный фон...")
+        return self._loop_image(self._gradient_background(size)), "setsar=1"
+
+    def _static_canvas(self, middle_path: str, footer_path: str, geo: dict) -> str:
+        """Кадр целиком без шапки и анимации: текст, подвал и направляющая (белая, 22%)."""
+        canvas = Image.new('RGB', (self.width, self.height), (0, 0, 0))
+        canvas.paste(Image.open(middle_path).convert('RGB'), (0, geo['header_h']))
+        rail_box = (geo['margin_x'], geo['rail_y'], geo['margin_x'] + geo['rail_width'], geo['rail_y'] + 2)
+        rail = canvas.crop(rail_box)
+        canvas.paste(Image.blend(rail, Image.new('RGB', rail.size, (255, 255, 255)), 0.22), rail_box[:2])
+        canvas.paste(Image.open(footer_path).convert('RGB'), (0, geo['header_h'] + geo['middle_h']))
+        out = Path(self.config['PATHS']['tmp_dir']) / f"v1_canvas_{os.getpid()}_{abs(hash((middle_path, footer_path)))}.png"
+        canvas.save(out)
+        return str(out)
+
+    # ---------- граф ----------
+
+    def _build_command(
+        self,
+        header_args: List[str],
+        header_chain: str,
+        canvas_path: str,
+        geo: dict,
+        music: Optional[str],
+        output_path: str,
+    ) -> List[str]:
+        total = max(1, int(self.duration * FPS))
+        w, header_h = self.width, geo['header_h']
+        # zoompan не уменьшает (z ≥ 1); x=y=0 — как resized() с позицией (0, 0) в MoviePy
+        zs, ze = max(1.0, self.header_zoom_start), max(1.0, self.header_zoom_end)
+        zoom = f"zoompan=z='{zs}+({ze}-{zs})*min(on/{total}\\,1)':x=0:y=0:d=1:s={w}x{header_h}:fps={FPS}"
+
+        command = ['ffmpeg', '-y', '-loglevel', 'error']
+        command += header_args                         # 0: шапка
+        command += ['-i', canvas_path]                 # 1: статичный холст
+        filters = [
+            f"[0:v]{header_chain},{zoom},trim=end_frame={total}[head]",
+            f"[1:v]loop=loop={total}:size=1:start=0,setpts=N/{FPS}/TB[canvas]",
+            "[canvas][head]overlay=0:0:shortest=1[base]",
+        ]
+        last = "base"
+        next_input = 2
+        if self.heartbeat_enabled:
+            command += [
+                '-f', 'rawvideo', '-pix_fmt', 'rgba',
+                '-s', f"{geo['rail_width']}x{geo['hb_height']}",
+                '-r', str(FPS), '-i', 'pipe:0',
+            ]
+            filters.append(f"[{last}][{next_input}:v]overlay={geo['margin_x']}:{geo['hb_y']}:format=auto[hb]")
+            last = "hb"
+            next_input += 1
+        filters.append(f"[{last}]format=yuv420p[v]")
+        if music:
+            command += ['-stream_loop', '-1', '-i', music]
+            filters.append(f"[{next_input}:a]atrim=0:{self.duration},asetpts=PTS-STARTPTS[a]")
+
+        command += ['-filter_complex', ';'.join(filters), '-map', '[v]']
+        if music:
+            command += ['-map', '[a]', '-c:a', 'aac']
+        command += [
+            '-frames:v', str(total),
+            '-r', str(FPS),
+            '-c:v', 'libx264',
+            '-preset', self.preset,
+            '-crf', str(self.crf),
+            '-pix_fmt', 'yuv420p',
+            '-threads', str(os.cpu_count() or 2),
+            '-movflags', '+faststart',
+            str(output_path),
+        ]
+        return command
+
+    def _run(self, command: List[str], geo: dict) -> None:
+        """Запуск ffmpeg; кадры сердцебиения пишутся в stdin по мере генерации."""
+        proc = subprocess.Popen(
+            command,
+            stdin=subprocess.PIPE if self.heartbeat_enabled else subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+        )
+        try:
+            if self.heartbeat_enabled:
+                try:
+                    for frame in self._heartbeat_frames(geo['rail_width'], geo['hb_height']):
+                        proc.stdin.write(frame.tobytes())
+                except BrokenPipeError:
+                    pass
+                finally:
+                    proc.stdin.close()
+            stderr = proc.stderr.read()
+            rc = proc.wait()
+        except BaseException:
+            proc.kill()
+            raise
+        if rc != 0:
+            raise RuntimeError(f"ffmpeg завершился с кодом {rc}: {stderr.decode('utf-8', 'replace')[-800:]}")
+
+    async def compose(self, short_text: str, media_path: str | None, output_path: str, source_text: str) -> str:
+        # Альбом: V1 берёт только первый файл
+        if isinstance(media_path, (list, tuple)):
+            media_path = media_path[0] if media_path else None
+
+        date_str = datetime.now().strftime('%d.%m.%Y')
+        music = self._pick_music(make_key(text=short_text, media_paths=media_list(media_path)))
+        cache_key = self._cache_key(short_text, media_path, source_text, date_str, music)
+        cached = self.render_cache.lookup(cache_key, output_path)
+        if cached:
+            return cached
+
+        geo = self._layout()
+        out = Path(output_path)
+        out.parent.mkdir(parents=True, exist_ok=True)
+        temp_files: List[str] = []
+        try:
+            def prepare():
+                header = self._header_input(media_path, (self.width, geo['header_h']))
+                middle = self._render_text_image(short_text, (self.width, geo['middle_h']), self.middle_bg)
+                footer = self._render_footer_image(date_str, source_text, (self.width, geo['footer_h']), self.footer_bg)
+                # Подвал живёт в кэше ассетов — удаляются только текст и холст этой задачи
+                temp_files.append(middle)
+                canvas = self._static_canvas(middle, footer, geo)
+                temp_files.append(canvas)
+                return header, canvas
+
+            (header_args, header_chain), canvas = await asyncio.to_thread(prepare)
+            command = self._build_command(header_args, header_chain, canvas, geo, music, str(out))
+            logger.info("🎞️ V1 через ffmpeg filter_complex (%s кадров)", int(self.duration * FPS))
+            await asyncio.to_thread(self._run, command, geo)
+        except Exception as e:
+            logger.warning("⚠️ ffmpeg-бэкенд V1 не справился (%s) — рендерим через MoviePy", e)
+            out.unlink(missing_ok=True)
+            return await super().compose(short_text, media_path, output_path, source_text)
+        finally:
+            for p in temp_files:
+                Path(p).unlink(missing_ok=True)
+
+        self.render_cache.store(cache_key, str(out))
+        return str(out)
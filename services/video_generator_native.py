@@ -0,0 +1,852 @@
+"""
+Нативный генератор видео (без браузера): раскладка news_short_v4_fullscreen.html
+собирается покадрово на NumPy/Pillow/OpenCV и сразу пишется в ffmpeg.
+
+Что повторяем из шаблона V4:
+- медиа-слот (cover 112% с Ken Burns / contain в верхней сцене с размытым фоном);
+- scrim-градиенты, плашка (chyron) со «стеклом» (backdrop blur), тенью, акцентной полосой;
+- заголовок с красным маркером, бриф с подсветкой «цитат», пульсирующая live-точка;
+- карусель альбома с точками; пять цветовых тем.
+
+Текст растеризуется один раз на ролик, медиа декодирует ffmpeg сразу в размер слота,
+на кадр остаются только аффинные преобразования и векторное смешивание слоёв.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import os
+import re
+import subprocess
+from pathlib import Path
+from typing import List, Optional, Tuple, Union
+
+import cv2
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont, ImageOps
+
+from .render_artifacts import RenderArtifacts, media_list
+from .render_cache import make_key, stable_choice
+
+logger = logging.getLogger("video_native")
+
+# Геометрия шаблона задана для 1080x1920 — остальные размеры масштабируются от ширины
+REF_WIDTH = 1080
+BG_RGB = (10, 10, 12)
+PLACEHOLDER_RGB = (26, 26, 34)
+IMAGE_EXTS = {'.jpg', '.jpeg', '.png', '.webp', '.bmp'}
+VIDEO_EXTS = {'.mp4', '.webm', '.mov', '.mkv'}
+MOTION_PERIOD = 6.0
+QUOTE_RE = re.compile(r"«[^»]*»|„[^“]*“")
+
+# CSS-переменные тем v2-theme-1..5 (см. news_short_v4_fullscreen.html)
+THEMES = {
+    1: {
+        'accent': (232, 197, 71), 'accent_soft': (232, 197, 71, 0.28), 'accent_rule': (212, 34, 34, 0.65),
+        'mark': ((212, 34, 34), (224, 42, 42), (196, 30, 30)), 'quote': (232, 197, 71, 0.96),
+        'chyron_bg': (10, 10, 14, 0.86), 'chyron_border': (255, 255, 255, 0.09),
+    },
+    2: {
+        'accent': (56, 189, 248), 'accent_soft': (56, 189, 248, 0.32), 'accent_rule': (14, 165, 233, 0.7),
+        'mark': ((2, 132, 199), (14, 165, 233), (3, 105, 161)), 'quote': (125, 211, 252, 0.95),
+        'chyron_bg': (8, 16, 28, 0.88), 'chyron_border': (56, 189, 248, 0.16),
+    },
+    3: {
+        'accent': (251, 146, 60), 'accent_soft': (251, 146, 60, 0.32), 'accent_rule': (234, 88, 12, 0.7),
+        'mark': ((194, 65, 12), (234, 88, 12), (154, 52, 18)), 'quote': (253, 186, 116, 0.95),
+        'chyron_bg': (22, 12, 8, 0.88), 'chyron_border': (251, 146, 60, 0.16),
+    },
+    4: {
+        'accent': (74, 222, 128), 'accent_soft': (74, 222, 128, 0.3), 'accent_rule': (22, 163, 74, 0.7),
+        'mark': ((21, 128, 61), (34, 197, 94), (22, 101, 52)), 'quote': (134, 239, 172, 0.95),
+        'chyron_bg': (8, 18, 12, 0.88), 'chyron_border': (74, 222, 128, 0.15),
+    },
+    5: {
+        'accent': (192, 132, 252), 'accent_soft': (192, 132, 252, 0.32), 'accent_rule': (147, 51, 234, 0.7),
+        'mark': ((124, 58, 237), (168, 85, 247), (109, 40, 217)), 'quote': (216, 180, 254, 0.95),
+        'chyron_bg': (14, 8, 22, 0.88), 'chyron_border': (192, 132, 252, 0.16),
+    },
+}
+
+# Scrim (stop, alpha) — как linear-gradient в .media-scrim
+SCRIM_COVER = ((0.0, 0.12), (0.28, 0.08), (0.48, 0.45), (0.72, 0.62), (1.0, 0.55))
+SCRIM_CONTAIN = ((0.0, 0.06), (0.35, 0.10), (0.52, 0.55), (0.72, 0.78), (1.0, 0.70))
+
+
+def _ease_sine(p: float) -> float:
+    """gsap sine.inOut"""
+    return -(math.cos(math.pi * p) - 1.0) / 2.0
+
+
+def _tween(t: float, keys: Tuple[Tuple[float, float, float], ...]) -> float:
+    """Кусочная анимация: keys = ((start, duration, to), ...), стартовое значение — первый ключ с duration=0."""
+    value = keys[0][2]
+    for start, dur, to in keys[1:]:
+        if t <= start:
+            break
+        p = 1.0 if dur <= 0 else min(1.0, (t - start) / dur)
+        value = value + (to - value) * _ease_sine(p)
+    return value
+
+
+def _gradient_alpha(stops, n: int) -> np.ndarray:
+    pos = np.linspace(0.0, 1.0, n, dtype=np.float32)
+    xs = np.array([s for s, _ in stops], dtype=np.float32)
+    ys = np.array([a for _, a in stops], dtype=np.float32)
+    return np.interp(pos, xs, ys).astype(np.float32)
+
+
+def _theme_from_config(v: dict) -> Optional[int]:
+    """Та же семантика, что v2_sandbox_theme_debug в V2: 1..5 или None (случайная тема)."""
+    raw = (
+        (os.environ.get("V2_SANDBOX_THEME_DEBUG") or "").strip()
+        or (v.get("v2_sandbox_theme_debug") or "").strip()
+    )
+    if not raw or raw.lower() in ("0", "random", "auto"):
+        return None
+    try:
+        n = int(raw)
+    except ValueError:
+        return None
+    return n if 1 <= n <= 5 else None
+
+
+class _Sprite:
+    """Премультиплицированный RGBA-слой с позицией; сдвиг на дробные пиксели через warpAffine."""
+
+    def __init__(self, rgba: Image.Image, x: int, y: int, margin: int = 0):
+        bbox = rgba.getchannel('A').getbbox()
+        if bbox:
+            # Храним только непрозрачную часть (+ поле под дробный сдвиг)
+            l, t, r, b = bbox
+            l, t = max(0, l - margin), max(0, t - margin)
+            r, b = min(rgba.width, r + margin), min(rgba.height, b + margin)
+            rgba = rgba.crop((l, t, r, b))
+            x, y = x + l, y + t
+            margin = 0
+        arr = np.asarray(rgba, dtype=np.float32) / 255.0
+        alpha = arr[..., 3:4]
+        # Один 4-канальный массив: сдвиг — одним вызовом warpAffine
+        self.rgba = np.concatenate([arr[..., :3] * alpha * 255.0, alpha], axis=2)
+        self.x = x - margin
+        self.y = y - margin
+        self.h, self.w = alpha.shape[:2]
+
+    def composite(self, dst: np.ndarray, dx: float = 0.0, dy: float = 0.0, opacity: float = 1.0,
+                  origin: Tuple[int, int] = (0, 0)) -> None:
+        """origin — координаты dst[0, 0] в кадре (когда dst — вырезка кадра)."""
+        rgba = self.rgba
+        if abs(dx) > 1e-3 or abs(dy) > 1e-3:
+            m = np.float32([[1, 0, dx], [0, 1, dy]])
+            rgba = cv2.warpAffine(rgba, m, (self.w, self.h), flags=cv2.INTER_LINEAR)
+        rgb, alpha = rgba[..., :3], rgba[..., 3:4]
+        px, py = self.x - origin[0], self.y - origin[1]
+        x0, y0 = max(0, px), max(0, py)
+        x1, y1 = min(dst.shape[1], px + self.w), min(dst.shape[0], py + self.h)
+        if x1 <= x0 or y1 <= y0:
+            return
+        sx, sy = x0 - px, y0 - py
+        a = alpha[sy:sy + (y1 - y0), sx:sx + (x1 - x0)]
+        c = rgb[sy:sy + (y1 - y0), sx:sx + (x1 - x0)]
+        if opacity < 1.0:
+            a = a * opacity
+            c = c * opacity
+        region = dst[y0:y1, x0:x1]
+        region *= (1.0 - a)
+        region += c
+
+
+class _MediaSource:
+    """Кадры одного медиа, вписанные (cover + object-position) в прямоугольник слота."""
+
+    def __init__(self, path: Optional[str], box: Tuple[int, int], focus: Tuple[float, float],
+                 fps: int, duration: float, placeholder_font: Optional[ImageFont.FreeTypeFont] = None):
+        self.box = box
+        self.proc: Optional[subprocess.Popen] = None
+        self.still: Optional[np.ndarray] = None
+        self.last: Optional[np.ndarray] = None
+        ext = Path(path).suffix.lower() if path else ''
+        bw, bh = box
+        if path and ext in VIDEO_EXTS:
+            fx, fy = focus
+            vf = (
+                f"fps={fps},scale={bw}:{bh}:force_original_aspect_ratio=increase,"
+                f"crop={bw}:{bh}:(iw-{bw})*{fx:.4f}:(ih-{bh})*{fy:.4f}"
+            )
+            command = [
+                'ffmpeg', '-v', 'error',
+                '-stream_loop', '-1',
+                '-i', str(path),
+                '-vf', vf,
+                '-t', str(duration),
+                '-an',
+                '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-',
+            ]
+            self.proc = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+            self._frame_bytes = bw * bh * 3
+        elif path and ext in IMAGE_EXTS:
+            img = Image.open(path).convert('RGB')
+            img = ImageOps.fit(img, (bw, bh), method=Image.Resampling.LANCZOS, centering=focus)
+            self.still = np.asarray(img, dtype=np.uint8)
+        else:
+            img = Image.new('RGB', (bw, bh), PLACEHOLDER_RGB)
+            if placeholder_font is not None:
+                ImageDraw.Draw(img).text(
+                    (bw // 2, bh // 2), "SHORTS", font=placeholder_font,
+                    fill=(115, 115, 122), anchor='mm',
+                )
+            self.still = np.asarray(img, dtype=np.uint8)
+
+    def next_frame(self) -> np.ndarray:
+        if self.still is not None:
+            return self.still
+        if self.proc is not None and self.proc.stdout is not None:
+            buf = self.proc.stdout.read(self._frame_bytes)
+            if len(buf) == self._frame_bytes:
+                self.last = np.frombuffer(buf, dtype=np.uint8).reshape(self.box[1], self.box[0], 3)
+        if self.last is None:
+            # Видео не декодировалось — держим заглушку вместо чёрного кадра
+            self.last = np.full((self.box[1], self.box[0], 3), PLACEHOLDER_RGB, dtype=np.uint8)
+        return self.last
+
+    def close(self) -> None:
+        if self.proc is not None:
+            try:
+                self.proc.kill()
+                self.proc.wait(timeout=5)
+            except Exception:
+                pass
+            self.proc = None
+
+
+class VideoComposerNative:
+    """Генератор V4 fullscreen без Chrome: NumPy/Pillow-компоновщик + ffmpeg."""
+
+    def __init__(self, config: dict):
+        self.config = config
+        v = config['VIDEO']
+        self.width = int(v.get('width', 1080))
+        self.height = int(v.get('height', 1920))
+        self.fps = int(v.get('v2_fps', 30))
+        self.duration = int(v.get('v2_duration_seconds', 6))
+        self.k = self.width / REF_WIDTH
+        self.title_font_path = v.get('native_title_font', 'resources/fonts/Arsenal-Bold.ttf')
+        self.body_font_path = v.get('native_body_font', 'resources/fonts/Inter_28pt-Bold.ttf')
+        self.crf = int(v.get('native_crf', 20))
+        self.preset = v.get('native_preset', 'veryfast')
+        self._theme_debug = _theme_from_config(v)
+        self._fonts: dict = {}
+        # Кэш задачи: слой медиа + smart_crop + тема/музыка — при правке текста перерисовывается только оверлей
+        self.artifacts = RenderArtifacts(config)
+        logger.info(
+            "🎬 VideoComposerNative инициализирован: %sx%s @ %s fps, %s с (без браузера)",
+            self.width, self.height, self.fps, self.duration,
+        )
+
+    # ---------- утилиты ----------
+
+    def _px(self, value: float) -> int:
+        return int(round(value * self.k))
+
+    def _font(self, path: str, size: int) -> ImageFont.FreeTypeFont:
+        key = (path, size)
+        font = self._fonts.get(key)
+        if font is None:
+            try:
+                font = ImageFont.truetype(path, size=size)
+            except Exception as e:
+                logger.warning("⚠️ Шрифт %s не загрузился (%s) — стандартный", path, e)
+                font = ImageFont.load_default(size=size)
+            self._fonts[key] = font
+        return font
+
+    @staticmethod
+    def _wrap_words(words: List[str], font, max_width: float) -> List[str]:
+        lines: List[str] = []
+        current = ''
+        for word in words:
+            trial = f"{current} {word}" if current else word
+            if current and font.getlength(trial) > max_width:
+                lines.append(current)
+                current = word
+            else:
+                current = trial
+        if current:
+            lines.append(current)
+        return lines
+
+    def _wrap_balanced(self, text: str, font, max_width: float) -> List[str]:
+        """text-wrap: balance — минимальная ширина, при которой число строк не растёт."""
+        words = text.split()
+        lines = self._wrap_words(words, font, max_width)
+        if len(lines) <= 1:
+            return lines
+        lo, hi = max_width * 0.4, max_width
+        best = lines
+        for _ in range(10):
+            mid = (lo + hi) / 2
+            trial = self._wrap_words(words, font, mid)
+            if len(trial) <= len(lines) and all(font.getlength(line) <= max_width for line in trial):
+                best, hi = trial, mid
+            else:
+                lo = mid
+        return best
+
+    # ---------- текст шитрона ----------
+
+    def _render_title(self, title: str, width: int, theme: dict) -> Tuple[Image.Image, int]:
+        """Заголовок с красным маркером (fitTitle: 62→44 пт, max-height 240)."""
+        max_h = self._px(240)
+        size = self._px(62)
+        min_size = self._px(44)
+        while True:
+            font = self._font(self.title_font_path, size)
+            lines = self._wrap_balanced(title, font, width - self._px(8))
+            line_h = size * 1.28
+            if len(lines) * line_h <= max_h + 2 or size <= min_size:
+                break
+            size -= self._px(2) or 1
+        block_h = int(min(max_h, math.ceil(len(lines) * line_h)))
+        layer = Image.new('RGBA', (width, block_h), (0, 0, 0, 0))
+        draw = ImageDraw.Draw(layer)
+        mark_a, mark_b, mark_c = theme['mark']
+        pad_x = size * 0.14
+        for i, line in enumerate(lines):
+            center_y = i * line_h + line_h / 2
+            if center_y - line_h / 2 >= block_h:
+                break
+            lw = font.getlength(line)
+            top, bottom = center_y - size * 0.45, center_y + size * 0.5
+            # Вертикальный градиент маркера (a → b → c), скругление 3px
+            mark = Image.new('RGBA', (int(lw + 2 * pad_x) + 1, max(1, int(bottom - top))), (0, 0, 0, 0))
+            mh = mark.size[1]
+            grad = np.zeros((mh, mark.size[0], 4), dtype=np.uint8)
+            ts = np.linspace(0.0, 1.0, mh)[:, None]
+            a, b, c = (np.array(x, dtype=np.float32) for x in (mark_a, mark_b, mark_c))
+            col = np.where(ts < 0.5, a + (b - a) * (ts / 0.5), b + (c - b) * ((ts - 0.5) / 0.5))
+            grad[..., :3] = col[:, None, :].astype(np.uint8)
+            mask = Image.new('L', mark.size, 0)
+            ImageDraw.Draw(mask).rounded_rectangle(
+                (0, 0, mark.size[0] - 1, mh - 1), radius=max(1, self._px(3)), fill=255
+            )
+            grad[..., 3] = np.asarray(mask)
+            layer.alpha_composite(Image.fromarray(grad, 'RGBA'), (0, int(top)))
+            # text-shadow: 0 1px 1px rgba(0,0,0,.35)
+            draw.text((pad_x, center_y + 1), line, font=font, fill=(0, 0, 0, 90), anchor='lm')
+            draw.text((pad_x, center_y), line, font=font, fill=(255, 255, 255, 255), anchor='lm')
+        return layer, block_h
+
+    @staticmethod
+    def _tokenize_quotes(text: str) -> List[Tuple[str, bool]]:
+        """(слово, в_цитате) — как fillBriefWithQuoteMarks в шаблоне."""
+        tokens: List[Tuple[str, bool]] = []
+        last = 0
+        for m in QUOTE_RE.finditer(text):
+            tokens += [(w, False) for w in text[last:m.start()].split()]
+            tokens += [(w, True) for w in m.group(0).split()]
+            last = m.end()
+        tokens += [(w, False) for w in text[last:].split()]
+        return tokens
+
+    def _layout_brief(self, text: str, font, max_width: float) -> List[List[Tuple[str, bool]]]:
+        lines: List[List[Tuple[str, bool]]] = []
+        for paragraph in text.split('\n'):
+            current: List[Tuple[str, bool]] = []
+            for token in self._tokenize_quotes(paragraph):
+                trial = ' '.join(w for w, _ in current + [token])
+                if current and font.getlength(trial) > max_width:
+                    lines.append(current)
+                    current = [token]
+                else:
+                    current.append(token)
+            lines.append(current)
+        return lines
+
+    def _render_brief(self, text: str, width: int, height: int, theme: dict) -> Image.Image:
+        """Бриф: бинарный поиск размера 36..56 (autoFitText), «цитаты» подсвечены."""
+        lo, hi = self._px(36), self._px(56)
+        best = lo
+        while lo <= hi:
+            mid = (lo + hi) // 2
+            font = self._font(self.body_font_path, mid)
+            lines = self._layout_brief(text, font, width)
+            if len(lines) * mid * 1.38 <= height * 0.98:
+                best, lo = mid, mid + 1
+            else:
+                hi = mid - 1
+        font = self._font(self.body_font_path, best)
+        lines = self._layout_brief(text, font, width)
+        line_h = best * 1.38
+        layer = Image.new('RGBA', (width, max(1, height)), (0, 0, 0, 0))
+        draw = ImageDraw.Draw(layer)
+        qr, qg, qb, qa = theme['quote']
+        space = font.getlength(' ')
+        for i, line in enumerate(lines):
+            center_y = i * line_h + line_h / 2
+            if center_y > height:
+                break
+            x = 0.0
+            for j, (word, quoted) in enumerate(line):
+                ww = font.getlength(word)
+                if quoted:
+                    # Подсветка цитаты: полоса 0.42em..1.08em, соседние слова цитаты — без разрывов
+                    extend = space if j + 1 < len(line) and line[j + 1][1] else 0
+                    draw.rectangle(
+                        (x, center_y - best * 0.1, x + ww + extend, center_y + best * 0.56),
+                        fill=(qr, qg, qb, int(qa * 255)),
+                    )
+                    draw.text((x, center_y), word, font=font, fill=(12, 12, 16, 255), anchor='lm')
+                else:
+                    draw.text((x, center_y), word, font=font, fill=(250, 250, 252, 240), anchor='lm')
+                x += ww + space
+        return layer
+
+    # ---------- статические слои ----------
+
+    def _rounded_mask(self, size: Tuple[int, int], box: Tuple[int, int, int, int], radius: int) -> np.ndarray:
+        """Сглаженная маска скруглённого прямоугольника (2x суперсэмплинг)."""
+        w, h = size
+        img = Image.new('L', (w * 2, h * 2), 0)
+        x0, y0, x1, y1 = box
+        ImageDraw.Draw(img).rounded_rectangle((x0 * 2, y0 * 2, x1 * 2 - 1, y1 * 2 - 1), radius=radius * 2, fill=255)
+        img = img.resize((w, h), Image.Resampling.BILINEAR)
+        return np.asarray(img, dtype=np.float32) / 255.0
+
+    def _build_static(self, fit: str, theme: dict, title: str, summary: str) -> dict:
+        W, H = self.width, self.height
+        st: dict = {}
+
+        # Шитрон
+        cx0, cx1 = self._px(44), W - self._px(44)
+        cy0, cy1 = int(round(H * 0.46)), H - self._px(220)
+        cw, ch = cx1 - cx0, cy1 - cy0
+        st['chyron'] = (cx0, cy0, cx1, cy1)
+        panel_mask = self._rounded_mask((cw, ch), (0, 0, cw, ch), self._px(22))[..., None]
+
+        # Подложка под шитрон: scrim + (contain) переход сцены + тень панели → out = frame*mul + add
+        alpha = np.zeros((H, W, 1), dtype=np.float32)
+        color = np.zeros((H, W, 3), dtype=np.float32)
+
+        def _over(a: np.ndarray, rgb: Tuple[int, int, int]) -> None:
+            nonlocal alpha, color
+            color = color * (1.0 - a) + np.array(rgb, dtype=np.float32) * a
+            alpha = alpha + a * (1.0 - alpha)
+
+        if fit == 'contain':
+            y0, gh = int(H * 0.42), int(H * 0.18)
+            fade = np.zeros((H, 1, 1), dtype=np.float32)
+            fade[y0:y0 + gh, 0, 0] = _gradient_alpha(((0.0, 0.0), (0.55, 0.55), (1.0, 0.92)), gh)
+            _over(np.broadcast_to(fade, (H, W, 1)).copy(), BG_RGB)
+        scrim = _gradient_alpha(SCRIM_CONTAIN if fit == 'contain' else SCRIM_COVER, H)
+        _over(np.broadcast_to(scrim[:, None, None], (H, W, 1)).copy(), (0, 0, 0))
+
+        shadow = np.zeros((H, W), dtype=np.float32)
+        off = self._px(28)
+        shadow[cy0 + off:min(H, cy1 + off), cx0:cx1] = 1.0
+        sigma = max(1.0, self._px(56) / 2.0)
+        shadow = cv2.GaussianBlur(shadow, (0, 0), sigma) * 0.5
+        shadow[cy0:cy1, cx0:cx1] *= (1.0 - panel_mask[..., 0])
+        _over(shadow[..., None], (0, 0, 0))
+
+        # color хранится «непремультиплицированным»; для out = frame*mul + add нужен премультипликат
+        st['mul'] = np.repeat(1.0 - alpha, 3, axis=2).astype(np.float32)
+        st['add'] = (color * alpha).astype(np.float32)
+
+        # Стекло: out = roi*A + blurred*B + C (C — фон панели)
+        br, bg_, bb, ba = theme['chyron_bg']
+        st['panel_A'] = (1.0 - panel_mask).astype(np.float32)
+        st['panel_B'] = (panel_mask * (1.0 - ba)).astype(np.float32)
+        st['panel_C'] = (panel_mask * ba * np.array((br, bg_, bb), dtype=np.float32)).astype(np.float32)
+
+        # Декор: рамка 1px, акцентная полоса, разделитель
+        deco = Image.new('RGBA', (cw, ch), (0, 0, 0, 0))
+        dd = ImageDraw.Draw(deco)
+        r, g, b, a = theme['chyron_border']
+        dd.rounded_rectangle((0, 0, cw - 1, ch - 1), radius=self._px(22), outline=(r, g, b, int(a * 255)), width=1)
+        ar, ag, ab = theme['accent']
+        dd.rounded_rectangle(
+            (0, self._px(32), self._px(4), ch - self._px(32)),
+            radius=max(1, self._px(3)), fill=(ar, ag, ab, int(0.95 * 255)),
+        )
+
+        pad_t, pad_x, pad_b, gap = self._px(40), self._px(44), self._px(44), self._px(22)
+        title_x = pad_x + self._px(20)
+        title_w = cw - pad_x * 2 - self._px(20) - self._px(36)
+        title_layer, title_h = self._render_title(title, title_w, theme)
+
+        rule_y = pad_t + title_h + gap
+        # Разделитель вшит в стекло и попадает в кэшируемый слой медиа — его позиция входит в имя слоя
+        st['rule_y'] = rule_y
+        rule_x0, rule_x1 = pad_x + self._px(20), cw - pad_x - self._px(20)
+        rr, rg, rb, ra = theme['accent_rule']
+        span = max(1, rule_x1 - rule_x0)
+        for x in range(rule_x0, rule_x1):
+            p = (x - rule_x0) / span
+            if p < 0.4:
+                q = p / 0.4
+                col = (
+                    int(rr + (255 - rr) * q), int(rg + (255 - rg) * q), int(rb + (255 - rb) * q),
+                    int((ra + (0.12 - ra) * q) * 255),
+                )
+            else:
+                col = (255, 255, 255, int(0.12 * (1 - (p - 0.4) / 0.6) * 255))
+            deco.putpixel((x, rule_y), col)
+        # Декор статичен — сразу вшиваем его в коэффициенты стекла: out = (...)·(1-da) + dc
+        deco_arr = np.asarray(deco, dtype=np.float32) / 255.0
+        da = deco_arr[..., 3:4]
+        keep = 1.0 - da
+        st['panel_A'] = np.repeat(st['panel_A'] * keep, 3, axis=2).astype(np.float32)
+        st['panel_B'] = np.repeat(st['panel_B'] * keep, 3, axis=2).astype(np.float32)
+        st['panel_C'] = (st['panel_C'] * keep + deco_arr[..., :3] * 255.0 * da).astype(np.float32)
+
+        brief_y = rule_y + 1 + gap
+        brief_x = pad_x + self._px(20)
+        brief_w = cw - pad_x * 2 - self._px(20) - self._px(16)
+        brief_h = ch - pad_b - brief_y
+        margin = self._px(8)
+        st['title'] = _Sprite(ImageOps.expand(title_layer, margin), cx0 + title_x, cy0 + pad_t, margin)
+        brief_layer = self._render_brief(summary, brief_w, brief_h, theme) if summary and brief_h > 0 else None
+        st['brief'] = (
+            _Sprite(ImageOps.expand(brief_layer, margin), cx0 + brief_x, cy0 + brief_y, margin)
+            if brief_layer is not None else None
+        )
+
+        # Live-точка: 10px + кольцо 3px accent-soft (рисуем в 4x, масштаб — на кадре)
+        dot_d = self._px(10)
+        ring = self._px(3)
+        sprite_d = (dot_d + 2 * ring) * 4
+        dot = Image.new('RGBA', (sprite_d, sprite_d), (0, 0, 0, 0))
+        ddot = ImageDraw.Draw(dot)
+        sr, sg, sb, sa = theme['accent_soft']
+        ddot.ellipse((0, 0, sprite_d - 1, sprite_d - 1), fill=(sr, sg, sb, int(sa * 255)))
+        ddot.ellipse((ring * 4, ring * 4, sprite_d - 1 - ring * 4, sprite_d - 1 - ring * 4), fill=(ar, ag, ab, 255))
+        st['dot'] = np.asarray(dot)
+        st['dot_center'] = (cx1 - self._px(40) - dot_d / 2, cy0 + self._px(32) + dot_d / 2)
+        st['dot_size'] = dot_d + 2 * ring
+        return st
+
+    def _blur_backdrop(self, frame: np.ndarray) -> np.ndarray:
+        """Размытый фон для contain (.media-blur): cover в блок 120%x58%, scale 1.08, blur 36px, brightness .42."""
+        W, H = self.width, self.height
+        bw, bh = int(W * 1.2), int(H * 0.58)
+        img = ImageOps.fit(Image.fromarray(frame), (bw, bh), method=Image.Resampling.BILINEAR)
+        arr = np.asarray(img, dtype=np.float32)
+        gray = arr.mean(axis=2, keepdims=True)
+        arr = np.clip(gray + (arr - gray) * 1.08, 0, 255) * 0.42
+        canvas = np.empty((H, W, 3), dtype=np.float32)
+        canvas[:] = BG_RGB
+        m = np.float32([[1.08, 0, -0.1 * W - 0.04 * bw], [0, 1.08, -0.04 * H - 0.04 * bh]])
+        cv2.warpAffine(arr, m, (W, H), dst=canvas, flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_TRANSPARENT)
+        small = cv2.resize(canvas, (W // 4, H // 4), interpolation=cv2.INTER_AREA)
+        small = cv2.GaussianBlur(small, (0, 0), max(1.0, self._px(36) / 4.0))
+        return np.clip(cv2.resize(small, (W, H), interpolation=cv2.INTER_LINEAR), 0, 255).astype(np.uint8)
+
+    # ---------- покадровый рендер ----------
+
+    def _slot_geometry(self, fit: str, focus: Tuple[float, float]):
+        W, H = self.width, self.height
+        if fit == 'contain':
+            box = (W, int(H * 0.52))
+            offset = (0.0, 0.0)
+            origin = (box[0] * 0.5, box[1] * 0.42)
+        else:
+            box = (int(W * 1.12), int(H * 1.12))
+            offset = (-0.06 * W, -0.06 * H)
+            origin = (box[0] * focus[0], box[1] * focus[1])
+        return box, offset, origin
+
+    def _motion(self, t: float, fit: str) -> Tuple[float, float, float]:
+        """Ken Burns из setupCinematicMotion: (scale, x, y), петля 6 с."""
+        tt = t % MOTION_PERIOD
+        if fit == 'contain':
+            s = _tween(tt, ((0, 0, 1.0), (0, 3, 1.03), (3, 3, 1.0)))
+            return s, 0.0, self.k * _tween(tt, ((0, 0, 0.0), (0, 3, -6.0), (3, 3, 0.0)))
+        s = _tween(tt, ((0, 0, 1.0), (0, 3, 1.024), (3, 3, 1.0)))
+        x = _tween(tt, ((0, 0, 0.0), (0, 3, -4.0), (3, 3, 0.0)))
+        y = _tween(tt, ((0, 0, 0.0), (0, 3, -5.0), (3, 3, 0.0)))
+        return s, x * self.k, y * self.k
+
+    def _draw_dot(self, frame: np.ndarray, st: dict, t: float, origin: Tuple[int, int] = (0, 0)) -> None:
+        tt = t % MOTION_PERIOD
+        opacity = _tween(tt, ((0, 0, 0.7), (0, 1.5, 1.0), (1.5, 1.5, 0.55), (3, 1.5, 1.0), (4.5, 1.5, 0.65)))
+        scale = _tween(tt, ((0, 0, 1.0), (0, 1.5, 1.15), (1.5, 1.5, 1.0), (3, 1.5, 1.12), (4.5, 1.5, 1.0)))
+        d = max(2, int(round(st['dot_size'] * scale)))
+        sprite = cv2.resize(st['dot'], (d, d), interpolation=cv2.INTER_AREA).astype(np.float32) / 255.0
+        cx, cy = st['dot_center']
+        x0, y0 = int(round(cx - d / 2)) - origin[0], int(round(cy - d / 2)) - origin[1]
+        a = sprite[..., 3:4] * opacity
+        region = frame[y0:y0 + d, x0:x0 + d]
+        region *= (1.0 - a)
+        region += sprite[..., :3] * 255.0 * a
+
+    def _draw_carousel_dots(self, frame: np.ndarray, n: int, active: int, accent) -> None:
+        d, gap = max(2, self._px(10)), self._px(10)
+        total_w = n * d + (n - 1) * gap
+        x0 = (self.width - total_w) // 2
+        y0 = int(self.height * (1 - 0.28)) - d
+        pad = d
+        roi = frame[y0 - pad:y0 + d + pad, x0 - pad:x0 + total_w + pad]
+        for i in range(n):
+            size = int(round(d * 1.15)) if i == active else d
+            center = (pad + i * (d + gap) + d // 2, pad + d // 2)
+            color = accent if i == active else (255, 255, 255)
+            a = 1.0 if i == active else 0.35
+            overlay = roi.copy()
+            cv2.circle(overlay, center, size // 2, color, -1, lineType=cv2.LINE_AA)
+            cv2.addWeighted(overlay, a, roi, 1 - a, 0, dst=roi)
+
+    def _open_encoder(self, output_path: str, music: Optional[str]) -> subprocess.Popen:
+        command = [
+            'ffmpeg', '-y',
+            '-f', 'rawvideo', '-pix_fmt', 'rgb24',
+            '-s', f'{self.width}x{self.height}',
+            '-r', str(self.fps),
+            '-i', '-',
+        ]
+        if music:
+            command += ['-stream_loop', '-1', '-i', music, '-map', '0:v:0', '-map', '1:a:0', '-c:a', 'aac']
+        command += [
+            '-t', str(self.duration),
+            '-c:v', 'libx264',
+            '-preset', self.preset,
+            '-crf', str(self.crf),
+            '-pix_fmt', 'yuv420p',
+            '-movflags', '+faststart',
+            '-loglevel', 'error',
+            str(output_path),
+        ]
+        return subprocess.Popen(command, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def _open_layer_encoder(self, layer_path: Path) -> subprocess.Popen:
+        """Слой медиа (всё, кроме текста и live-точки) для кэша задачи: почти без потерь, без звука."""
+        command = [
+            'ffmpeg', '-y',
+            '-f', 'rawvideo', '-pix_fmt', 'rgb24',
+            '-s', f'{self.width}x{self.height}',
+            '-r', str(self.fps),
+            '-i', '-',
+            '-an',
+            '-c:v', 'libx264',
+            '-preset', 'veryfast',
+            '-crf', '10',
+            '-pix_fmt', 'yuv444p',
+            '-loglevel', 'error',
+            str(layer_path),
+        ]
+        return subprocess.Popen(command, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def _open_layer_decoder(self, layer_path: Path) -> subprocess.Popen:
+        command = [
+            'ffmpeg', '-i', str(layer_path),
+            '-f', 'rawvideo', '-pix_fmt', 'rgb24',
+            '-loglevel', 'error', '-',
+        ]
+        return subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+    @staticmethod
+    def _finish_encoder(proc: subprocess.Popen, label: str) -> None:
+        proc.stdin.close()
+        stderr = proc.stderr.read().decode('utf-8', errors='replace')
+        if proc.wait() != 0:
+            raise RuntimeError(f"ffmpeg {label}: {stderr.strip()}")
+
+    def _media_plan(self, media_path, job=None) -> Tuple[List[str], str, Tuple[float, float]]:
+        paths = [
+            p for p in media_list(media_path)
+            if Path(p).suffix.lower() in IMAGE_EXTS | VIDEO_EXTS
+        ][:8]
+        fit, focus = 'cover', (0.5, 0.32)
+        if paths:
+            try:
+                if job is not None:
+                    layout = job.media_layout(paths[0])
+                else:
+                    from services.smart_crop import compute_media_layout
+                    layout = compute_media_layout(paths[0])
+                fit = layout.fit if layout.fit in ('cover', 'contain') else 'cover'
+                focus = (layout.focus_x, layout.focus_y)
+            except Exception as e:
+                logger.warning("⚠️ smart_crop пропущен: %s", e)
+        return paths, fit, focus
+
+    def _pick_theme(self, seed: str) -> int:
+        """Тема от медиа поста: правка текста не меняет её, и слой медиа в задаче остаётся годным."""
+        if self._theme_debug:
+            return self._theme_debug
+        return int(stable_choice(f"{seed}:theme", range(1, 6)))
+
+    def _pick_music(self, seed: str) -> Optional[str]:
+        music_dir = Path(self.config['PATHS']['music_dir'])
+        exts = ('.mp3', '.wav', '.m4a', '.aac')
+        music_files = sorted(
+            str(p) for p in music_dir.iterdir() if p.is_file() and p.suffix.lower() in exts
+        ) if music_dir.exists() else []
+        return stable_choice(f"{seed}:music", music_files)
+
+    def _overlay_text(self, frame: np.ndarray, st: dict, t: float, origin: Tuple[int, int] = (0, 0)) -> None:
+        """Текстовый оверлей кадра: заголовок, бриф, live-точка (всё, что зависит от текста или поверх)."""
+        tt = t % MOTION_PERIOD
+        st['title'].composite(frame, 0.0, self.k * _tween(tt, ((0, 0, 0.0), (0, 3, -3.0), (3, 3, 0.0))), origin=origin)
+        if st['brief'] is not None:
+            st['brief'].composite(
+                frame, 0.0, self.k * _tween(tt, ((0, 0, 0.0), (0, 3, 2.0), (3, 3, 0.0))), origin=origin
+            )
+        self._draw_dot(frame, st, t, origin)
+
+    def _open_job(self, media_path):
+        return self.artifacts.open_job(
+            media_list(media_path),
+            {'renderer': 'native', 'size': [self.width, self.height], 'fps': self.fps, 'duration': self.duration},
+        )
+
+    def _prepare(self, media_path) -> None:
+        job = self._open_job(media_path)
+        if job is None:
+            return
+        self._media_plan(media_path, job)
+
+    async def prepare(self, media_path) -> None:
+        """smart_crop медиа задачи — в кэш артефактов, параллельно с запросом к LLM."""
+        await asyncio.to_thread(self._prepare, media_path)
+
+    def _render(self, title: str, summary: str, media_path, output_path: str) -> str:
+        W, H = self.width, self.height
+        job = self._open_job(media_path)
+        media = media_list(media_path)
+        # Тема и музыка — только от медиа; пост без медиа слоя не кэширует, ему — от текста
+        seed = make_key(media_paths=media) if media else make_key(title=title, summary=summary)
+        theme_id = self._pick_theme(seed)
+        theme = THEMES[theme_id]
+        logger.info("🎨 Native color theme: %s", theme_id)
+
+        paths, fit, focus = self._media_plan(media_path, job)
+        st = self._build_static(fit, theme, title, summary)
+
+        out = Path(output_path)
+        out.parent.mkdir(parents=True, exist_ok=True)
+        music = self._pick_music(seed)
+        encoder = self._open_encoder(str(out), music)
+        num_frames = int(self.duration * self.fps)
+
+        layer_name = f"media_layer_t{theme_id}_r{st['rule_y']}.mp4"
+        layer = job.file(layer_name) if job is not None else None
+        if layer is not None:
+            # Правка текста: медиа, стекло и подложка уже готовы — накладываем только текст
+            try:
+                self._render_overlay_only(st, layer, encoder, num_frames)
+                logger.info("✅ Видео Native пересобрано по слою медиа: %s (%s кадров)", out, num_frames)
+                return str(out)
+            except RuntimeError as e:
+                # Слой оборван или битый — удаляем и рендерим полностью
+                logger.warning("⚠️ Слой медиа непригоден (%s) — полный рендер", e)
+                layer.unlink(missing_ok=True)
+            finally:
+                if encoder.poll() is None:
+                    encoder.kill()
+            encoder = self._open_encoder(str(out), music)
+
+        n_slides = max(1, len(paths))
+        slide_sec = self.duration / n_slides
+        box, offset, origin = self._slot_geometry(fit, focus)
+        placeholder_font = self._font(self.body_font_path, self._px(28))
+        sources = [
+            _MediaSource(p, box, focus, self.fps, self.duration, placeholder_font) for p in paths
+        ] or [_MediaSource(None, box, focus, self.fps, self.duration, placeholder_font)]
+        cx0, cy0, cx1, cy1 = st['chyron']
+
+        first = sources[0].next_frame()
+        base = np.empty((H, W, 3), dtype=np.uint8)
+        base[:] = BG_RGB
+        if fit == 'contain':
+            base = self._blur_backdrop(first)
+
+        layer_tmp = job.path(layer_name) if job is not None else None
+        layer_encoder = self._open_layer_encoder(layer_tmp) if layer_tmp is not None else None
+        try:
+            for i in range(num_frames):
+                t = i / self.fps
+                idx = min(n_slides - 1, int(t / slide_sec))
+                media = first if i == 0 else sources[idx].next_frame()
+
+                s, tx, ty = self._motion(t, fit)
+                m = np.float32([
+                    [s, 0, offset[0] + origin[0] * (1 - s) + tx],
+                    [0, s, offset[1] + origin[1] * (1 - s) + ty],
+                ])
+                canvas = base.copy()
+                cv2.warpAffine(media, m, (W, H), dst=canvas, flags=cv2.INTER_LINEAR,
+                               borderMode=cv2.BORDER_TRANSPARENT)
+                if len(paths) >= 2:
+                    self._draw_carousel_dots(canvas, len(paths), idx, theme['accent'])
+
+                frame = canvas.astype(np.float32)
+                cv2.multiply(frame, st['mul'], dst=frame)
+                cv2.add(frame, st['add'], dst=frame)
+
+                roi = frame[cy0:cy1, cx0:cx1]
+                small = cv2.resize(roi, ((cx1 - cx0) // 4, (cy1 - cy0) // 4), interpolation=cv2.INTER_AREA)
+                small = cv2.GaussianBlur(small, (0, 0), max(1.0, self._px(20) / 4.0))
+                blurred = cv2.resize(small, (cx1 - cx0, cy1 - cy0), interpolation=cv2.INTER_LINEAR)
+                cv2.multiply(blurred, st['panel_B'], dst=blurred)
+                cv2.add(blurred, st['panel_C'], dst=blurred)
+                roi *= st['panel_A']
+                roi += blurred
+
+                if layer_encoder is not None:
+                    layer_encoder.stdin.write(cv2.convertScaleAbs(frame).tobytes())
+                self._overlay_text(frame, st, t)
+
+                encoder.stdin.write(cv2.convertScaleAbs(frame).tobytes())
+            self._finish_encoder(encoder, 'native')
+            if layer_encoder is not None:
+                try:
+                    self._finish_encoder(layer_encoder, 'слоя медиа')
+                    job.commit(layer_name, layer_tmp)
+                except Exception as e:
+                    logger.warning("⚠️ Слой медиа не сохранён в кэш задачи: %s", e)
+                    job.discard(layer_tmp)
+        finally:
+            for proc in (encoder, layer_encoder):
+                if proc is not None and proc.poll() is None:
+                    proc.kill()
+            if layer_tmp is not None:
+                job.discard(layer_tmp)
+            for src in sources:
+                src.close()
+        logger.info("✅ Видео Native создано: %s (%s кадров)", out, num_frames)
+        return str(out)
+
+    def _render_overlay_only(self, st: dict, layer: Path, encoder: subprocess.Popen, num_frames: int) -> None:
+        frame_bytes = self.width * self.height * 3
+        # Весь текст и точка лежат внутри плашки — во float переводим только её
+        cx0, cy0, cx1, cy1 = st['chyron']
+        decoder = self._open_layer_decoder(layer)
+        try:
+            for i in range(num_frames):
+                buf = bytearray(frame_bytes)
+                if decoder.stdout.readinto(buf) < frame_bytes:
+                    raise RuntimeError(f"слой медиа оборвался на кадре {i}/{num_frames}")
+                frame = np.frombuffer(buf, np.uint8).reshape(self.height, self.width, 3)
+                roi = frame[cy0:cy1, cx0:cx1].astype(np.float32)
+                self._overlay_text(roi, st, i / self.fps, (cx0, cy0))
+                frame[cy0:cy1, cx0:cx1] = cv2.convertScaleAbs(roi)
+                encoder.stdin.write(buf)
+            self._finish_encoder(encoder, 'native')
+        finally:
+            if decoder.poll() is None:
+                decoder.kill()
+
+    async def compose(self, short_text: Union[str, dict], media_path: Union[str, list, None], output_path: str, source_text: str) -> str:
+        logger.info("🎬 Запуск генерации видео Native (NumPy/Pillow, без браузера)...")
+        if isinstance(short_text, dict):
+            title = short_text.get('title', 'Новость')
+            summary = short_text.get('brief', title)
+        else:
+            title = summary = str(short_text)
+        return await asyncio.to_thread(self._render, title, summary, media_path, output_path)
+
+    def close(self):
+        """Браузера нет — закрывать нечего (совместимость с VideoComposerV2)."""
+        pass
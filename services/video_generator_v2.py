@@ -4,6 +4,7 @@
 """
 
 import asyncio
+import hashlib
 import json
 import logging
 import os
@@ -16,18 +17,90 @@ from PIL import Image
 import io
 import shutil
 import subprocess
-from typing import List, Optional, Union
+import threading
+from typing import Dict, List, Optional, Union
 import base64
 
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 
+from services.capture_tuner import DEFAULT_SETTINGS, CaptureTuner, engine_name, screenshot_params
+from services.frame_ring import FrameRingEncoder
+from services.render_artifacts import RenderArtifacts, media_fingerprint, media_list
+from services.render_cache import RenderCache, file_digest, make_key, stable_choice
+from services.render_timing import CaptureTimings, LoopLagProbe
+from services.template_compiler import compile_template
+from services.thumbnails import ThumbnailCollector
+
 logger = logging.getLogger("video_v2")
 
+# Покадровый захват: CSS-анимации (спиннер и т.д.) идут по wall-clock между скриншотами —
+# ставим body.v2-capture и фазу через отрицательный animation-delay по виртуальному времени кадра.
+CAPTURE_CSS = """
+<style id="v2-frame-capture-css">
+body.v2-capture .spinner::before,
+body.v2-capture .spinner::after {
+    animation-play-state: paused !important;
+    animation-delay: var(--spin-delay, 0s) !important;
+}
+body.v2-capture .loader .dot {
+    animation-play-state: paused !important;
+    animation-delay: var(--dot-anim-delay, 0s) !important;
+}
+/* Шаблоны свёрстаны под 1080x1920; для мульти-формата холст следует за вьюпортом */
+body.v2-capture {
+    width: 100vw !important;
+    height: 100vh !important;
+}
+</style>
+"""
+IMAGE_EXTS = {'.jpg', '.jpeg', '.png', '.webp', '.bmp'}
+VIDEO_EXTS = {'.mp4', '.webm', '.mov', '.mkv'}
+MEDIA_EXTS = IMAGE_EXTS | VIDEO_EXTS
+
+# Пустая file://-страница: документ подменяется через CDP, а origin file:// сохраняет доступ к медиа
+CAPTURE_HOST_HTML = "<!DOCTYPE html><html><head><meta charset=\"utf-8\"></head><body></body></html>"
+
+# Пресеты площадок для мульти-формата (ширина, высота)
+VIEWPORT_PRESETS = {
+    '9:16': (1080, 1920),
+    '1:1': (1080, 1080),
+    '4:5': (1080, 1350),
+    '16:9': (1920, 1080),
+}
+
+
+def parse_viewports(items) -> List[tuple]:
+    """
+    Список форматов → [(name, width, height)].
+    Принимает пресеты ('9:16', '1:1', '16:9'), строки 'WxH', кортежи (w, h) или строку через запятую.
+    """
+    if isinstance(items, str):
+        items = [x for x in re.split(r'[,\s]+', items) if x]
+    result = []
+    for item in items or []:
+        if isinstance(item, (list, tuple)) and len(item) == 2:
+            w, h = int(item[0]), int(item[1])
+        elif str(item).strip() in VIEWPORT_PRESETS:
+            w, h = VIEWPORT_PRESETS[str(item).strip()]
+        else:
+            m = re.fullmatch(r'(\d+)\s*[xх×]\s*(\d+)', str(item).strip().lower())
+            if not m:
+                raise ValueError(f"Неизвестный формат вьюпорта: {item!r}")
+            w, h = int(m.group(1)), int(m.group(2))
+        name = f"{w}x{h}"
+        if w <= 0 or h <= 0 or any(name == r[0] for r in result):
+            continue
+        result.append((name, w, h))
+    return result
+
 
 class VideoComposerV2:
     """Генератор видео через HTML + Selenium"""
+
+    # Один Chrome и состояние задачи (_job, шаблон, музыка, вьюпорт) на экземпляр — рендеры по очереди
+    max_parallel_renders = 1
     
     def __init__(self, config: dict):
         self.config = config
@@ -38,6 +111,12 @@ class VideoComposerV2:
         self.height = int(v.get('height', 1920))
         self.fps = int(v.get('v2_fps', 30))
         self.duration = int(v.get('v2_duration_seconds', 6)) # Убедимся, что по умолчанию 6 секунд
+        # Длинные ролики (30–60 с): таймлайн режется на сегменты, каждый рендерит свой Chrome,
+        # сегменты склеиваются concat-демаксером без перекодирования. 0 — всегда одним проходом.
+        self.segment_seconds = float(v.get('v2_segment_seconds', 10) or 0)
+        self.segment_workers = int(v.get('v2_segment_workers', 0) or 0)
+        # Кадры → ffmpeg через кольцо слотов в shared memory и отдельный процесс-энкодер; 0 — в процессе
+        self.frame_ring_slots = int(v.get('v2_frame_ring_slots', 8) or 0)
         
         # Пути: один шаблон или пул (случайный выбор на каждый ролик) — см. v2_template_pool в config.ini
         self._template_candidates = self._build_template_candidates(v)
@@ -48,13 +127,48 @@ class VideoComposerV2:
         )
         self.temp_dir = config['PATHS'].get('tmp_dir', 'resources/tmp')
         self.outputs_dir = config['PATHS'].get('outputs_dir', 'outputs')
+        self.state_dir = config['PATHS'].get('state_dir', 'state')
         
         # Настройки захвата
         self.headless = str(v.get('v2_headless', 'true')).lower() == 'true'
+        # Сырые покадровые тайминги (.npz/.json) в state_dir/timings — для бенчмарков захвата
+        self.timing_dump = str(v.get('v2_timing_dump', 'false')).strip().lower() in ('1', 'true', 'yes', 'on')
         self._sandbox_theme_debug = self._parse_sandbox_theme_debug(v)
+        # Формат скриншота CDP: калибровка один раз на хост (state_dir/capture_tuning.json) —
+        # самый быстрый из jpeg/webp/png с SSIM не ниже порога; false — jpeg q95 как раньше
+        self.capture_autotune = str(v.get('v2_capture_autotune', 'true')).strip().lower() in ('1', 'true', 'yes', 'on')
+        self.capture_tuner = CaptureTuner(
+            self.state_dir,
+            min_ssim=float(v.get('v2_capture_min_ssim', 0.98) or 0),
+            max_age_days=float(v.get('v2_capture_retune_days', 30) or 0),
+        )
+        self._capture_settings: Dict[tuple, dict] = {}
+        self._capture_lock = threading.Lock()
+        # Обложка (<stem>_thumb.jpg) и спрайт-превью (<stem>_sprite.jpg/.json) из кадров захвата
+        self.thumbnails = str(v.get('v2_thumbnails', 'true')).strip().lower() in ('1', 'true', 'yes', 'on')
+        self.sprite_interval = float(v.get('v2_sprite_interval', 0.5) or 0.5)
+        self.sprite_columns = int(v.get('v2_sprite_columns', 10) or 10)
+        self.sprite_tile_width = int(v.get('v2_sprite_tile_width', 180) or 180)
+        self._thumbs: Optional[ThumbnailCollector] = None
+        
+        # HTML отдаётся в Chrome через CDP Page.setDocumentContent (cdp) или временным файлом (file)
+        self.template_delivery = str(v.get('v2_template_delivery', 'cdp')).strip().lower()
+        for candidate in self._template_candidates or [self.template_path]:
+            try:
+                self._compiled_template(candidate)
+            except Exception as e:
+                logger.warning("⚠️ Шаблон %s не скомпилирован: %s", candidate, e)
+
+        # Артефакты задачи (перекодированные медиа, smart_crop, тема) — переживают правку текста
+        self.artifacts = RenderArtifacts(config)
+        self._job = None
+        # Готовые ролики по контент-ключу: повтор того же поста не запускает захват
+        self.render_cache = RenderCache(config)
+        self._music: Optional[str] = None
         
         # Selenium driver - отложенная инициализация
         self.driver = None
+        self._driver_lock = threading.Lock()
         if len(self._template_candidates) > 1:
             logger.info(
                 "🎨 Пул шаблонов V2: %s файлов (каждый ролик — случайный выбор)",
@@ -147,18 +261,48 @@ class VideoComposerV2:
         logger.warning("⚠️ Основной шаблон v2_template_path не найден: %s", single)
         return [str(sp)]
 
-    def _pick_template_path(self) -> str:
-        """Случайный шаблон из пула (равномерно)."""
+    def _pick_template_path(self, seed: Optional[str] = None) -> str:
+        """Шаблон из пула (равномерно); с seed — детерминированно для одного и того же поста."""
         if not self._template_candidates:
             return self.template_path
         if len(self._template_candidates) == 1:
             return self._template_candidates[0]
-        chosen = str(np.random.choice(self._template_candidates))
+        if seed:
+            chosen = str(stable_choice(f"{seed}:template", self._template_candidates))
+        else:
+            chosen = str(np.random.choice(self._template_candidates))
         logger.info("🎨 Выбран шаблон: %s", chosen)
         return chosen
 
+    def _create_driver(self):
+        """Создаёт новый экземпляр Chrome с настройками захвата (без привязки к self.driver)."""
+        try:
+            from selenium import webdriver
+            from selenium.webdriver.chrome.options import Options
+        except ImportError:
+            logger.error("❌ Selenium не установлен. Выполните: pip install selenium")
+            raise
+
+        chrome_options = Options()
+        if self.headless:
+            chrome_options.add_argument("--headless=new")
+        chrome_options.add_argument(f"--window-size={self.width},{self.height}")
+        chrome_options.add_argument("--no-sandbox")
+        chrome_options.add_argument("--disable-dev-shm-usage")
+        chrome_options.add_argument("--disable-gpu")
+        chrome_options.add_argument("--hide-scrollbars")
+        chrome_options.add_argument("--disable-extensions")
+        chrome_options.add_argument("--disable-plugins")
+        chrome_options.add_experimental_option('excludeSwitches', ['enable-logging'])
+        return webdriver.Chrome(options=chrome_options)
+
     def _setup_selenium(self):
         """Настройка Selenium WebDriver (отложенная инициализация)"""
+        # Chrome может запускаться заранее из prepare() — параллельно с рендером предыдущего поста
+        with self._driver_lock:
+            self._setup_selenium_locked()
+
+    def _setup_selenium_locked(self):
         # Проверяем, что браузер существует и сессия активна
         if self.driver:
             try:
@@ -172,35 +316,19 @@ class VideoComposerV2:
                 self.driver = None
         
         try:
-            from selenium import webdriver
-            from selenium.webdriver.chrome.options import Options
-            
-            chrome_options = Options()
             if self.headless:
-                chrome_options.add_argument("--headless=new")
                 logger.info("🔒 Браузер запускается в фоновом режиме (headless)")
             else:
                 logger.warning("⚠️ Браузер запускается в видимом режиме (не headless)")
-            
-            chrome_options.add_argument(f"--window-size={self.width},{self.height}")
-            chrome_options.add_argument("--no-sandbox")
-            chrome_options.add_argument("--disable-dev-shm-usage")
-            chrome_options.add_argument("--disable-gpu")
-            chrome_options.add_argument("--hide-scrollbars")
-            chrome_options.add_argument("--disable-extensions")
-            chrome_options.add_argument("--disable-plugins")
-            chrome_options.add_experimental_option('excludeSwitches', ['enable-logging'])
-            
-            self.driver = webdriver.Chrome(options=chrome_options)
+            self.driver = self._create_driver()
             logger.info("✅ Selenium WebDriver инициализирован")
         except ImportError:
-            logger.error("❌ Selenium не установлен. Выполните: pip install selenium")
             raise
         except Exception as e:
             logger.error(f"❌ Ошибка инициализации Selenium: {e}")
             raise
 
-    def _preprocess_media(self, media_path: str) -> Optional[str]:
+    def _preprocess_media(self, media_path: str, job=None) -> Optional[str]:
         """Копирует медиафайл во временную папку, обрезает видео до нужной длительности и возвращает его file:// URI."""
         if not media_path or not Path(media_path).exists():
             return None
@@ -211,11 +339,19 @@ class VideoComposerV2:
             
             timestamp = int(time.time_ns() / 1000)
             ext = Path(media_path).suffix.lower()
+
+            job = job if job is not None else self._job
+            cached_name = f"media_{media_fingerprint(media_path)}_{self.duration}s{ext}"
+            if job is not None:
+                cached = job.file(cached_name)
+                if cached:
+                    logger.info(f"♻️ Медиа из кэша задачи: {cached.name}")
+                    return cached.resolve().as_uri()
             
             # Если это видео, обрезаем его до нужной длительности с перекодированием для точности
             if ext in ['.mp4', '.webm', '.mov']:
                 trimmed_filename = f"media_{timestamp}_trimmed{ext}"
-                trimmed_path = temp_media_dir / trimmed_filename
+                trimmed_path = job.path(cached_name) if job is not None else temp_media_dir / trimmed_filename
                 
                 # Принудительно перекодируем видео, чтобы гарантировать точную длительность.
                 # Это решает проблему ускоренного воспроизведения из-за неточного `copy`.
@@ -235,9 +371,13 @@ class VideoComposerV2:
                 
                 try:
                     subprocess.run(command, check=True, capture_output=True, text=True)
+                    if job is not None:
+                        trimmed_path = job.commit(cached_name, trimmed_path)
                     logger.info(f"✂️ Видео обрезано до {self.duration} секунд (с перекодированием): {trimmed_path}")
                     return trimmed_path.resolve().as_uri()
                 except subprocess.CalledProcessError as e:
+                    if job is not None:
+                        job.discard(trimmed_path)
                     logger.error(f"⚠️ Не удалось обрезать видео с перекодированием: {e.stderr}. Используем оригинал.")
                     # Fallback: если не получилось обрезать, используем оригинал
                     unique_filename = f"media_{timestamp}{ext}"
@@ -249,7 +389,15 @@ class VideoComposerV2:
                 # Для изображений просто копируем
                 unique_filename = f"media_{timestamp}{ext}"
                 local_path = temp_media_dir / unique_filename
-                shutil.copy2(media_path, local_path)
+                if job is not None:
+                    tmp_path = job.path(cached_name)
+                    try:
+                        shutil.copy2(media_path, tmp_path)
+                        local_path = job.commit(cached_name, tmp_path)
+                    finally:
+                        job.discard(tmp_path)
+                else:
+                    shutil.copy2(media_path, local_path)
                 logger.info(f"Медиа скопировано во временную папку: {local_path}")
                 return local_path.resolve().as_uri()
             
@@ -257,13 +405,45 @@ class VideoComposerV2:
             logger.error(f"Ошибка обработки медиа: {e}")
             return None
 
-    def _create_html_from_template(self, video_data: dict) -> str:
-        """Создает HTML файл из шаблона с подстановкой данных"""
-        template_path = Path(self.template_path)
-        if not template_path.exists():
-            raise FileNotFoundError(f"Шаблон не найден: {self.template_path}")
+    def _pick_theme(self, seed: Optional[str] = None) -> int:
+        """Тема 1..5: отладочная → по seed поста (детерминированно) или случайно."""
+        if self._sandbox_theme_debug is not None:
+            logger.info("🎨 V2 color theme: %s (debug)", self._sandbox_theme_debug)
+            return self._sandbox_theme_debug
+        if seed:
+            theme_id = int(stable_choice(f"{seed}:theme", range(1, 6)))
+        else:
+            theme_id = int(np.random.randint(1, 6))
+        logger.info("🎨 V2 color theme: %s", theme_id)
+        return theme_id
+
+    def _pick_music(self, seed: str) -> Optional[str]:
+        """Трек на ролик выбирается заранее — он входит в ключ кэша рендера."""
+        music_dir = Path(self.config['PATHS'].get('music_dir', 'resources/music'))
+        music_files = sorted(str(p) for p in music_dir.glob('*.mp3')) if music_dir.exists() else []
+        return stable_choice(f"{seed}:music", music_files)
 
-        html_content = template_path.read_text('utf-8')
+    def _media_layout(self, path: str, job=None):
+        """smart_crop: из кэша задачи, если он включён."""
+        job = job if job is not None else self._job
+        if job is not None:
+            return job.media_layout(path)
+        from services.smart_crop import compute_media_layout
+        return compute_media_layout(path)
+
+    def _head_inject(self) -> str:
+        """CSS захвата + длительность ролика — вшиваются в шаблон при компиляции."""
+        # Полная длительность ролика для карусели/seek: __cinematicDuration — лишь период GSAP-петли (6 с)
+        return CAPTURE_CSS + f"<script>window.__renderDuration = {float(self.duration)};</script>\n"
+
+    def _compiled_template(self, path: str):
+        if not Path(path).exists():
+            raise FileNotFoundError(f"Шаблон не найден: {path}")
+        return compile_template(path, self._head_inject())
+
+    def _create_html_from_template(self, video_data: dict) -> str:
+        """Собирает HTML из скомпилированного шаблона (строка в памяти, на диск не пишется)."""
+        compiled = self._compiled_template(self.template_path)
         
         # Подготовка данных
         title = video_data.get('title', 'Заголовок')
@@ -279,14 +459,11 @@ class VideoComposerV2:
         else:
             media_paths = []
 
-        image_exts = {'.jpg', '.jpeg', '.png', '.webp', '.bmp'}
-        video_exts = {'.mp4', '.webm', '.mov', '.mkv'}
-
         def _media_kind(path: str) -> Optional[str]:
             ext = Path(path).suffix.lower()
-            if ext in image_exts:
+            if ext in IMAGE_EXTS:
                 return 'image'
-            if ext in video_exts:
+            if ext in VIDEO_EXTS:
                 return 'video'
             return None
 
@@ -311,8 +488,7 @@ class VideoComposerV2:
                 else:
                     news_video = first['src']
                 try:
-                    from services.smart_crop import compute_media_layout
-                    layout = compute_media_layout(known_paths[0])
+                    layout = self._media_layout(known_paths[0])
                     media_focus_css = layout.focus_css
                     media_fit = layout.fit if layout.fit in ('cover', 'contain') else 'cover'
                 except Exception as e:
@@ -330,8 +506,7 @@ class VideoComposerV2:
                 news_video = media_uri or ''
             if media_uri:
                 try:
-                    from services.smart_crop import compute_media_layout
-                    layout = compute_media_layout(p0)
+                    layout = self._media_layout(p0)
                     media_focus_css = layout.focus_css
                     media_fit = layout.fit if layout.fit in ('cover', 'contain') else 'cover'
                 except Exception as e:
@@ -346,69 +521,39 @@ class VideoComposerV2:
             return j.replace("<", "\\u003c")
 
         replacements = {
-            '{{NEWS_TITLE}}': title,
-            '{{NEWS_BRIEF}}': summary.replace('\n', '\\n'),  # legacy: шаблоны с бэктиками
-            '{{NEWS_BRIEF_JSON}}': _brief_json_for_html(summary),
-            '{{NEWS_IMAGE}}': news_image,
-            '{{NEWS_VIDEO}}': news_video,
-            '{{CAROUSEL_IMAGES_JSON}}': json.dumps(carousel_items, ensure_ascii=False).replace("<", "\\u003c"),
-            '{{SOURCE_NAME}}': source_text,
-            '{{QR_CODE_PATH}}': qr_uri,
-            '{{MEDIA_FOCUS}}': media_focus_css,
-            '{{MEDIA_FIT}}': media_fit,
+            'NEWS_TITLE': title,
+            'NEWS_BRIEF': summary.replace('\n', '\\n'),  # legacy: шаблоны с бэктиками
+            'NEWS_BRIEF_JSON': _brief_json_for_html(summary),
+            'NEWS_IMAGE': news_image,
+            'NEWS_VIDEO': news_video,
+            'CAROUSEL_IMAGES_JSON': json.dumps(carousel_items, ensure_ascii=False).replace("<", "\\u003c"),
+            'SOURCE_NAME': source_text,
+            'QR_CODE_PATH': qr_uri,
+            'MEDIA_FOCUS': media_focus_css,
+            'MEDIA_FIT': media_fit,
         }
 
-        for placeholder, value in replacements.items():
-            html_content = html_content.replace(placeholder, str(value or ''))
-
-        # Покадровый захват: CSS-анимации (спиннер и т.д.) идут по wall-clock между скриншотами —
-        # ставим body.v2-capture и фазу через отрицательный animation-delay по виртуальному времени кадра.
-        _capture_spinner_css = """
-<style id="v2-frame-capture-css">
-body.v2-capture .spinner::before,
-body.v2-capture .spinner::after {
-    animation-play-state: paused !important;
-    animation-delay: var(--spin-delay, 0s) !important;
-}
-body.v2-capture .loader .dot {
-    animation-play-state: paused !important;
-    animation-delay: var(--dot-anim-delay, 0s) !important;
-}
-</style>
-"""
-        if "</head>" in html_content:
-            html_content = html_content.replace("</head>", _capture_spinner_css + "\n</head>", 1)
-        if self._sandbox_theme_debug is not None:
-            theme_id = self._sandbox_theme_debug
-            logger.info("🎨 V2 color theme: %s (debug)", theme_id)
-        else:
-            theme_id = int(np.random.randint(1, 6))
-            logger.info("🎨 V2 color theme: %s", theme_id)
-        html_content = re.sub(
-            r"<body\b[^>]*>",
-            f'<body class="v2-capture v2-theme-{theme_id}">',
-            html_content,
-            count=1,
-        )
-
-        temp_html_path = Path(self.temp_dir) / f"temp_short_{int(time.time())}.html"
-        temp_html_path.write_text(html_content, 'utf-8')
-        logger.info(f"📄 HTML создан: {temp_html_path}")
-        return str(temp_html_path)
+        theme_id = video_data.get('theme') or self._pick_theme()
+        html_content = compiled.render(replacements, theme_id)
+        logger.info(f"📄 HTML собран в памяти: {Path(self.template_path).name} ({len(html_content)} символов)")
+        return html_content
 
-    def _sync_media_state(self, frame_time: float) -> bool:
+    def _sync_media_state(self, frame_time: float, driver=None) -> str:
         """
         Синхронизирует видео и анимации на странице на конкретный момент времени.
         Использует execute_async_script для ожидания завершения seek.
+
+        Возвращает 'ok', 'timeout' (seek не успел за 200 мс) или 'error'.
         """
+        driver = driver or self.driver
         try:
-            return self.driver.execute_async_script(
+            status = driver.execute_async_script(
                 """
 const frameTime = arguments[0];
 const callback = arguments[arguments.length - 1];
 const clampedTime = Math.max(0, frameTime);
 
-function finalize(success) {
+function finalize(status) {
     try {
         let timeline = null;
         if (window.__cinematicTimeline) {
@@ -481,18 +626,23 @@ function finalize(success) {
     } catch (err) {
         console.error('Carousel sync', err);
     }
-    callback(success);
+    callback(status);
 }
 
 function seekVideoTo(video, targetTime, done) {
     if (!video) {
-        done(true);
+        done('ok');
         return;
     }
-    const videoDuration = isFinite(video.duration) && video.duration > 0
+    const hasDuration = isFinite(video.duration) && video.duration > 0;
+    const videoDuration = hasDuration
         ? Math.max(0, video.duration - 0.032)
         : targetTime;
-    const t = Math.min(Math.max(0, targetTime), videoDuration);
+    // Длинный ролик поверх короткого клипа: зацикленное видео крутится по кругу, а не замирает
+    const wrapped = (video.loop && hasDuration && targetTime > videoDuration)
+        ? targetTime % video.duration
+        : targetTime;
+    const t = Math.min(Math.max(0, wrapped), videoDuration);
     const cleanup = () => {
         video.onseeked = null;
         video.onloadeddata = null;
@@ -501,12 +651,12 @@ function seekVideoTo(video, targetTime, done) {
     video.pause();
     const seekTimeout = setTimeout(() => {
         cleanup();
-        done(true);
+        done('timeout');
     }, 200);
     video.onseeked = () => {
         clearTimeout(seekTimeout);
         cleanup();
-        done(true);
+        done('ok');
     };
     try {
         video.currentTime = t;
@@ -515,7 +665,7 @@ function seekVideoTo(video, targetTime, done) {
         console.error('Video seek error', err);
         clearTimeout(seekTimeout);
         cleanup();
-        done(false);
+        done('error');
     }
 }
 
@@ -523,8 +673,9 @@ const carouselVid = document.querySelector('#mediaCarousel.carousel.is-active .c
 const mainVideo = document.getElementById('mediaVideo');
 
 if (carouselVid) {
-    const total = (window.__cinematicDuration && window.__cinematicDuration > 0)
-        ? window.__cinematicDuration : 6;
+    const total = (window.__renderDuration && window.__renderDuration > 0)
+        ? window.__renderDuration
+        : ((window.__cinematicDuration && window.__cinematicDuration > 0) ? window.__cinematicDuration : 6);
     const slides = document.querySelectorAll('#mediaCarousel .carousel-slide');
     const n = Math.max(1, slides.length);
     const slideSec = total / n;
@@ -535,58 +686,119 @@ if (carouselVid) {
 } else if (mainVideo && mainVideo.style.display !== 'none') {
     seekVideoTo(mainVideo, clampedTime, finalize);
 } else {
-    finalize(true);
+    finalize('ok');
 }
                 """,
                 frame_time,
             )
+            return status if status in ('ok', 'timeout') else 'error'
         except Exception as e:
             logger.debug(f"Не удалось синхронизировать медиа: {e}")
-            return False
+            return 'error'
 
-    def _capture_animation_frames_precise(self) -> list:
+    def _capture_animation_frames_precise(
+        self,
+        driver=None,
+        start_frame: int = 0,
+        end_frame: Optional[int] = None,
+        on_frame=None,
+        timings: Optional[CaptureTimings] = None,
+        ring: Optional[FrameRingEncoder] = None,
+    ) -> list:
         """
         Захватывает кадры с покадровой синхронизацией видео и анимаций.
+
+        start_frame/end_frame — диапазон кадров общего таймлайна (для сегментного рендера).
+        on_frame — если задан, кадр сразу отдаётся в него (например, в stdin ffmpeg),
+        и в памяти ничего не копится; иначе возвращается список кадров.
+        timings — куда писать покадровые тайминги фаз (см. services.render_timing).
+        ring — кольцо кадров энкодера: RGB-конверсия пишет прямо в слот shared memory.
         """
-        num_frames = int(self.duration * self.fps)
-        logger.info(f"📹 Захватываем {num_frames} кадров с покадровой синхронизацией...")
+        driver = driver or self.driver
+        total_frames = int(self.duration * self.fps)
+        end_frame = total_frames if end_frame is None else min(end_frame, total_frames)
+        num_frames = max(0, end_frame - start_frame)
+        if timings is None:
+            timings = CaptureTimings(num_frames, engine=self._capture_engine_name())
+        logger.info(
+            f"📹 Захватываем {num_frames} кадров с покадровой синхронизацией "
+            f"(кадры {start_frame}..{end_frame - 1})..."
+        )
 
         frames = []
+        captured = 0
+        capture_params = screenshot_params(self._current_capture_settings())
+        thumbs = self._thumbs
+        if ring is not None and on_frame is None:
+            on_frame = ring.write
 
-        for i in range(num_frames):
+        def _emit(index: int, frame_rgb: np.ndarray) -> None:
+            nonlocal captured
+            captured += 1
+            if on_frame is not None:
+                on_frame(frame_rgb)
+            else:
+                frames.append(frame_rgb)
+            timings.mark("encode")
+            if thumbs is not None:
+                thumbs.observe(index, frame_rgb)
+                timings.mark("thumbs")
+
+        for i in range(start_frame, end_frame):
             frame_time = min(i / self.fps, self.duration - (1 / self.fps))
+            timings.start_frame()
 
-            sync_ok = self._sync_media_state(frame_time)
-            if not sync_ok:
-                logger.debug(f"Frame {i}: синхронизация вернула false, продолжаем.")
+            sync_state = self._sync_media_state(frame_time, driver)
+            timings.mark("seek")
+            if sync_state == 'timeout':
+                timings.seek_timeouts += 1
+            elif sync_state != 'ok':
+                logger.debug(f"Frame {i}: синхронизация вернула {sync_state}, продолжаем.")
 
             # Небольшая пауза, чтобы страница успела перерисоваться
             time.sleep(0.01)
+            timings.mark("settle")
 
             try:
-                screenshot_data = self.driver.execute_cdp_cmd(
-                    "Page.captureScreenshot",
-                    {
-                        "format": "jpeg",
-                        "quality": 95,
-                    }
-                )
+                screenshot_data = driver.execute_cdp_cmd("Page.captureScreenshot", capture_params)
+                timings.mark("screenshot")
             except Exception:
                 # Fallback на обычный скриншот
-                screenshot_png = self.driver.get_screenshot_as_png()
-                image = Image.open(io.BytesIO(screenshot_png))
+                screenshot_png = driver.get_screenshot_as_png()
+                timings.mark("screenshot")
+                image = Image.open(io.BytesIO(screenshot_png)).convert('RGB')
+                timings.mark("imdecode")
                 if image.size != (self.width, self.height):
                     image = image.resize((self.width, self.height), Image.Resampling.LANCZOS)
-                frames.append(np.array(image))
+                    timings.mark("resize")
+                _emit(i, np.array(image))
                 continue
 
-            jpeg_bytes = base64.b64decode(screenshot_data['data'])
-            frame_bgr = cv2.imdecode(np.frombuffer(jpeg_bytes, np.uint8), cv2.IMREAD_COLOR)
+            image_bytes = base64.b64decode(screenshot_data['data'])
+            timings.mark("b64decode")
+            frame_bgr = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+            timings.mark("imdecode")
             if frame_bgr is None:
                 logger.error(f"Frame {i}: cv2.imdecode returned None.")
+                timings.dropped_frames += 1
+                continue
+
+            if ring is not None and frame_bgr.shape[:2] == (self.height, self.width):
+                # Без промежуточного массива: BGR→RGB сразу в свободный слот кольца
+                slot = ring.slot()
+                timings.mark("encode")
+                cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB, dst=slot)
+                ring.commit()
+                timings.mark("convert")
+                captured += 1
+                # Слот переиспользуется только следующим slot() этого же потока — читать его ещё можно
+                if thumbs is not None:
+                    thumbs.observe(i, slot)
+                    timings.mark("thumbs")
                 continue
 
             frame_rgb = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB)
+            timings.mark("convert")
 
             if (frame_rgb.shape[1], frame_rgb.shape[0]) != (self.width, self.height):
                 frame_rgb = cv2.resize(
@@ -594,12 +806,47 @@ if (carouselVid) {
                     (self.width, self.height),
                     interpolation=cv2.INTER_AREA
                 )
+                timings.mark("resize")
 
-            frames.append(frame_rgb)
+            _emit(i, frame_rgb)
 
-        logger.info(f"✅ Захвачено {len(frames)} кадров")
+        timings.finish()
+        logger.info(f"✅ Захвачено {captured} кадров")
         return frames
 
+    def _capture_engine_name(self) -> str:
+        """Метка движка захвата для сравнения таймингов между бенчмарками."""
+        return engine_name(self._current_capture_settings())
+
+    def _current_capture_settings(self) -> dict:
+        return self._capture_settings.get((self.width, self.height), DEFAULT_SETTINGS)
+
+    def _tune_capture(self, driver) -> None:
+        """
+        Формат скриншота для текущего вьюпорта: из state_dir или калибровкой на только что
+        загруженной странице (середина таймлайна — медиа и текст уже на экране).
+        Сегменты грузят страницы параллельно, калибрует только первый.
+        """
+        if not self.capture_autotune:
+            return
+        size = (self.width, self.height)
+        with self._capture_lock:
+            if size in self._capture_settings:
+                return
+            try:
+                self._sync_media_state(self.duration / 2, driver)
+                entry = self.capture_tuner.settings_for(driver, *size)
+                self._capture_settings[size] = {"format": entry["format"], "quality": entry.get("quality")}
+            except Exception as e:
+                logger.warning(f"⚠️ Калибровка захвата не удалась ({e}) — jpeg q95")
+                self._capture_settings[size] = dict(DEFAULT_SETTINGS)
+
+    def _report_timings(self, timings: CaptureTimings, output_path: str) -> None:
+        """Сводка по задаче в лог; при v2_timing_dump — сырой массив в state_dir/timings."""
+        job_name = Path(output_path).stem
+        timings.log_summary(job_name)
+        if self.timing_dump:
+            timings.save(str(Path(self.state_dir) / 'timings'), job_name)
 
     def _capture_animation_frames(self) -> list:
         """Захватывает кадры анимации из браузера (старый метод)."""
@@ -667,6 +914,8 @@ if (carouselVid) {
             return output_path
 
     def _get_random_music(self) -> Optional[str]:
+        if self._music:
+            return self._music
         music_dir = Path(self.config['PATHS'].get('music_dir', 'resources/music'))
         if not music_dir.exists():
             return None
@@ -674,12 +923,373 @@ if (carouselVid) {
         music_files = list(music_dir.glob('*.mp3'))
         return str(np.random.choice(music_files)) if music_files else None
 
-    async def compose(self, short_text: Union[str, dict], media_path: Union[str, list, None], output_path: str, source_text: str) -> str:
+    def _segment_plan(self) -> List[tuple]:
+        """
+        Диапазоны кадров (start, end) для сегментного рендера.
+        Пустой список — ролик короткий, рендерим одним проходом как раньше.
+        """
+        if self.segment_seconds <= 0 or self.duration <= self.segment_seconds:
+            return []
+        total_frames = int(self.duration * self.fps)
+        seg_frames = max(1, int(round(self.segment_seconds * self.fps)))
+        return [
+            (start, min(start + seg_frames, total_frames))
+            for start in range(0, total_frames, seg_frames)
+        ]
+
+    def _segment_worker_count(self, n_segments: int) -> int:
+        if self.segment_workers > 0:
+            return max(1, min(self.segment_workers, n_segments))
+        # Каждый Chrome сам многопоточный — по умолчанию один браузер на два ядра
+        return max(1, min(n_segments, (os.cpu_count() or 2) // 2))
+
+    def _apply_viewport(self, driver) -> None:
+        """Точный размер вьюпорта (self.width x self.height) через CDP — окно браузера не пересоздаём."""
+        try:
+            driver.execute_cdp_cmd(
+                "Emulation.setDeviceMetricsOverride",
+                {
+                    "width": self.width,
+                    "height": self.height,
+                    "deviceScaleFactor": 1,
+                    "mobile": False,
+                },
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось задать вьюпорт {self.width}x{self.height}: {e}")
+
+    def _capture_host_uri(self) -> str:
+        host = Path(self.temp_dir) / 'v2_capture_host.html'
+        if not host.is_file():
+            host.parent.mkdir(parents=True, exist_ok=True)
+            host.write_text(CAPTURE_HOST_HTML, 'utf-8')
+        return host.resolve().as_uri()
+
+    def _html_file(self, html: str) -> Path:
+        """Запасной путь: HTML во временном файле (имя по хэшу — сегменты одного ролика делят файл)."""
+        digest = hashlib.sha1(html.encode('utf-8')).hexdigest()[:16]
+        path = Path(self.temp_dir) / f"temp_short_{digest}.html"
+        if not path.is_file():
+            tmp = path.with_suffix(f'.{threading.get_ident()}.tmp')
+            tmp.write_text(html, 'utf-8')
+            os.replace(tmp, path)
+        return path
+
+    def _open_document(self, driver, html: str) -> None:
+        if self.template_delivery == 'cdp':
+            try:
+                driver.get(self._capture_host_uri())
+                frame_id = driver.execute_cdp_cmd('Page.getFrameTree', {})['frameTree']['frame']['id']
+                driver.execute_cdp_cmd('Page.setDocumentContent', {'frameId': frame_id, 'html': html})
+                logger.info(f"🌐 HTML передан в Chrome через CDP ({len(html)} символов)")
+                return
+            except Exception as e:
+                logger.warning(f"⚠️ Page.setDocumentContent недоступен ({e}) — переходим на временный файл")
+                self.template_delivery = 'file'
+        html_uri = self._html_file(html).resolve().as_uri()
+        logger.info(f"🌐 Загружаем HTML в Selenium: {html_uri}")
+        driver.get(html_uri)
+
+    def _load_page(self, driver, html: str, media_path) -> bool:
+        """Открывает HTML в браузере и ждёт появления медиа-элемента (до 15 секунд)."""
+        self._apply_viewport(driver)
+        self._open_document(driver, html)
+
+        logger.info("Ожидаем загрузки и отображения медиа в браузере...")
+        wait = WebDriverWait(driver, 15)  # Ждем до 15 секунд
+
+        media_loaded_successfully = False
+        mp = media_path
+        if isinstance(mp, (list, tuple)) and len(mp) >= 2:
+            try:
+                wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, '#mediaCarousel .carousel-slide')))
+                logger.info("✅ Карусель медиа готова")
+                media_loaded_successfully = True
+            except Exception:
+                logger.warning("⚠️ Карусель не появилась за 15 секунд.")
+        elif mp:
+            first = mp[0] if isinstance(mp, (list, tuple)) else mp
+            ext = Path(str(first)).suffix.lower()
+            element_id = None
+            if ext in ['.mp4', '.webm', '.mov']:
+                element_id = "mediaVideo"
+            elif ext in ['.jpg', '.jpeg', '.png', '.webp']:
+                element_id = "mediaImage"
+
+            if element_id:
+                try:
+                    wait.until(EC.visibility_of_element_located((By.ID, element_id)))
+                    logger.info(f"✅ Медиа-элемент '{element_id}' стал видимым.")
+                    media_loaded_successfully = True
+                except Exception:
+                    logger.warning(f"⚠️ Элемент '{element_id}' не стал видимым за 15 секунд.")
+
+        if not media_loaded_successfully:
+            logger.warning("Не удалось дождаться медиа. Захват может быть некорректным.")
+        self._tune_capture(driver)
+        return media_loaded_successfully
+
+    def _open_segment_encoder(self, segment_path: Path) -> subprocess.Popen:
+        return subprocess.Popen(
+            self._segment_encoder_command(segment_path), stdin=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+
+    def _segment_encoder_command(self, segment_path: Path) -> List[str]:
+        """
+        ffmpeg, принимающий сырые RGB-кадры в stdin. Все сегменты кодируются с одинаковыми
+        параметрами и фиксированным GOP (ключевой кадр раз в секунду, без scenecut), поэтому
+        concat-демаксер склеивает их без перекодирования.
+        """
+        command = [
+            'ffmpeg', '-y',
+            '-f', 'rawvideo',
+            '-pix_fmt', 'rgb24',
+            '-s', f'{self.width}x{self.height}',
+            '-r', str(self.fps),
+            '-i', '-',
+            '-an',
+            '-c:v', 'libx264',
+            '-preset', 'veryfast',
+            '-crf', '20',
+            '-pix_fmt', 'yuv420p',
+            '-g', str(self.fps),
+            '-keyint_min', str(self.fps),
+            '-sc_threshold', '0',
+            '-video_track_timescale', str(self.fps * 1000),
+            '-loglevel', 'error',
+            str(segment_path),
+        ]
+        return command
+
+    def _final_encoder_command(self, output_path: str) -> List[str]:
+        """ffmpeg для ролика целиком: сырые RGB-кадры из stdin + музыка, зацикленная на всю длину."""
+        command = [
+            'ffmpeg', '-y',
+            '-f', 'rawvideo',
+            '-pix_fmt', 'rgb24',
+            '-s', f'{self.width}x{self.height}',
+            '-r', str(self.fps),
+            '-i', '-',
+        ]
+        music_path = self._get_random_music()
+        if music_path:
+            logger.info(f"🎵 Добавляем аудио: {music_path}")
+            command += ['-stream_loop', '-1', '-i', music_path, '-map', '0:v:0', '-map', '1:a:0', '-c:a', 'aac']
+        command += [
+            '-t', str(self.duration),
+            '-c:v', 'libx264',
+            '-preset', 'veryfast',
+            '-crf', '20',
+            '-pix_fmt', 'yuv420p',
+            '-movflags', '+faststart',
+            '-loglevel', 'error',
+            str(output_path),
+        ]
+        return command
+
+    def _ring_shape(self) -> tuple:
+        return (self.height, self.width, 3)
+
+    def _render_segment(self, html: str, media_path, index: int, start_frame: int, end_frame: int) -> tuple:
+        """
+        Рендер одного сегмента в отдельном Chrome: кадры сразу уходят в ffmpeg,
+        поэтому память не растёт с длиной ролика.
+        """
+        segment_path = Path(self.temp_dir) / f"segment_{os.getpid()}_{time.time_ns()}_{index:03d}.mp4"
+        driver = self._create_driver()
+        encoder = None
+        ring = None
+        try:
+            self._load_page(driver, html, media_path)
+            timings = CaptureTimings(end_frame - start_frame, engine=self._capture_engine_name())
+            if self.frame_ring_slots:
+                ring = FrameRingEncoder(
+                    self._segment_encoder_command(segment_path), self._ring_shape(), self.frame_ring_slots
+                )
+                self._capture_animation_frames_precise(
+                    driver, start_frame, end_frame, timings=timings, ring=ring
+                )
+                ring.close()
+            else:
+                encoder = self._open_segment_encoder(segment_path)
+
+                def _write(frame_rgb: np.ndarray) -> None:
+                    encoder.stdin.write(np.ascontiguousarray(frame_rgb).tobytes())
+
+                self._capture_animation_frames_precise(
+                    driver, start_frame, end_frame, on_frame=_write, timings=timings
+                )
+                encoder.stdin.close()
+                stderr = encoder.stderr.read().decode('utf-8', errors='replace')
+                if encoder.wait() != 0:
+                    raise RuntimeError(f"ffmpeg сегмента {index}: {stderr.strip()}")
+            logger.info(f"🧩 Сегмент {index} готов: {segment_path.name}")
+            return str(segment_path), timings
+        finally:
+            if ring is not None:
+                ring.abort()
+            if encoder is not None and encoder.poll() is None:
+                encoder.kill()
+            try:
+                driver.quit()
+            except Exception:
+                pass
+
+    def _concat_segments(self, segment_paths: List[str], output_path: str) -> str:
+        """Склейка сегментов concat-демаксером (-c:v copy) + музыка, зацикленная на всю длину."""
+        final_video_path = Path(output_path)
+        final_video_path.parent.mkdir(parents=True, exist_ok=True)
+        list_path = Path(self.temp_dir) / f"segments_{final_video_path.stem}.txt"
+        list_path.write_text(
+            "".join(f"file '{Path(p).resolve().as_posix()}'\n" for p in segment_paths),
+            'utf-8',
+        )
+
+        command = ['ffmpeg', '-y', '-f', 'concat', '-safe', '0', '-i', str(list_path)]
+        music_path = self._get_random_music()
+        if music_path:
+            logger.info(f"🎵 Добавляем аудио: {music_path}")
+            command += ['-stream_loop', '-1', '-i', music_path, '-c:a', 'aac', '-t', str(self.duration)]
+        command += [
+            '-map', '0:v:0',
+            *(['-map', '1:a:0'] if music_path else []),
+            '-c:v', 'copy',
+            '-movflags', '+faststart',
+            '-loglevel', 'error',
+            str(final_video_path),
+        ]
+        try:
+            subprocess.run(command, check=True, capture_output=True, text=True)
+            logger.info(f"✅ Сегменты склеены: {len(segment_paths)} шт. → {final_video_path}")
+            return str(final_video_path)
+        finally:
+            list_path.unlink(missing_ok=True)
+            for p in segment_paths:
+                Path(p).unlink(missing_ok=True)
+
+    async def _compose_segmented(self, html: str, media_path, output_path: str, plan: List[tuple]) -> str:
+        """Параллельный рендер сегментов на отдельных браузерах и склейка без перекодирования."""
+        from concurrent.futures import ThreadPoolExecutor
+
+        workers = self._segment_worker_count(len(plan))
+        logger.info(
+            "🧩 Сегментный рендер: %s с → %s сегментов по %.1f с, параллельно %s браузеров",
+            self.duration, len(plan), self.segment_seconds, workers,
+        )
+        loop = asyncio.get_running_loop()
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="v2-segment") as pool:
+            jobs = [
+                loop.run_in_executor(pool, self._render_segment, html, media_path, i, start, end)
+                for i, (start, end) in enumerate(plan)
+            ]
+            results = await asyncio.gather(*jobs, return_exceptions=True)
+
+        done = [r for r in results if isinstance(r, tuple)]
+        segment_paths = [path for path, _ in done]
+        errors = [r for r in results if isinstance(r, BaseException)]
+        if errors:
+            for p in segment_paths:
+                Path(p).unlink(missing_ok=True)
+            raise RuntimeError(f"Сегментный рендер не удался: {errors[0]}") from errors[0]
+        await asyncio.to_thread(self._report_timings, CaptureTimings.merge(t for _, t in done), output_path)
+        return await asyncio.to_thread(self._concat_segments, segment_paths, output_path)
+
+    def _new_thumbnail_collector(self, media_path) -> Optional[ThumbnailCollector]:
+        """Коллектор обложки под текущий вьюпорт; фокус и доля лица — из smart_crop первого медиа."""
+        if not self.thumbnails:
+            return None
+        focus, face_ratio = None, 0.0
+        media_files = media_list(media_path)
+        if media_files:
+            try:
+                layout = self._media_layout(media_files[0])
+                focus, face_ratio = (layout.focus_x, layout.focus_y), layout.face_ratio
+            except Exception as e:
+                logger.debug(f"smart_crop для обложки недоступен: {e}")
+        return ThumbnailCollector(
+            self.width, self.height, self.fps, self.duration,
+            focus=focus,
+            face_ratio=face_ratio,
+            sprite_interval=self.sprite_interval,
+            sprite_columns=self.sprite_columns,
+            tile_width=self.sprite_tile_width,
+        )
+
+    async def _render_variant(self, html: str, media_path, output_path: str) -> tuple:
+        """Загрузка страницы, захват и экспорт одного файла; возвращает (путь, {суффикс: файл-спутник})."""
+        self._thumbs = await asyncio.to_thread(self._new_thumbnail_collector, media_path)
+        try:
+            final_path = await self._render_variant_video(html, media_path, output_path)
+            side_files = await asyncio.to_thread(self._thumbs.export, final_path) if self._thumbs else {}
+        finally:
+            self._thumbs = None
+        return final_path, side_files
+
+    async def _render_variant_video(self, html: str, media_path, output_path: str) -> str:
+        """Загрузка страницы в текущем вьюпорте, захват и экспорт одного файла."""
+        plan = self._segment_plan()
+        if plan:
+            return await self._compose_segmented(html, media_path, output_path, plan)
+
+        # Инициализируем браузер только когда он действительно нужен.
+        # Запуск Chrome, driver.get и WebDriverWait блокируют — всё в потоке, loop свободен для Telethon
+        await asyncio.to_thread(self._setup_selenium)
+        await asyncio.to_thread(self._load_page, self.driver, html, media_path)
+
+        # Убираем все ожидания, так как виртуальное время само все синхронизирует.
+        # logger.info("⏳ Ожидание загрузки GSAP и выполнения анимаций...")
+        # await asyncio.sleep(3) 
+
+        timings = CaptureTimings(int(self.duration * self.fps), engine=self._capture_engine_name())
+        if self.frame_ring_slots:
+            return await asyncio.to_thread(self._capture_to_ring, output_path, timings)
+
+        frames = await asyncio.to_thread(
+            self._capture_animation_frames_precise, None, 0, None, None, timings
+        )
+        await asyncio.to_thread(self._report_timings, timings, output_path)
+        # Без сегментов кадры кодируются пачкой после захвата — фаза encode выше ≈ 0, меряем экспорт целиком
+        export_started = time.perf_counter()
+        final_path = await asyncio.to_thread(self._export_frames_to_video, frames, output_path)
+        logger.info("⏱️ Экспорт %s кадров: %.2f с", len(frames), time.perf_counter() - export_started)
+        return final_path
+
+    def _capture_to_ring(self, output_path: str, timings: CaptureTimings) -> str:
+        """Захват в кольцо кадров: ffmpeg в отдельном процессе кодирует параллельно со скриншотами."""
+        Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+        ring = FrameRingEncoder(self._final_encoder_command(output_path), self._ring_shape(), self.frame_ring_slots)
+        try:
+            self._capture_animation_frames_precise(None, 0, None, timings=timings, ring=ring)
+            ring.close()
+        finally:
+            ring.abort()
+        self._report_timings(timings, output_path)
+        logger.info("🧵 Кадров через кольцо: %s", ring.frames_written)
+        return output_path
+
+    @staticmethod
+    def _variant_output_path(output_path: str, name: str, size: tuple, base_size: tuple) -> str:
+        """Основной формат пишется в output_path, остальные — рядом с суффиксом _WxH."""
+        if size == base_size:
+            return output_path
+        p = Path(output_path)
+        return str(p.with_name(f"{p.stem}_{name}{p.suffix}"))
+
+    async def compose(
+        self,
+        short_text: Union[str, dict],
+        media_path: Union[str, list, None],
+        output_path: str,
+        source_text: str,
+        viewports=None,
+    ) -> Union[str, Dict[str, str]]:
+        """
+        Рендер ролика. viewports — опционально список форматов (см. parse_viewports):
+        HTML, медиа, smart_crop и браузер готовятся один раз, для каждого формата меняется
+        только вьюпорт и повторяется захват. С viewports возвращается {"WxH": путь}.
+        """
         logger.info("🎬 Запуск генерации видео V2 (HTML+Selenium)...")
         
-        # Инициализируем браузер только когда он действительно нужен
-        self._setup_selenium()
-        
         if isinstance(short_text, dict):
             title = short_text.get('title', 'Новость')
             summary = short_text.get('brief', title)
@@ -693,61 +1303,133 @@ if (carouselVid) {
             'source_text': source_text,
         }
 
-        self.template_path = self._pick_template_path()
-        temp_html_path = self._create_html_from_template(video_data)
-        
+        async with LoopLagProbe("V2 compose"):
+            return await self._compose(video_data, media_path, output_path, viewports)
+
+    def _open_job(self, media_files: List[str]):
+        return self.artifacts.open_job(media_files, {'renderer': 'v2', 'duration': self.duration})
+
+    def _prepare(self, media_path) -> None:
+        """
+        Всё, что не зависит от текста: обрезка/копирование медиа и smart_crop — в кэш задачи
+        (_create_html_from_template потом берёт их оттуда), запуск Chrome — заранее.
+        """
+        media_files = media_list(media_path)
+        # Те же файлы, что возьмёт _create_html_from_template: до 8 слайдов известных типов
+        known = [p for p in media_files if Path(p).suffix.lower() in MEDIA_EXTS][:8]
+        job = self._open_job(media_files) if known else None
+        if job is not None:
+            for p in known:
+                self._preprocess_media(p, job)
+            try:
+                self._media_layout(known[0], job)
+            except Exception as e:
+                logger.warning("⚠️ smart_crop пропущен: %s", e)
+        # Сегментный рендер запускает свои браузеры; общий Chrome нужен только при захвате одним проходом
+        if not self._segment_plan():
+            with self._driver_lock:
+                # Уже запущенный Chrome может быть занят захватом — его не трогаем
+                if self.driver is None:
+                    self._setup_selenium_locked()
+
+    async def prepare(self, media_path) -> None:
+        """Подготовка задачи параллельно с запросом к LLM (см. _prepare)."""
+        await asyncio.to_thread(self._prepare, media_path)
+
+    def _plan_outputs(self, video_data: dict, output_path: str, viewports) -> tuple:
+        """
+        Синхронная подготовка (в потоке): задача артефактов, шаблон/тема/музыка и поиск в кэше рендера.
+        Возвращает (targets, pending, results): pending — что ещё надо рендерить.
+        """
+        title, summary = video_data['title'], video_data['summary']
+        source_text = video_data['source_text']
+        # Ключ задачи — медиа и параметры рендера, но не текст: правка текста переиспользует подготовку
+        media_files = media_list(video_data['media_path'])
+        self._job = self._open_job(media_files)
+        # Всё «случайное» (шаблон, тема, музыка) выбирается от содержимого поста — повтор даёт тот же ролик.
+        # В задаче артефактов не хранится: она общая для всех текстов с этим медиа
+        seed = make_key(title=title, summary=summary, source=source_text, media_paths=media_files)
+        self.template_path = self._pick_template_path(seed)
+        video_data['theme'] = self._pick_theme(seed)
+        self._music = self._pick_music(seed)
+
+        base_size = (self.width, self.height)
+        if viewports is None:
+            targets = [(None, self.width, self.height, output_path)]
+        else:
+            targets = [
+                (name, w, h, self._variant_output_path(output_path, name, (w, h), base_size))
+                for name, w, h in parse_viewports(viewports)
+            ]
+        cache_parts = {
+            'renderer': 'v2',
+            'template': self.template_path,
+            'template_digest': file_digest(self.template_path),
+            'theme': video_data['theme'],
+            'title': title,
+            'summary': summary,
+            'source': source_text,
+            'media_paths': media_files,
+            'duration': self.duration,
+            'fps': self.fps,
+            'music': file_digest(self._music),
+        }
+        results: Dict[str, str] = {}
+        pending = []
+        for name, w, h, path in targets:
+            key = make_key(**cache_parts, size=[w, h])
+            hit = self.render_cache.lookup(key, path)
+            if hit:
+                results[name or f"{w}x{h}"] = hit
+            else:
+                pending.append((name, w, h, path, key))
+        return targets, pending, results
+
+    def _cleanup_render(self) -> None:
+        self._job = None
+        self._music = None
+        # HTML на диске появляется только при запасной доставке файлом
+        for item in Path(self.temp_dir).glob('temp_short_*.html'):
+            item.unlink(missing_ok=True)
+        # Очистка временных медиа файлов
+        for item in Path(self.temp_dir).glob('media_*'):
+            item.unlink()
+
+    async def _compose(self, video_data: dict, media_path, output_path: str, viewports) -> Union[str, Dict[str, str]]:
         try:
-            # Диагностическое логирование для проверки URI
-            html_uri = Path(os.path.abspath(temp_html_path)).as_uri()
-            logger.info(f"🌐 Загружаем HTML в Selenium: {html_uri}")
-            self.driver.get(html_uri)
-            
-            logger.info("Ожидаем загрузки и отображения медиа в браузере...")
-            wait = WebDriverWait(self.driver, 15)  # Ждем до 15 секунд
+            targets, pending, results = await asyncio.to_thread(
+                self._plan_outputs, video_data, output_path, viewports
+            )
+            if not pending:
+                logger.info("✅ Видео V2 взято из кэша рендера")
+                return results if viewports is not None else next(iter(results.values()))
 
-            media_loaded_successfully = False
-            mp = video_data.get('media_path')
-            if isinstance(mp, (list, tuple)) and len(mp) >= 2:
-                try:
-                    wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, '#mediaCarousel .carousel-slide')))
-                    logger.info("✅ Карусель медиа готова")
-                    media_loaded_successfully = True
-                except Exception:
-                    logger.warning("⚠️ Карусель не появилась за 15 секунд.")
-            elif mp:
-                first = mp[0] if isinstance(mp, (list, tuple)) else mp
-                ext = Path(str(first)).suffix.lower()
-                element_id = None
-                if ext in ['.mp4', '.webm', '.mov']:
-                    element_id = "mediaVideo"
-                elif ext in ['.jpg', '.jpeg', '.png', '.webp']:
-                    element_id = "mediaImage"
-
-                if element_id:
-                    try:
-                        wait.until(EC.visibility_of_element_located((By.ID, element_id)))
-                        logger.info(f"✅ Медиа-элемент '{element_id}' стал видимым.")
-                        media_loaded_successfully = True
-                    except Exception:
-                        logger.warning(f"⚠️ Элемент '{element_id}' не стал видимым за 15 секунд.")
-            
-            if not media_loaded_successfully:
-                logger.warning("Не удалось дождаться медиа. Захват может быть некорректным.")
-            
-            # Убираем все ожидания, так как виртуальное время само все синхронизирует.
-            # logger.info("⏳ Ожидание загрузки GSAP и выполнения анимаций...")
-            # await asyncio.sleep(3) 
+            # ffmpeg-обрезка медиа и smart_crop (Haar) внутри — только в потоке
+            html = await asyncio.to_thread(self._create_html_from_template, video_data)
 
-            frames = await asyncio.to_thread(self._capture_animation_frames_precise)
-            final_path = await asyncio.to_thread(self._export_frames_to_video, frames, output_path)
-            
-            logger.info(f"✅ Видео V2 создано: {final_path}")
-            return final_path
+            base_size = (self.width, self.height)
+            try:
+                for name, width, height, variant_path, key in pending:
+                    self.width, self.height = width, height
+                    if name:
+                        logger.info(f"📐 Формат {name}: {variant_path}")
+                    final_path, side_files = await self._render_variant(html, media_path, variant_path)
+                    await asyncio.to_thread(self.render_cache.store, key, final_path, side_files)
+                    results[name or f"{width}x{height}"] = final_path
+            finally:
+                self.width, self.height = base_size
+                if viewports is not None and self.driver:
+                    await asyncio.to_thread(self._apply_viewport, self.driver)
+
+            if viewports is None:
+                final_path = next(iter(results.values()))
+                logger.info(f"✅ Видео V2 создано: {final_path}")
+                return final_path
+            results = {n: results[n] for n in (name or f"{w}x{h}" for name, w, h, _ in targets)}
+            logger.info(f"✅ Видео V2 создано в {len(results)} форматах: {', '.join(results)}")
+            return results
         finally:
-            os.remove(temp_html_path)
-            # Очистка временных медиа файлов
-            for item in Path(self.temp_dir).glob('media_*'):
-                item.unlink()
+            await asyncio.to_thread(self._cleanup_render)
     
     def close(self):
         """Закрывает браузер только если он еще активен"""
@@ -1,9 +1,12 @@
 from __future__ import annotations
 
+import asyncio
 import json
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List
+from typing import Callable, List, Optional
 
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaFileUpload
@@ -14,17 +17,37 @@ import os
 import pickle
 import ssl
 import socket
+import time
 
 logger = logging.getLogger("youtube")
 
 SCOPES = ["https://www.googleapis.com/auth/youtube.upload"]
+# Resumable upload принимает куски, кратные 256 КБ
+_CHUNK_GRANULARITY = 256 * 1024
+
+# Прогресс загрузки: (отправлено байт, всего байт)
+ProgressCallback = Callable[[int, int], None]
+
+
+class UploadCancelled(Exception):
+    """Загрузка остановлена по запросу (отмена задачи или остановка сервиса)."""
 
 
 class YouTubeUploader:
     def __init__(self, config: dict):
         self.config = config
-        self.client_secret_file = config['YOUTUBE']['client_secret_file']
+        section = config['YOUTUBE']
+        self.client_secret_file = section['client_secret_file']
         self.token_path = Path('token.json')
+        chunk_mb = float(section.get('upload_chunk_mb', 8) or 8)
+        self.chunk_size = max(1, int(chunk_mb * 1024 * 1024) // _CHUNK_GRANULARITY) * _CHUNK_GRANULARITY
+        self.progress_step = max(1, int(section.get('upload_progress_step', 10) or 10))
+        # Загрузки идут в своих потоках: next_chunk и паузы между попытками не держат event loop
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, int(section.get('upload_workers', 2) or 2)),
+            thread_name_prefix="youtube-upload",
+        )
+        self._creds = None
         self.service = self._get_service()
 
     def _get_service(self):
@@ -55,6 +78,7 @@ class YouTubeUploader:
                 creds = flow.run_local_server(port=0, open_browser=False)
             with open(self.token_path, 'wb') as token:
                 pickle.dump(creds, token)
+        self._creds = creds
         # Создаем YouTube service с улучшенными настройками для надежности
         try:
             service = build('youtube', 'v3', credentials=creds)
@@ -73,6 +97,20 @@ class YouTubeUploader:
             logger.info("✅ YouTube API service создан с custom HTTP client")
             return service
 
+    def _upload_http(self):
+        """
+        Отдельный авторизованный HTTP-клиент на загрузку: httplib2.Http не потокобезопасен,
+        а параллельные загрузки идут из разных потоков. None — общий клиент service.
+        """
+        if self._creds is None:
+            return None
+        try:
+            import google_auth_httplib2
+            import httplib2
+        except ImportError:
+            return None
+        return google_auth_httplib2.AuthorizedHttp(self._creds, http=httplib2.Http(timeout=120))
+
     def upload_video(
         self,
         video_file: str,
@@ -80,8 +118,14 @@ class YouTubeUploader:
         description: str,
         tags: List[str] | None,
         category_id: str = '25',
-        privacy_status: str = 'public'
+        privacy_status: str = 'public',
+        on_progress: Optional[ProgressCallback] = None,
+        cancel_event: Optional[threading.Event] = None,
     ) -> dict:
+        """
+        Resumable-загрузка кусками по upload_chunk_mb. on_progress(отправлено, всего) вызывается
+        после каждого куска; cancel_event проверяется между кусками и прерывает паузу перед повтором.
+        """
         body = {
             'snippet': {
                 'title': title,
@@ -94,21 +138,33 @@ class YouTubeUploader:
             }
         }
         # Используем chunked upload для больших файлов и надежности
-        media = MediaFileUpload(video_file, chunksize=1024*1024, resumable=True)  # 1MB chunks
+        media = MediaFileUpload(video_file, chunksize=self.chunk_size, resumable=True)
         request = self.service.videos().insert(
             part=','.join(body.keys()),
             body=body,
             media_body=media
         )
+        http = self._upload_http()
+        total = media.size() or 0
         response = None
         error_count = 0
         max_retries = 3
+        next_log = self.progress_step
         
         while response is None:
+            if cancel_event is not None and cancel_event.is_set():
+                logger.warning("🛑 Загрузка на YouTube отменена: %s", video_file)
+                raise UploadCancelled(video_file)
             try:
-                status, response = request.next_chunk()
-                if status:
-                    logger.info(f"📤 Загружено {int(status.progress() * 100)}%")
+                status, response = request.next_chunk(http=http)
+                sent = total if response is not None else (status.resumable_progress if status else 0)
+                if on_progress is not None:
+                    on_progress(sent, total)
+                percent = int(sent * 100 / total) if total else 100
+                # С on_progress прогресс показывает вызывающий — без дублирования в логе
+                if on_progress is None and status and percent >= next_log:
+                    logger.info(f"📤 Загружено {percent}%")
+                    next_log = (percent // self.progress_step + 1) * self.progress_step
             except Exception as e:
                 error_count += 1
                 logger.warning(f"⚠️ Ошибка загрузки (попытка {error_count}/{max_retries}): {e}")
@@ -117,12 +173,60 @@ class YouTubeUploader:
                     logger.error(f"❌ Превышено максимальное количество попыток загрузки")
                     raise
                 
-                # Ждем перед повторной попыткой
-                import time
+                # Ждем перед повторной попыткой (отмена прерывает ожидание)
                 wait_time = 2 ** error_count  # exponential backoff
                 logger.info(f"⏳ Ожидание {wait_time} секунд перед повторной попыткой...")
-                time.sleep(wait_time)
+                if cancel_event is not None:
+                    cancel_event.wait(wait_time)
+                else:
+                    time.sleep(wait_time)
                 
         logger.info("YouTube upload response: %s", response)
         return response
 
+    async def upload_video_async(
+        self,
+        video_file: str,
+        title: str,
+        description: str,
+        tags: List[str] | None,
+        category_id: str = '25',
+        privacy_status: str = 'public',
+        on_progress: Optional[ProgressCallback] = None,
+    ) -> dict:
+        """
+        upload_video в потоке загрузчика; event loop (Telethon, рендер) свободен всё время загрузки.
+        on_progress вызывается в потоке event loop. Отмена корутины (asyncio.CancelledError,
+        таймаут wait_for) останавливает загрузку на границе куска и дожидается потока: текущий
+        кусок досылается. Если им был последний, ролик уже на YouTube — возвращается ответ,
+        а не отмена, иначе повтор загрузил бы его второй раз.
+        """
+        loop = asyncio.get_running_loop()
+        cancel_event = threading.Event()
+
+        def progress(sent: int, total: int) -> None:
+            if on_progress is not None:
+                loop.call_soon_threadsafe(on_progress, sent, total)
+
+        future = loop.run_in_executor(
+            self._executor,
+            lambda: self.upload_video(
+                video_file, title, description, tags, category_id, privacy_status,
+                on_progress=progress, cancel_event=cancel_event,
+            ),
+        )
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError as cancelled:
+            cancel_event.set()
+            # Поток завершит текущий кусок и выйдет по UploadCancelled — не оставляем его висеть
+            try:
+                response = await future
+            except Exception:
+                raise cancelled
+            logger.warning("⚠️ Отмена пришла после последнего куска — ролик загружен: %s", video_file)
+            return response
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+